@@ -0,0 +1,41 @@
+"""agent checkpoints
+
+Revision ID: 7c1f4b9e2d3a
+Revises: 563ed8c2a9aa
+Create Date: 2026-10-18 10:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1f4b9e2d3a'
+down_revision: Union[str, Sequence[str], None] = '563ed8c2a9aa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('agent_checkpoints',
+    sa.Column('id', sa.UUID(), server_default=sa.text('uuid_generate_v4()'), nullable=False),
+    sa.Column('session_id', sa.String(length=255), nullable=False),
+    sa.Column('agent_name', sa.String(length=255), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('message_offset', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('messages', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'[]'::jsonb"), nullable=False),
+    sa.Column('plan', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP(0)'), nullable=False),
+    sa.PrimaryKeyConstraint('id', name='pk_agent_checkpoints_id')
+    )
+    op.create_index('idx_agent_checkpoints_session_agent_seq', 'agent_checkpoints', ['session_id', 'agent_name', 'seq'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_agent_checkpoints_session_agent_seq', table_name='agent_checkpoints')
+    op.drop_table('agent_checkpoints')
@@ -7,6 +7,7 @@ from app.domain.models.app_config import LLMConfig, AppConfig, AgentConfig, McpC
 from app.domain.repositories.app_config_repository import AppConfigRepository
 from app.domain.services.tools.a2a import A2AClientManager
 from app.domain.services.tools.mcp import McpClientManager
+from app.domain.services.tools.mcp_pool import get_mcp_session_pool
 from app.interfaces.schemas.app_config import ListMcpServerItem, ListA2AServerResponse, ListA2AServerItem
 
 
@@ -60,7 +61,7 @@ class AppConfigService:
         # 获取当前的应用配置
         app_config = await self._load_app_config()
 
-        # 创建MCP客户端管理器 对配置信息部进行过滤
+        # 创建MCP客户端管理器 对配置信息部进行过滤 连接从进程级别的会话池中复用
         mcp_servers = []
         mcp_client_manager = McpClientManager(
             mcp_config=app_config.mcp_config,
@@ -94,8 +95,9 @@ class AppConfigService:
         # 使用新的mcp_config更新原始的配置
         app_config.mcp_config.mcpServers.update(mcp_config.mcpServers)
 
-        # 调用数据仓库完成存储或更新
+        # 调用数据仓库完成存储或更新 并热更新MCP会话池
         self.app_config_repository.save(app_config)
+        await get_mcp_session_pool().sync(app_config.mcp_config)
         return app_config.mcp_config
 
     async def delete_mcp_server(self, server_name: str) -> McpConfig:
@@ -109,6 +111,7 @@ class AppConfigService:
         # 如果存在就删除字典中对应的服务
         del app_config.mcp_config.mcpServers[server_name]
         self.app_config_repository.save(app_config)
+        await get_mcp_session_pool().sync(app_config.mcp_config)
         return app_config.mcp_config
 
     async def set_mcp_server_enabled(self, server_name: str, enabled: bool) -> McpConfig:
@@ -122,6 +125,7 @@ class AppConfigService:
         # # 如果存在更新该MCP服务的状态
         app_config.mcp_config.mcpServers[server_name].enabled = enabled
         self.app_config_repository.save(app_config)
+        await get_mcp_session_pool().sync(app_config.mcp_config)
         return app_config.mcp_config
 
     async def create_a2a_server(self, base_url: str) -> A2AConfig:
@@ -0,0 +1,13 @@
+from typing import Protocol
+
+
+class BlobStore(Protocol):
+    """大对象存储协议 用于存放体积较大的工具结果，记忆中只保留可检索的句柄"""
+
+    async def put(self, key: str, content: str) -> str:
+        """根据传递的键存储文本内容 返回后续用于读取内容的句柄"""
+        ...
+
+    async def get(self, handle: str) -> str:
+        """根据put返回的句柄读取完整的文本内容"""
+        ...
@@ -1,9 +1,35 @@
 from typing import Protocol, Optional, Any, Union, Dict, List
 
 
+class IncrementalJsonParser(Protocol):
+    """增量json解析器 逐段接收流式生成的json对象文本，并尽早返回已经生成完整的顶层字段"""
+
+    def feed(self, delta: str) -> Dict[str, Any]:
+        """传递新生成的文本片段 返回本次新完成的顶层字段(字段名 -> 解析后的值)"""
+        ...
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        """返回已经完成解析的顶层字段"""
+        ...
+
+    @property
+    def done(self) -> bool:
+        """返回顶层json对象是否已经完整结束"""
+        ...
+
+    async def close(self) -> Union[Dict, List, Any]:
+        """文本生成结束 返回完整的解析结果，增量解析失败时会回退为整体解析"""
+        ...
+
+
 class JsonParser(Protocol):
     """json解析器 用来解析json字符串并修复"""
 
     async def invoke(self, text: str, default_value: Optional[Any] = None) -> Union[Dict, List, Any]:
         """调用函数 用于将传递进来的文本进行解析"""
         ...
+
+    def incremental(self) -> IncrementalJsonParser:
+        """创建一个增量json解析器 用于解析流式生成的json文本"""
+        ...
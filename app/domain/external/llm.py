@@ -1,4 +1,30 @@
-from typing import Protocol, List, Dict, Any
+from typing import Protocol, List, Dict, Any, AsyncGenerator, Optional
+
+
+class LLMError(RuntimeError):
+    """LLM调用错误基类 LLM的实现类需要将底层异常转换为以下具体的错误类型，retryable表示是否值得重试"""
+    retryable: bool = True
+
+    def __init__(self, message: str = "", retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after  # 服务端建议的重试等待秒数(Retry-After)
+
+
+class LLMRateLimitError(LLMError):
+    """触发了服务端限流(429)"""
+
+
+class LLMTimeoutError(LLMError):
+    """请求超时或者网络连接失败"""
+
+
+class LLMServerError(LLMError):
+    """服务端内部错误(5xx)"""
+
+
+class LLMInvalidRequestError(LLMError):
+    """请求本身有误(400/401/403/404/422等) 重试不会成功"""
+    retryable = False
 
 
 class LLM(Protocol):
@@ -8,21 +34,42 @@ class LLM(Protocol):
                      message: List[Dict[str, Any]],
                      tools: List[Dict[str, Any]] = None,
                      response_format: Dict[str, Any] = None,
-                     tool_choice: str = None
+                     tool_choice: str = None,
+                     parallel_tool_calls: bool = False,
                      ) -> Dict[str, Any]:
-        """传递消息列表、工具列表，响应格式和工具选择，调用语言模型并返回响应结果"""
-
-        @property
-        def model_name(self) -> str:
-            """返回所使用的语言模型名称"""
-            ...
-
-        @property
-        def temperature(self) -> float:
-            """返回当前语言模型的温度设置"""
-            ...
-
-        @property
-        def max_tokens(self) -> int:
-            """返回当前语言模型的最大令牌数设置"""
-            ...
+        """
+        传递消息列表、工具列表，响应格式、工具选择和是否允许并行工具调用，调用语言模型并返回响应结果
+        如果服务返回了用量信息，结果中会额外携带usage字段(prompt_tokens/completion_tokens/缓存命中token数等)
+        """
+        ...
+
+    def invoke_stream(self,
+                      message: List[Dict[str, Any]],
+                      tools: List[Dict[str, Any]] = None,
+                      response_format: Dict[str, Any] = None,
+                      tool_choice: str = None,
+                      parallel_tool_calls: bool = False,
+                      ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        参数同invoke，以流式的方式调用语言模型，迭代返回的每个片段都是一个字典：
+        - {"type": "content", "content": "..."} 表示新生成的文本增量
+        - {"type": "tool_call", "index": 0, "id": "...", "name": "...", "arguments_delta": "..."}
+          表示第index个工具调用新生成的参数增量，id/name为截至目前拼接的结果
+        - {"type": "message", "message": {...}} 表示生成结束，message为完整组装后的消息，结构和invoke的返回值一致
+        """
+        ...
+
+    @property
+    def model_name(self) -> str:
+        """返回所使用的语言模型名称"""
+        ...
+
+    @property
+    def temperature(self) -> float:
+        """返回当前语言模型的温度设置"""
+        ...
+
+    @property
+    def max_tokens(self) -> int:
+        """返回当前语言模型的最大令牌数设置"""
+        ...
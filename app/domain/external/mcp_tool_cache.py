@@ -0,0 +1,13 @@
+from typing import Protocol, Optional, List, Dict, Any
+
+
+class McpToolCache(Protocol):
+    """MCP工具声明缓存协议 按照服务名字+连接配置指纹持久化工具列表，启动时无需等待握手即可使用"""
+
+    async def get(self, server_name: str, fingerprint: str) -> Optional[List[Dict[str, Any]]]:
+        """根据服务名字+连接配置指纹获取缓存的工具声明列表 不存在时返回None"""
+        ...
+
+    async def set(self, server_name: str, fingerprint: str, tools: List[Dict[str, Any]]) -> None:
+        """写入服务的工具声明列表 同一个服务旧指纹的缓存可以被替换"""
+        ...
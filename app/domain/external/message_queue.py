@@ -1,4 +1,4 @@
-from typing import Protocol, Any, Tuple
+from typing import Protocol, Any, Tuple, List
 
 
 class MessageQueue(Protocol):
@@ -8,6 +8,10 @@ class MessageQueue(Protocol):
         """将消息放入队列"""
         ...
 
+    async def put_batch(self, messages: List[Any]) -> List[str]:
+        """将一批消息按顺序放入队列 只产生一次网络往返，返回消息ID列表"""
+        ...
+
     async def get(self, start_id: str = None, block_ms: int = None) -> Tuple[str, Any]:
         """根据传递的其实ID+阻塞时间获取一条数据"""
         ...
@@ -12,13 +12,29 @@ class LLMConfig(BaseModel):
     model_name: str = "deepseek-reasoner"  # 推理模型如果传递了tools的话会自动切换到deepseek-chat
     temperature: float = Field(default=0.7)
     max_tokens: int = Field(default=8192, ge=0)  # 最大输出的token数
+    requests_per_minute: Optional[int] = Field(default=None, gt=0)  # 每分钟最大请求数 为空表示不限制
+    tokens_per_minute: Optional[int] = Field(default=None, gt=0)  # 每分钟最大token数 为空表示不限制
+    max_concurrency: int = Field(default=8, ge=1)  # 同一模型同时进行中的最大请求数
 
 
 class AgentConfig(BaseModel):
     """Agent通用配置"""
     max_iterations: int = Field(default=100, gt=0, lt=1000)  # 最大迭代次数
     max_retries: int = Field(default=3, gt=1, lt=10)  # 最大重试次数
+    retry_base_delay: float = Field(default=0.5, gt=0)  # 重试退避的基础间隔(秒)
+    retry_max_delay: float = Field(default=20.0, gt=0)  # 重试退避的最大间隔(秒)
+    retry_budget: int = Field(default=30, ge=0)  # 单个会话内所有Agent共享的重试次数预算
     max_search_results: int = Field(default=10, gt=1, lt=30)  # 最大搜索结果数
+    parallel_tool_calls: bool = False  # 是否并发执行同一轮中相互独立的工具调用
+    max_tool_concurrency: int = Field(default=4, ge=1, le=32)  # 并发执行工具时的最大并发数
+    stream: bool = False  # 是否流式调用语言模型并实时返回增量消息
+    max_context_tokens: Optional[int] = Field(default=None, gt=0)  # 上下文token预算 为空时根据模型自动推断
+    summary_threshold_tokens: Optional[int] = Field(default=None, gt=0)  # 触发记忆摘要的token阈值 为空时取上下文预算的一半
+    stable_prefix: bool = False  # 是否保持请求前缀字节稳定以命中LLM服务端的提示词前缀缓存
+    max_parallel_steps: int = Field(default=3, ge=1, le=16)  # 计划中相互独立的步骤最多同时执行的数量
+    skip_unneeded_replan: bool = False  # 步骤顺利完成时跳过规划Agent的LLM调用 直接沿用原计划
+    speculative: bool = False  # 是否在等待期间提前发起可能的下一次LLM请求(推测执行)
+    profile: bool = False  # 是否在步骤执行结束时返回运行剖析事件(ProfileEvent)
 
 
 class McpTransport(Enum):
@@ -44,6 +60,15 @@ class McpServerConfig(BaseModel):
     url: Optional[str] = None  # MCP服务的URL地址
     headers: Optional[Dict[str, Any]] = None  # headers请求头
 
+    # 连接配置
+    connect_timeout: Optional[float] = Field(default=None, gt=0)  # 建立连接+握手+获取工具列表的超时秒数 不配置时使用默认值
+
+    # 调用调度配置 修改后不需要重新连接
+    max_concurrency: Optional[int] = Field(default=None, gt=0)  # 同时执行的工具调用数上限 超过后排队 不配置时不限制
+    call_timeout: Optional[float] = Field(default=None, gt=0)  # 单次工具调用(含排队)的超时秒数 不配置时不限制
+    tool_timeouts: Dict[str, float] = Field(default_factory=dict)  # 按照工具名单独配置的超时秒数
+    pool_size: int = Field(default=1, ge=1)  # 为该服务建立的会话数 单个会话不能很好地并发处理请求时调大
+
     model_config = ConfigDict(extra="allow")
 
     @model_validator(mode="after")
@@ -0,0 +1,19 @@
+import datetime
+import uuid
+from typing import List, Dict, Any, Optional
+
+from pydantic import BaseModel, Field
+
+from app.domain.models.plan import Plan
+
+
+class Checkpoint(BaseModel):
+    """Agent检查点 记录某个会话中某个Agent的一次增量状态"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))  # 检查点ID
+    session_id: str  # 会话ID
+    agent_name: str  # Agent名称 同一个会话中的多个Agent分别记录
+    seq: int = 0  # 检查点序号 同一个会话+Agent内递增
+    message_offset: int = 0  # 增量消息的起始位置 恢复时先将记忆截断到该位置再追加messages
+    messages: List[Dict[str, Any]] = Field(default_factory=list)  # 增量消息列表
+    plan: Optional[Plan] = None  # 检查点时刻的计划(包含步骤状态)
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)  # 创建时间
@@ -1,9 +1,9 @@
 import datetime
 import uuid
 from enum import Enum
-from typing import Literal, List, Any, Union, Optional, Dict
+from typing import Literal, List, Any, Union, Optional, Dict, Annotated
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 
 from app.domain.models.file import File
 from app.domain.models.plan import Plan, Step
@@ -34,7 +34,7 @@ class BaseEvent(BaseModel):
     """基础事件类型"""
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     type: Literal[""] = ""
-    created_at := datetime = Field(default_factory=datetime.datetime.now)  # 事件创建时间
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)  # 事件创建时间
 
 
 class PlanEvent(BaseEvent):
@@ -62,6 +62,7 @@ class MessageEvent(BaseEvent):
     type: Literal["message"] = "message"
     role: Literal["user", "assistant"] = "assistant"  # 消息角色
     message: str = ""  # 消息本身
+    partial: bool = False  # 是否为流式输出的增量片段 增量片段只用于展示 不代表Agent的最终回复
     # todo 附件文件信息完善
     attachments : List[File] = Field(default_factory=list)  # 附件列表信息
 
@@ -89,8 +90,9 @@ class ToolEvent(BaseEvent):
     tool_content: Optional[ToolContent] = None  # 工具扩展内容
     function_name: str = ""  # LLM调用的函数名称
     function_args: Dict[str, Any] = {}  # LLM生成的工具调用参数
-    function_result: Optional[ToolResult]  # 工具调用结果
+    function_result: Optional[ToolResult] = None  # 工具调用结果
     status: ToolEventStatus = ToolEventStatus.CALLING  # 工具调用状态
+    partial: bool = False  # 工具参数是否仍在生成 为True时function_args只包含已经生成完整的顶层字段
 
 
 class WaitEvent(BaseEvent):
@@ -104,6 +106,20 @@ class ErrorEvent(BaseEvent):
     error: str = ""  # 错误信息
 
 
+class ProfileEvent(BaseEvent):
+    """运行剖析事件 包含一次Agent运行中每次迭代的耗时分解(毫秒)和token数"""
+    type: Literal["profile"] = "profile"
+    name: str = ""  # Agent名称
+    step_id: str = ""  # 对应的步骤ID
+    trace_id: str = ""  # 追踪ID 和导出的OpenTelemetry trace关联
+    duration_ms: float = 0  # 运行总耗时
+    prompt_tokens: int = 0  # 输入token数
+    completion_tokens: int = 0  # 输出token数
+    totals: Dict[str, float] = Field(default_factory=dict)  # 各个阶段的耗时汇总 llm/json_parse/tool_dispatch/tools
+    iterations: List[Dict[str, Any]] = Field(default_factory=list)  # 每次迭代的耗时分解
+    speculation: Optional[Dict[str, Any]] = None  # 推测执行的命中统计 未开启推测执行时为None
+
+
 class DoneEvent(BaseEvent):
     """结束事件类型"""
     type: Literal["done"] = "done"
@@ -119,4 +135,18 @@ Event = Union[
     ErrorEvent,
     DoneEvent,
     PlanEvent,
+    ProfileEvent,
 ]
+
+# 按照type字段区分事件类型的适配器 序列化/反序列化时直接定位到具体的事件类 不需要逐个尝试联合类型的成员
+EventAdapter: TypeAdapter[Event] = TypeAdapter(Annotated[Event, Field(discriminator="type")])
+
+
+def dumps_event(event: Event) -> str:
+    """将事件紧凑序列化为json字符串 值为None的字段不输出"""
+    return EventAdapter.dump_json(event, exclude_none=True).decode("utf-8")
+
+
+def loads_event(data: Union[str, bytes]) -> Event:
+    """将dumps_event序列化的json字符串还原为事件"""
+    return EventAdapter.validate_json(data)
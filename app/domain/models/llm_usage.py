@@ -0,0 +1,38 @@
+from typing import Dict, Any, Optional
+
+from pydantic import BaseModel
+
+
+class PromptCacheMetrics(BaseModel):
+    """提示词前缀缓存统计 根据LLM响应中的usage字段累计缓存命中情况"""
+    calls: int = 0  # 统计到usage的调用次数
+    prompt_tokens: int = 0  # 累计输入token数
+    completion_tokens: int = 0  # 累计输出token数
+    cached_tokens: int = 0  # 累计命中前缀缓存的输入token数
+
+    @classmethod
+    def get_cached_tokens(cls, usage: Dict[str, Any]) -> int:
+        """从usage中提取命中缓存的token数，兼容DeepSeek(prompt_cache_hit_tokens)与OpenAI(prompt_tokens_details.cached_tokens)"""
+        if usage.get("prompt_cache_hit_tokens") is not None:
+            return usage["prompt_cache_hit_tokens"] or 0
+        details = usage.get("prompt_tokens_details") or {}
+        return details.get("cached_tokens") or 0
+
+    def record(self, usage: Optional[Dict[str, Any]]) -> None:
+        """记录一次LLM调用的usage信息"""
+        if not usage:
+            return
+
+        self.calls += 1
+        self.completion_tokens += usage.get("completion_tokens") or 0
+        # DeepSeek的prompt_tokens = 命中 + 未命中 部分兼容接口可能缺少prompt_tokens
+        prompt_tokens = usage.get("prompt_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = (usage.get("prompt_cache_hit_tokens") or 0) + (usage.get("prompt_cache_miss_tokens") or 0)
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += self.get_cached_tokens(usage)
+
+    @property
+    def hit_rate(self) -> float:
+        """只读属性 返回输入token的缓存命中率"""
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
@@ -1,28 +1,146 @@
+"""
+记忆的追加日志设计思路：
+1. 每条消息在写入(追加/修改)时都会分配一个单调递增的序号，记忆的序号(seq)即最近一次写入的序号
+2. 追加之外的修改(修改内容/删除/替换/截断)都会在变更日志中记录(序号, 位置)
+3. 导出自某个序号之后的增量时，增量的起始位置 = min(末尾新追加消息的起始位置, 变更日志中该序号之后的最小位置)
+   - 末尾新追加的消息从后往前扫描，变更日志同样从后往前扫描，代价只和新增的消息/变更数量相关，与历史长度无关
+4. 增量 = (起始位置, 起始位置之后的消息, 当前序号)，接收方截断到起始位置后追加即可还原
+5. 记忆和增量都支持紧凑的二进制序列化：json(安装了orjson时使用orjson) + zlib压缩
+6. 变更日志不会无限增长：增量的接收方(例如检查点)同步到某个序号后调用prune_changes丢弃该序号之前的记录，
+   没有接收方时只保留最近MAX_CHANGES条记录，请求的序号早于已丢弃的记录时导出完整快照(起始位置为0)
+"""
+import json
 import logging
-from typing import List, Dict, Any, Optional
+import zlib
+from typing import List, Dict, Any, Optional, Tuple
 
 from openai import BaseModel
-from pydantic import Field
+from pydantic import Field, PrivateAttr
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson为可选依赖
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# 变更日志最多保留的记录数 超过后丢弃较早的一半
+MAX_CHANGES = 1024
+
+# 执行完成后可以被压缩的工具(搜索/网页源码获取/浏览器访问结果等)，结果体积大且过期后对后续推理帮助不大
+COMPACTABLE_FUNCTIONS = {
+    "browser_view",
+    "browser_navigate",
+    "browser_restart",
+    "browser_console_view",
+    "search_web",
+    "read_file",
+    "shell_read_output",
+}
+
+
+def dumps_compact(data: Any) -> bytes:
+    """将数据序列化为紧凑的二进制格式 json + zlib压缩"""
+    if orjson is not None:
+        raw = orjson.dumps(data)
+    else:
+        raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw)
+
+
+def loads_compact(data: bytes) -> Any:
+    """反序列化dumps_compact生成的二进制数据"""
+    raw = zlib.decompress(data)
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def estimate_text_tokens(text: str) -> int:
+    """粗略估算一段文本的token数，英文约0.3token/字符，中文等非ASCII字符约0.6token/字符"""
+    if not text:
+        return 0
+    # 利用utf-8编码长度计算非ASCII字符数量 避免逐字符遍历长文本
+    char_count = len(text)
+    non_ascii_count = (len(text.encode("utf-8")) - char_count) // 2
+    return int((char_count - non_ascii_count) * 0.3 + non_ascii_count * 0.6) + 1
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    """估算单条消息的token数，包含消息内容、工具调用以及每条消息的固定开销"""
+    tokens = 4  # 每条消息的角色等固定开销
+    content = message.get("content")
+    if content:
+        tokens += estimate_text_tokens(content if isinstance(content, str) else json.dumps(content, ensure_ascii=False))
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function") or {}
+        tokens += estimate_text_tokens(function.get("name", "")) + estimate_text_tokens(function.get("arguments", ""))
+    return tokens
+
+
+class MemoryDelta(BaseModel):
+    """记忆增量 接收方将消息列表截断到offset后追加messages即可与发送方保持一致"""
+    offset: int = 0  # 增量的起始位置
+    seq: int = 0  # 增量对应的记忆序号 下一次从该序号开始导出增量
+    messages: List[Dict[str, Any]] = Field(default_factory=list)  # 起始位置之后的消息列表
+
+    def to_bytes(self) -> bytes:
+        """序列化为紧凑的二进制格式"""
+        return dumps_compact([self.offset, self.seq, self.messages])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "MemoryDelta":
+        """从二进制数据还原增量"""
+        offset, seq, messages = loads_compact(data)
+        return cls(offset=offset, seq=seq, messages=messages)
+
 
 class Memory(BaseModel):
     """记忆类 定义Agent的记忆基础信息"""
     messages: List[Dict[str, Any]] = Field(default_factory=list)
+    _token_counts: List[int] = PrivateAttr(default_factory=list)  # 与messages一一对应的token估算值
+    _seqs: List[int] = PrivateAttr(default_factory=list)  # 与messages一一对应的写入序号
+    _seq: int = PrivateAttr(default=0)  # 最近一次写入的序号
+    _changes: List[Tuple[int, int]] = PrivateAttr(default_factory=list)  # 非追加变更日志 (序号, 位置)
+    _pruned_seq: int = PrivateAttr(default=0)  # 变更日志中已经丢弃的最大序号 早于该序号的增量只能导出完整快照
 
     @classmethod
     def get_message_role(self, message: Dict[str, Any]) -> str:
         """根据传递的消息获取消息的角色信息"""
         return message.get("role")
 
+    def _sync_token_counts(self) -> None:
+        """messages被直接替换/修改导致计数不一致时 重新计算所有消息的token数和写入序号"""
+        if len(self._token_counts) != len(self.messages) or len(self._seqs) != len(self.messages):
+            self._token_counts = [estimate_message_tokens(message) for message in self.messages]
+            self._record_change(0)
+            self._seqs = [self._seq] * len(self.messages)
+
+    def _record_change(self, index: int) -> None:
+        """记录一次非追加的变更 接收方需要从该位置开始同步"""
+        self._seq += 1
+        self._changes.append((self._seq, index))
+        if len(self._changes) > MAX_CHANGES:
+            self.prune_changes(self._changes[len(self._changes) // 2][0])
+
+    def prune_changes(self, seq: int) -> None:
+        """丢弃序号不超过seq的变更记录 之后从更早的序号导出增量时退化为完整快照"""
+        count = 0
+        while count < len(self._changes) and self._changes[count][0] <= seq:
+            count += 1
+        del self._changes[:count]
+        self._pruned_seq = max(self._pruned_seq, seq)
+
     def add_message(self, message: Dict[str, Any]) -> None:
         """向消息列表中添加一条消息"""
-        self.messages.append(message)
+        self.add_messages([message])
 
     def add_messages(self, messages: List[Dict[str, Any]]) -> None:
         """向记忆中添加多条消息"""
-        self.messages.extend(messages)
+        self._sync_token_counts()
+        for message in messages:
+            self._seq += 1
+            self.messages.append(message)
+            self._token_counts.append(estimate_message_tokens(message))
+            self._seqs.append(self._seq)
 
     def get_messages(self) -> List[Dict[str, Any]]:
         """获取记忆中的所有消息列表"""
@@ -32,22 +150,108 @@ class Memory(BaseModel):
         """获取记忆中最新的一条消息"""
         return self.messages[-1] if len(self.messages) > 0 else None
 
+    def get_message_tokens(self, index: int) -> int:
+        """获取指定位置消息的token估算值"""
+        self._sync_token_counts()
+        return self._token_counts[index]
+
+    def set_message_content(self, index: int, content: Any) -> None:
+        """替换指定位置消息的内容并更新token计数"""
+        self._sync_token_counts()
+        index = index if index >= 0 else len(self.messages) + index
+        self.messages[index]["content"] = content
+        self._token_counts[index] = estimate_message_tokens(self.messages[index])
+        self._record_change(index)
+        self._seqs[index] = self._seq
+
+    def remove_messages(self, start: int, end: int) -> None:
+        """删除[start, end)区间内的消息"""
+        self._sync_token_counts()
+        del self.messages[start:end]
+        del self._token_counts[start:end]
+        del self._seqs[start:end]
+        self._record_change(start)
+
+    def replace_messages(self, start: int, end: int, messages: List[Dict[str, Any]]) -> None:
+        """使用传递的消息列表替换[start, end)区间内的消息"""
+        self._sync_token_counts()
+        self._record_change(start)
+        self.messages[start:end] = messages
+        self._token_counts[start:end] = [estimate_message_tokens(message) for message in messages]
+        self._seqs[start:end] = [self._seq] * len(messages)
+
+    def truncate(self, offset: int) -> None:
+        """将记忆截断到offset条消息 只删除末尾的消息不会复制消息列表"""
+        self._sync_token_counts()
+        if offset >= len(self.messages):
+            return
+        del self.messages[offset:]
+        del self._token_counts[offset:]
+        del self._seqs[offset:]
+        self._record_change(offset)
+
     def roll_back(self) -> None:
         """回滚记忆 删除最后一条消息"""
         if len(self.messages) > 0:
-            self.messages = self.messages[:-1]
+            self.truncate(len(self.messages) - 1)
 
     def compact(self) -> None:
         """记忆压缩 将记忆中已经执行的工具（搜索/网页源码获取/浏览器访问结果等）这类已经执行过的消息进行压缩检索"""
         # 1. 循环遍历所有的消息列表
-        for message in self.messages:
+        for idx, message in enumerate(self.messages):
             # 判断消息的角色是否是工具
             if self.get_message_role(message) == "tool":
-                # todo 工具的名称待定
-                if message.get("function_name") in []:
-                    # todo 工具的调用结果待定
-                    message["content"] = "(removed)"
-                    logger.debug(f"从记忆中移除{message["function_name"]}工具的结果：{message}")
+                # 只压缩结果体积大且可以重新获取的工具 已经压缩过的消息不再处理
+                if message.get("function_name") in COMPACTABLE_FUNCTIONS and message.get("content") != "(removed)":
+                    self.set_message_content(idx, "(removed)")
+                    logger.debug(f"从记忆中移除{message['function_name']}工具的结果")
+
+    def export_delta(self, since_seq: int = 0) -> MemoryDelta:
+        """导出自since_seq之后的增量 代价只与since_seq之后新增的消息/变更数量相关"""
+        self._sync_token_counts()
+
+        # 0.since_seq之后的部分变更记录已经被丢弃 无法确定增量的起始位置时导出完整快照
+        if since_seq < self._pruned_seq:
+            return MemoryDelta(offset=0, seq=self._seq, messages=self.messages[:])
+
+        # 1.末尾新追加(或新写入)的消息从后往前扫描
+        offset = len(self.messages)
+        while offset > 0 and self._seqs[offset - 1] > since_seq:
+            offset -= 1
+
+        # 2.变更日志中since_seq之后的变更位置
+        for seq, index in reversed(self._changes):
+            if seq <= since_seq:
+                break
+            offset = min(offset, index)
+
+        return MemoryDelta(offset=offset, seq=self._seq, messages=self.messages[offset:])
+
+    def apply_delta(self, delta: MemoryDelta) -> None:
+        """应用其他记忆导出的增量 截断到增量的起始位置后追加增量消息"""
+        self.truncate(delta.offset)
+        self.add_messages(delta.messages)
+
+    def to_bytes(self) -> bytes:
+        """将完整记忆序列化为紧凑的二进制格式"""
+        return dumps_compact(self.messages)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Memory":
+        """从二进制数据还原记忆"""
+        return cls(messages=loads_compact(data))
+
+    @property
+    def seq(self) -> int:
+        """只读属性 返回记忆当前的序号 可以作为下一次导出增量的起点"""
+        self._sync_token_counts()
+        return self._seq
+
+    @property
+    def token_count(self) -> int:
+        """只读属性 返回记忆中所有消息的token估算总数"""
+        self._sync_token_counts()
+        return sum(self._token_counts)
 
     @property
     def empty(self) -> bool:
@@ -1,9 +1,10 @@
 import uuid
+from itertools import takewhile
 from enum import Enum
-from typing import List, Any, Optional
+from typing import List, Optional
 
 from openai import BaseModel
-from pydantic.v1 import Field
+from pydantic import Field, ConfigDict
 
 
 class ExecutionStatus(str, Enum):
@@ -17,6 +18,7 @@ class ExecutionStatus(str, Enum):
 class Step(BaseModel):
     """计划中的每一个步骤/子任务"""
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))  # 子任务ID
+    depends_on: Optional[List[str]] = None  # 依赖的步骤ID列表 为None时依赖前面的所有步骤(顺序执行) 空列表表示没有依赖
     description: str = ""  # 步骤的描述信息
     status: ExecutionStatus = ExecutionStatus.PENDING  # 子任务的执行状态
     result: Optional[str] = None  # 执行结果
@@ -24,6 +26,8 @@ class Step(BaseModel):
     success: bool = False  # 子任务是否执行成功
     attachments: List[str] = Field(default_factory=list)  # 附件列表信息
 
+    model_config = ConfigDict(coerce_numbers_to_str=True)  # LLM生成的步骤ID可能是数字
+
     @property
     def done(self) -> bool:
         """只读属性 返回步骤是否继续"""
@@ -36,7 +40,7 @@ class Plan(BaseModel):
     title: str = ""  # 任务标题
     goal: str = ""  # 任务目标
     language: str = ""  # 工作语言
-    steps: List[Any] = Field(default_factory=list)  # 步骤/子任务列表
+    steps: List[Step] = Field(default_factory=list)  # 步骤/子任务列表
     message: str = ""  # 用户传递的消息
     status: ExecutionStatus = ExecutionStatus.PENDING  # 规划的状态
     error: Optional[str] = None
@@ -50,4 +54,18 @@ class Plan(BaseModel):
 
     def get_next_step(self) -> Optional[Step]:
         """获取需要执行的下一个步骤"""
-        return next((step for step in self.steps if self.done), None)
+        return next((step for step in self.steps if not step.done), None)
+
+    def get_dependencies(self, step: Step) -> List[Step]:
+        """获取步骤依赖的步骤列表 未声明依赖时依赖前面的所有步骤，声明的依赖中不存在的步骤ID直接忽略"""
+        if step.depends_on is None:
+            return list(takewhile(lambda prev: prev is not step, self.steps))
+        depends_on = set(step.depends_on)
+        return [prev for prev in self.steps if prev.id in depends_on and prev is not step]
+
+    def get_ready_steps(self) -> List[Step]:
+        """获取依赖已经全部完成、可以立即执行的步骤列表 按照步骤顺序返回"""
+        return [
+            step for step in self.steps
+            if step.status == ExecutionStatus.PENDING and all(dep.done for dep in self.get_dependencies(step))
+        ]
@@ -0,0 +1,19 @@
+from typing import Protocol, List
+
+from app.domain.models.checkpoint import Checkpoint
+
+
+class CheckpointRepository(Protocol):
+    """Agent检查点仓库"""
+
+    async def save(self, checkpoint: Checkpoint) -> None:
+        """保存一个检查点"""
+        ...
+
+    async def list_by_session(self, session_id: str, agent_name: str) -> List[Checkpoint]:
+        """按照序号升序获取会话中某个Agent的所有检查点"""
+        ...
+
+    async def delete_by_session(self, session_id: str) -> None:
+        """删除会话的所有检查点"""
+        ...
@@ -1,17 +1,28 @@
 import asyncio
+import json
 import logging
+import time
 import uuid
 from abc import ABC
-from typing import Optional, List, AsyncGenerator, Dict, Any
+from typing import Optional, List, AsyncGenerator, Dict, Any, Tuple, Union
 
-from app.domain.external.json_parser import JsonParser
+from app.domain.external.json_parser import JsonParser, IncrementalJsonParser
 from app.domain.external.llm import LLM
 from app.domain.models.app_config import AgentConfig
 from app.domain.models.event import Event, ToolEvent, ToolEventStatus, ErrorEvent, MessageEvent
-from app.domain.models.memory import Memory
+from app.domain.models.llm_usage import PromptCacheMetrics
+from app.domain.models.memory import Memory, estimate_text_tokens
 from app.domain.models.message import Message
+from app.domain.models.plan import Plan
 from app.domain.models.tool_result import ToolResult
+from app.domain.services.memory.context_manager import ContextManager
+from app.domain.services.memory.summarizer import MemorySummarizer
+from app.domain.services.agents.retry import RetryPolicy, RetryBudget
+from app.domain.services.agents.speculator import Speculator
+from app.domain.services.agents.checkpoint import AgentCheckpointer
+from app.domain.services.agents.profiler import RunProfiler, TOOL_SPAN
 from app.domain.services.tools.base import BaseTool
+from app.domain.services.tools.offload import ToolResultOffloader
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +32,6 @@ class BaseAgent(ABC):
     name: str = ""  # 智能体的名称
     _system_prompt: str = ""  # 系统预设提示词
     _format: Optional[str] = None  # Agent响应格式
-    _retry_interval: float = 1.0  # 重试间隔
     _tool_choice: Optional[str] = None  # 强制选择工具
 
     def __init__(self,
@@ -29,28 +39,101 @@ class BaseAgent(ABC):
                  llm: LLM,  # 语言模型协议
                  memory: Memory,  # 记忆
                  json_parser: JsonParser,  # json输出解析器
-                 tools: List[BaseTool]):  # 工具列表
+                 tools: List[BaseTool],  # 工具列表
+                 summary_llm: Optional[LLM] = None,  # 用于记忆摘要的次级语言模型 不传递则不开启摘要
+                 retry_budget: Optional[RetryBudget] = None,  # 会话级重试预算 同一会话的Agent共享 不传递则单独创建
+                 checkpointer: Optional[AgentCheckpointer] = None,  # 检查点管理器 不传递则不写入检查点
+                 result_offloader: Optional[ToolResultOffloader] = None):  # 工具结果卸载器 不传递则工具结果原样写入记忆
         self._agent_config = agent_config
         self._llm = llm
         self._memory = memory
         self._json_parser = json_parser
-        self._tools = tools
+        self._result_offloader = result_offloader
+        self._tools = [*tools, result_offloader.tool] if result_offloader else tools  # 开启卸载时附加读取卸载结果的工具
+        self._tool_index: Dict[str, BaseTool] = {}  # Agent级别的工具索引 工具名 -> 所在的工具包
+        self._tools_schema: List[Dict[str, Any]] = []  # 合并后的工具声明缓存
+        self._tools_json: bytes = b"[]"  # 合并后的工具声明序列化结果缓存
+        self._tools_fingerprint: Optional[Tuple[Tuple[int, int], ...]] = None  # 构建缓存时的工具包指纹
+        self._tools_version: int = 0  # 工具声明缓存的版本号 每次重建缓存时递增
+        self._tools_tokens: int = 0  # 工具声明占用的token估算值
+        self._context_manager = ContextManager(
+            model_name=llm.model_name,
+            max_context_tokens=agent_config.max_context_tokens,
+            reserved_tokens=llm.max_tokens,
+            low_watermark=0.7 if agent_config.stable_prefix else 1.0,
+        )  # 上下文窗口管理器 控制每次发送给LLM的token数 稳定前缀模式下压缩带有滞后性
+        self._prompt_cache_metrics = PromptCacheMetrics()  # 提示词前缀缓存命中统计
+        self._profiler = RunProfiler()  # 运行剖析器 记录每次迭代各个阶段的耗时和token数
+        self._retry_policy = RetryPolicy(
+            max_attempts=agent_config.max_retries,
+            base_delay=agent_config.retry_base_delay,
+            max_delay=agent_config.retry_max_delay,
+            budget=retry_budget or RetryBudget(agent_config.retry_budget),
+        )  # 重试策略 错误分类+去相关抖动退避+会话级重试预算
+        self._speculator: Optional[Speculator] = Speculator(llm) if agent_config.speculative else None  # 推测执行器
+        self._checkpointer = checkpointer
+        self._parsed_tool_args: Dict[str, Any] = {}  # 流式生成期间已经完成解析的工具参数 工具调用ID -> 参数
+        self._announced_tool_calls: Dict[str, ToolEvent] = {}  # 流式生成期间每个工具调用最后一次返回的CALLING事件 工具调用ID -> 事件
+        self._summarizer: Optional[MemorySummarizer] = MemorySummarizer(
+            llm=summary_llm,
+            threshold_tokens=agent_config.summary_threshold_tokens or self._context_manager.budget // 2,
+        ) if summary_llm else None  # 记忆摘要器 在后台将较早的历史压缩为摘要
+
+    def _refresh_tools(self) -> None:
+        """检查工具包集合是否发生变化(增删工具包、MCP重连、A2A重新加载等)，变化时重建工具声明缓存和工具索引"""
+        # 使用工具包的身份+版本号作为指纹 只有指纹变化时才重建缓存
+        fingerprint = tuple((id(tool), tool.version) for tool in self._tools)
+        if fingerprint == self._tools_fingerprint:
+            return
 
-    def _get_available_tools(self) -> List[Dict[str, str]]:
-        """获取Agent所有可用的工具列表参数声明/Schema"""
-        available_tools = []
+        # 合并所有工具包的工具声明 同时构建工具名到工具包的索引 同名工具以靠前的工具包为准
+        tools_schema = []
+        tool_index = {}
         for tool in self._tools:
-            available_tools.extend(tool.get_tools())
-        return available_tools
+            for tool_schema in tool.get_tools():
+                tools_schema.append(tool_schema)
+                tool_index.setdefault(tool_schema["function"]["name"], tool)
+
+        # 稳定前缀模式下按工具名排序并统一键顺序 保证MCP重连等场景下工具声明的序列化结果不变
+        stable_prefix = self._agent_config.stable_prefix
+        if stable_prefix:
+            tools_schema = [
+                json.loads(json.dumps(tool_schema, ensure_ascii=False, sort_keys=True))
+                for tool_schema in sorted(tools_schema, key=lambda schema: schema["function"]["name"])
+            ]
+
+        self._tools_schema = tools_schema
+        tools_json = json.dumps(tools_schema, ensure_ascii=False, sort_keys=stable_prefix)
+        self._tools_json = tools_json.encode("utf-8")
+        self._tools_tokens = estimate_text_tokens(tools_json)
+        self._tool_index = tool_index
+        self._tools_fingerprint = fingerprint
+        self._tools_version += 1
+        logger.debug(f"{self.name}重建工具声明缓存，共{len(tools_schema)}个工具，版本号：{self._tools_version}")
+
+    def invalidate_tools(self) -> None:
+        """手动使工具声明缓存失效 下一次获取工具时会重新构建"""
+        self._tools_fingerprint = None
+
+    def _get_available_tools(self) -> List[Dict[str, Any]]:
+        """获取Agent所有可用的工具列表参数声明/Schema 工具包集合未变化时返回同一个缓存列表"""
+        self._refresh_tools()
+        return self._tools_schema
 
     def _get_tool(self, tool_name: str) -> BaseTool:
         """获取对应工具所在的provider"""
-        # 循环遍历所有的工具包
-        for tool in self._tools:
-            # 判断工具包中是否存在该工具
-            if tool.has_tool(tool_name):
-                return tool
-        raise ValueError(f"{tool_name} not found")
+        # 从索引中查找工具所在的工具包
+        self._refresh_tools()
+        tool = self._tool_index.get(tool_name)
+        if tool is None:
+            # 索引未命中时强制重建一次 兼容工具包未递增版本号就修改了工具列表的情况
+            self.invalidate_tools()
+            self._refresh_tools()
+            tool = self._tool_index.get(tool_name)
+
+        if tool is None:
+            raise ValueError(f"{tool_name} not found")
+        return tool
 
     async def _add_to_memory(self, messages: List[Dict[str, Any]]) -> None:
         """将对应的信息添加到记忆中"""
@@ -63,22 +146,134 @@ class BaseAgent(ABC):
         # 将正常消息添加到memory中
         self._memory.add_messages(messages)
 
+    async def add_messages(self, messages: List[Dict[str, Any]]) -> None:
+        """向Agent记忆中追加上下文消息(例如其他Agent的执行结果) 记忆为空时会先写入系统提示词"""
+        await self._add_to_memory(messages)
+
+    def prefetch(self, messages: List[Dict[str, Any]], format: Optional[str] = None) -> None:
+        """推测下一次调用invoke时会传递的消息 提前在后台发起LLM请求，未开启推测执行时不做任何处理"""
+        if self._speculator is None:
+            return
+
+        # 组装和_invoke_llm完全一致的请求内容 记忆为空时需要补充系统提示词
+        history = [{"role": "system", "content": self._system_prompt}] if self._memory.empty else []
+        format = format if format else self._format
+        self._speculator.prefetch(
+            message=history + self._memory.get_messages() + messages,
+            tools=self._get_available_tools(),
+            response_format={"type": format} if format else None,
+            tool_choice=self._tool_choice,
+            parallel_tool_calls=self._agent_config.parallel_tool_calls,
+        )
+
+    def _take_prefetched(self, response_format: Optional[Dict[str, Any]]) -> Optional[asyncio.Task]:
+        """取出与本次请求完全一致的推测请求 没有命中时返回None"""
+        if self._speculator is None:
+            return None
+        return self._speculator.take(
+            message=self._memory.get_messages(),
+            tools=self._get_available_tools(),
+            response_format=response_format,
+            tool_choice=self._tool_choice,
+        )
+
+    def _fit_context(self) -> None:
+        """在调用LLM之前将记忆控制在上下文预算内 工具声明同样会占用上下文"""
+        self._refresh_tools()
+        self._context_manager.fit(self._memory, extra_tokens=self._tools_tokens)
+
     async def _invoke_tool(self, tool: BaseTool, tool_name: str, arguments: Dict[str, Any]) -> ToolResult:
         """传递工具包+工具名字+对应的参数调用指定的工具"""
-        # 执行循环调用工具获取结果
+        # 执行循环调用工具获取结果 按照重试策略退避 不可重试的错误直接结束
         err = ""
+        retry = self._retry_policy.start()
         for _ in range(self._agent_config.max_retries):
             try:
-                return await tool.invoke(tool_name, **arguments)
+                with self._profiler.span(TOOL_SPAN, tool_name=tool_name):
+                    return await tool.invoke(tool_name, **arguments)
             except Exception as ex:
                 err = str(ex)
                 logger.exception(f"调用工具{tool_name}出错：{str(ex)}")
-                await asyncio.sleep(self._retry_interval)
-                continue
+                if not await retry.backoff(ex):
+                    break
 
         # 循环最大重试次数后没有结果 则将错误作为工具的执行结果 让LLM自行处理
         return ToolResult(success=False, message=err)
 
+    def _group_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """将工具调用按原始顺序分组，相邻的可并发工具归为同一组，其余工具各自单独成组"""
+        # 未开启并发执行则每个工具调用单独成组 退化为串行执行
+        if not self._agent_config.parallel_tool_calls:
+            return [[call] for call in tool_calls]
+
+        groups = []
+        last_parallel = False
+        for call in tool_calls:
+            parallel = call["tool"].is_parallel(call["function_name"])
+            # 只有前后两个工具都可并发时才合并到同一组 有副作用的工具会作为分界点
+            if parallel and last_parallel:
+                groups[-1].append(call)
+            else:
+                groups.append([call])
+            last_parallel = parallel
+
+        return groups
+
+    async def _invoke_tools(self, tool_calls: List[Dict[str, Any]]) -> AsyncGenerator[Tuple[int, ToolResult], None]:
+        """在并发上限内执行同一组的工具调用，按照完成的先后顺序返回(索引, 工具结果)"""
+        # 单个工具直接调用 无需创建额外的任务
+        if len(tool_calls) == 1:
+            call = tool_calls[0]
+            yield 0, await self._invoke_tool(call["tool"], call["function_name"], call["function_args"])
+            return
+
+        semaphore = asyncio.Semaphore(self._agent_config.max_tool_concurrency)
+
+        async def _run(idx: int, call: Dict[str, Any]) -> Tuple[int, ToolResult]:
+            async with semaphore:
+                return idx, await self._invoke_tool(call["tool"], call["function_name"], call["function_args"])
+
+        tasks = [asyncio.create_task(_run(idx, call)) for idx, call in enumerate(tool_calls)]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            # 调用方提前终止迭代时取消尚未完成的工具调用 避免任务泄露
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _handle_llm_message(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """处理LLM的响应内容并添加到记忆中，如果LLM回复了空内容则返回None表示需要重试"""
+        # 记录本次调用的usage信息 usage不属于消息本身不能写入记忆
+        usage = message.pop("usage", None)
+        self._prompt_cache_metrics.record(usage)
+        self._profiler.record_usage(usage)
+
+        # 处理AI响应内容避免空回复
+        if message.get("role") == "assistant":
+            if not message.get("content") and not message.get("tool_calls"):
+                logger.warning("LLM回复了空内容，执行重试")
+                await self._add_to_memory([
+                    {"role": "assistant", "content": ""},
+                    {"role": "user", "content": "AI无响应内容，请继续"}
+                ])
+                return None
+
+            # 取出非空消息并处理工具调用
+            filtered_message = {"role": "assistant", "content": message.get("content")}
+            if message.get("tool_calls"):
+                # 取出工具调用的数据 限制LLM一次只能调用工具
+                filtered_message["tool_calls"] = message.get("tool_calls")
+        else:
+            # 非AI消息 记录日志并存储message
+            logger.warning(f"LLM响应内容无法确认消息角色：{message.get('role')}")
+            filtered_message = message
+
+        # 将消息添加到消息列表
+        await self._add_to_memory([filtered_message])
+        return filtered_message
+
     async def _invoke_llm(self, messages: List[Dict[str, Any]], format: Optional[str] = None) -> Dict[str, Any]:
         """"调用语言模型并处理记忆内容"""
         # 将消息添加到记忆中
@@ -88,147 +283,404 @@ class BaseAgent(ABC):
         response_format = {"type": format} if format else None
 
         # 循环向LLM发起提问直到最大的重试次数
+        last_error: Optional[Exception] = None
+        retry = self._retry_policy.start()
         for _ in range(self._agent_config.max_retries):
             try:
-                # 调用语言模型获取响应内容
-                message = self._llm.invoke(
-                    message=messages,
-                    response_format=response_format,
-                    tools=self._get_available_tools(),
-                    tool_choice=self._tool_choice,
-                )
-
-                # 处理AI响应内容避免空回复
-                if message.get("role") == "assistant":
-                    if not message.get("content") and not message.get("tool_calls"):
-                        logger.warning("LLM回复了空内容，执行重试")
-                        await self._add_to_memory([
-                            {"role": "assistant", "content": ""},
-                            {"role": "user", "content": "AI无响应内容，请继续"}
-                        ])
-                        continue
+                # 调用语言模型获取响应内容 传递的是控制在预算内的完整消息列表
+                self._fit_context()
+                prefetched = self._take_prefetched(response_format)
+                with self._profiler.span("llm"):
+                    message = await prefetched if prefetched else await self._llm.invoke(
+                        message=self._memory.get_messages(),
+                        response_format=response_format,
+                        tools=self._get_available_tools(),
+                        tool_choice=self._tool_choice,
+                        parallel_tool_calls=self._agent_config.parallel_tool_calls,
+                    )
+
+                # 处理响应内容 空回复则继续重试
+                filtered_message = await self._handle_llm_message(message)
+                if filtered_message is None:
+                    continue
+                return filtered_message
+            except Exception as e:
+                # 记录日志并按照重试策略退避 不可重试的错误直接结束
+                last_error = e
+                logger.error(f"调用大模型对话失败：{str(e)}")
+                if not await retry.backoff(e):
+                    break
+
+        raise RuntimeError(f"调用大模型对话失败，共失败{retry.attempts}次：{last_error}") from last_error
+
+    async def _invoke_llm_stream(
+            self,
+            messages: List[Dict[str, Any]],
+            format: Optional[str] = None,
+    ) -> AsyncGenerator[Union[MessageEvent, ToolEvent, Dict[str, Any]], None]:
+        """
+        调用语言模型，开启流式输出时在生成过程中返回增量的MessageEvent，最后一项为处理后的完整消息，
+        工具调用的参数有顶层字段生成完整时立即返回该工具的CALLING事件(partial)，参数对象完整时再返回完整参数的CALLING事件，
+        已经返回过事件的请求失败时不再重试(重试会生成新的内容，调用方已经收到的增量消息无法撤回)
+        """
+        # 未开启流式输出则直接走块响应
+        if not self._agent_config.stream:
+            yield await self._invoke_llm(messages, format)
+            return
 
-                    # 取出非空消息并处理工具调用
-                    filtered_message = {"role": "assistant", "content": message.get("content")}
-                    if message.get("tool_calls"):
-                        # 取出工具调用的数据 限制LLM一次只能调用工具
-                        filtered_message["tool_calls"] = message.get("tool_calls")
+        # 将消息添加到记忆中并组装响应格式
+        await self._add_to_memory(messages)
+        response_format = {"type": format} if format else None
+
+        # 循环向LLM发起提问直到最大的重试次数
+        last_error: Optional[Exception] = None
+        retry = self._retry_policy.start()
+        for _ in range(self._agent_config.max_retries):
+            streamed = False  # 本次请求是否已经返回过事件
+            try:
+                message = None
+                self._parsed_tool_args, self._announced_tool_calls = {}, {}
+                parsers: Dict[int, IncrementalJsonParser] = {}  # 工具调用索引 -> 增量参数解析器
+                self._fit_context()
+                prefetched = self._take_prefetched(response_format)
+                if prefetched:
+                    # 推测请求命中 完整消息已经生成 文本内容作为一个增量片段返回
+                    with self._profiler.span("llm"):
+                        message = await prefetched
+                    if message.get("content"):
+                        streamed = True
+                        yield MessageEvent(message=message["content"], partial=True)
                 else:
-                    # 非AI消息 记录日志并存储message
-                    logger.warning(f"LLM响应内容无法确认消息角色：{message.get('role')}")
-                    filtered_message = message
-                # 将消息添加到消息列表
-                await self._add_to_memory([filtered_message])
+                    stream = self._llm.invoke_stream(
+                        message=self._memory.get_messages(),
+                        response_format=response_format,
+                        tools=self._get_available_tools(),
+                        tool_choice=self._tool_choice,
+                        parallel_tool_calls=self._agent_config.parallel_tool_calls,
+                    )
+                    async for chunk in self._profiler.iterate("llm", stream):
+                        # 文本增量以partial消息事件的形式实时返回
+                        if chunk["type"] == "content":
+                            streamed = True
+                            yield MessageEvent(message=chunk["content"], partial=True)
+                        elif chunk["type"] == "tool_call":
+                            # 工具参数边生成边解析 有顶层字段完成时立即返回只包含已完成字段的CALLING事件(partial)
+                            # 参数对象完整时再返回包含完整参数的CALLING事件
+                            parser = parsers.get(chunk["index"])
+                            if parser is None:
+                                parser = parsers[chunk["index"]] = self._json_parser.incremental()
+                            start = time.perf_counter()
+                            fields = parser.feed(chunk["arguments_delta"])
+                            self._profiler.add("json_parse", time.perf_counter() - start)
+                            if (parser.done or fields) and chunk["id"] and chunk["id"] not in self._parsed_tool_args:
+                                tool_event = await self._announce_tool_call(chunk["id"], chunk["name"], parser)
+                                if tool_event:
+                                    streamed = True
+                                    yield tool_event
+                        elif chunk["type"] == "message":
+                            message = chunk["message"]
+
+                # 流结束但没有拿到完整消息 说明流被意外中断
+                if message is None:
+                    raise RuntimeError("LLM流式响应意外结束")
+
+                # 处理响应内容 空回复则继续重试
+                filtered_message = await self._handle_llm_message(message)
+                if filtered_message is None:
+                    continue
+                yield filtered_message
+                return
             except Exception as e:
-                # 记录日志并睡眠指定的时间
-                logger.error(f"调用大模型对话失败：{str(e)}")
-                await asyncio.sleep(self._retry_interval)
+                # 记录日志并按照重试策略退避 不可重试的错误直接结束
+                last_error = e
+                logger.error(f"流式调用大模型对话失败：{str(e)}")
+                if streamed:
+                    # 已经返回CALLING事件的工具不会再执行 返回失败的CALLED事件结束这些工具调用
+                    for tool_event in self._announced_tool_calls.values():
+                        yield ToolEvent(
+                            tool_call_id=tool_event.tool_call_id,
+                            tool_name=tool_event.tool_name,
+                            function_name=tool_event.function_name,
+                            function_args=tool_event.function_args,
+                            function_result=ToolResult(success=False, message=f"LLM流式响应中断，工具未执行：{str(e)}"),
+                            status=ToolEventStatus.CALLED,
+                        )
+                    self._announced_tool_calls = {}
+                    raise RuntimeError(f"流式调用大模型对话在返回部分内容后失败：{str(e)}") from e
+                if not await retry.backoff(e):
+                    break
+
+        raise RuntimeError(f"流式调用大模型对话失败，共失败{retry.attempts}次：{last_error}") from last_error
+
+    async def _format_tool_result(self, call: Dict[str, Any], result: ToolResult) -> str:
+        """将工具结果转换为写入记忆的文本 配置了卸载器时大体积的结果只保留摘要和句柄"""
+        if self._result_offloader is None:
+            return result.model_dump_json(fallback=str)
+        return await self._result_offloader.offload(call["tool_call_id"], call["function_name"], result)
+
+    async def _announce_tool_call(
+            self,
+            tool_call_id: str,
+            function_name: str,
+            parser: IncrementalJsonParser,
+    ) -> Optional[ToolEvent]:
+        """工具存在时返回流式生成期间的CALLING事件 参数对象完整时记录解析结果，否则事件只包含已经完成的顶层字段"""
+        partial = not parser.done
+        if partial:
+            function_args = dict(parser.fields)
+        else:
+            function_args = await parser.close()
+            self._parsed_tool_args[tool_call_id] = function_args
+
+        # 工具不存在时不提前返回 交给工具调用阶段统一处理
+        self._refresh_tools()
+        tool = self._tool_index.get(function_name)
+        if tool is None:
+            return None
+
+        tool_event = ToolEvent(
+            tool_call_id=tool_call_id,
+            tool_name=tool.name,
+            function_name=function_name,
+            function_args=function_args,
+            status=ToolEventStatus.CALLING,
+            partial=partial,
+        )
+        self._announced_tool_calls[tool_call_id] = tool_event
+        return tool_event
 
     async def invoke(self, query: str, format: Optional[str] = None) -> AsyncGenerator[Event, None]:
         """传递消息+响应格式 调用程序生成异步迭代内容"""
         # 判断是否传递了format
         format = format if format else self._format
 
-        # 调用语言模型获取内容
-        message = await self._invoke_llm(
-            messages=[{"role": "user", "content": query}],
-            format=format
-        )
-
-        # 循环遍历知道最大的迭代次数
-        for _ in range(self._agent_config.max_iterations):
-            # 如果响应的内容无工具调用则表示LLM生成了文本回答 这时候就是最终答案
-            if not message.get("tool_calls"):
-                break
+        async for event in self._run([{"role": "user", "content": query}], format):
+            yield event
 
-            # 循环遍历工具参数并执行
-            tool_messages = []
-            for tool_call in message["tool_calls"]:
-                if not tool_call.get("function"):
-                    continue
-
-                # 取出工具调用的ID、名字还有参数信息
-                tool_call_id = tool_call["id"] or str(uuid.uuid4())
-                function_name = tool_call["function"]["name"]
-                function_args = await self._json_parser.invoke(tool_call["function"]["arguments"])
-
-                # 取出Agent中对应的工具
-                tool = self._get_tool(function_name)
-
-                # 返回工具即将调用事件 其中tool_content需要在具体的业务中实现
-                yield ToolEvent(
-                    tool_call_id=tool_call_id,
-                    tool_name=tool.name,
-                    function_name=function_name,
-                    function_args=function_args,
-                    status=ToolEventStatus.CALLING
-                )
-
-                # 调用工具并获取结果
-                result = await self._invoke_tool(tool, function_name, function_args)
-
-                # 返回工具调用结果 其中tool_content需要在业务中实现
-                yield ToolEvent(
-                    tool_call_id=tool_call_id,
-                    function_name=function_name,
-                    function_args=function_args,
-                    function_result=result,
-                    status=ToolEventStatus.CALLED
-                )
-
-                # 组装工具响应
-                tool_messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call_id,
-                    "function_name": function_name,
-                    "content": result.model_dump()
-                })
+    async def resume(self, format: Optional[str] = None) -> AsyncGenerator[Event, None]:
+        """从检查点恢复之后继续迭代 最后一轮工具调用只执行了一部分时先执行剩余的工具，再基于已有的工具结果调用LLM"""
+        format = format if format else self._format
 
-            # 所有工具都执行完成之后 调用LLM获取汇总消息二次提问
-            message = await self._invoke_llm(tool_messages)
+        async for event in self._run([], format):
+            yield event
 
-        else:
-            # 超过最大迭代次数 则抛出错误
-            yield ErrorEvent(error=f"Agent迭代达到最大次数：{self._agent_config.max_iterations}")
+    def _get_incomplete_tool_round(self) -> Optional[Tuple[int, Dict[str, Any], set]]:
+        """找出记忆末尾未执行完成的一轮工具调用 返回(assistant消息的位置, assistant消息, 已有结果的工具调用ID)"""
+        messages = self._memory.get_messages()
+        for idx in range(len(messages) - 1, -1, -1):
+            message = messages[idx]
+            if message.get("role") == "tool":
+                continue
+            if message.get("role") != "assistant" or not message.get("tool_calls"):
+                return None
+
+            # 检查该assistant消息之后是否有所有工具调用的结果
+            completed = {item.get("tool_call_id") for item in messages[idx + 1:]}
+            if {tool_call.get("id") for tool_call in message["tool_calls"]}.issubset(completed):
+                return None
+            return idx, message, completed
+        return None
+
+    async def _run(self, messages: List[Dict[str, Any]], format: Optional[str] = None) -> AsyncGenerator[Event, None]:
+        """将消息添加到记忆后循环执行 LLM调用 -> 工具调用 直到LLM给出最终回复"""
+        try:
+            self._profiler.start(self.name)
+            self._profiler.begin_iteration()
+            message = None
+            completed: set = set()  # 本轮已经有结果的工具调用ID 从检查点恢复时不再重复执行
+
+            # 记忆末尾的一轮工具调用只执行了一部分(进程崩溃/被中断)：恢复执行时继续执行剩余的工具，传递了新消息则丢弃这一轮
+            incomplete = self._get_incomplete_tool_round()
+            if incomplete is not None:
+                idx, tool_call_message, tool_call_ids = incomplete
+                if messages:
+                    logger.warning(f"{self.name}记忆中最后一轮工具调用未完成，丢弃第{idx}条消息之后的内容")
+                    self._memory.truncate(idx)
+                else:
+                    message, completed = tool_call_message, tool_call_ids
+
+            # 调用语言模型获取内容 流式输出的增量消息事件直接返回
+            if message is None:
+                async for item in self._invoke_llm_stream(messages=messages, format=format):
+                    if isinstance(item, (MessageEvent, ToolEvent)):
+                        yield item
+                    else:
+                        message = item
+                await self.save_checkpoint()
+
+            # 循环遍历知道最大的迭代次数
+            for _ in range(self._agent_config.max_iterations):
+                # 如果响应的内容无工具调用则表示LLM生成了文本回答 这时候就是最终答案
+                if not message.get("tool_calls"):
+                    break
+
+                # 迭代之间应用已完成的记忆摘要 并按需在后台启动新的摘要
+                if self._summarizer:
+                    self._summarizer.step(self._memory)
+
+                # 解析本轮所有的工具调用 取出工具调用的ID、名字、参数以及对应的工具包
+                tool_calls = []
+                for tool_call in message["tool_calls"]:
+                    if not tool_call.get("function") or tool_call.get("id") in completed:
+                        continue
 
-        # 在指定的步骤内完成了迭代 则返回消息事件
-        yield MessageEvent(message=message["content"])
+                    # 流式生成期间已经解析完成的参数直接复用 不再重复解析整段参数文本
+                    function_name = tool_call["function"]["name"]
+                    function_args = self._parsed_tool_args.get(tool_call["id"]) if tool_call["id"] else None
+                    if function_args is None:
+                        with self._profiler.span("json_parse"):
+                            function_args = await self._json_parser.invoke(tool_call["function"]["arguments"])
+                    tool_calls.append({
+                        "tool_call_id": tool_call["id"] or str(uuid.uuid4()),
+                        "function_name": function_name,
+                        "function_args": function_args,
+                        "tool": self._get_tool(function_name),
+                    })
+
+                # 按分组执行工具调用 组内的工具会并发执行 组与组之间按顺序执行
+                for group in self._group_tool_calls(tool_calls):
+                    # 返回工具即将调用事件 其中tool_content需要在具体的业务中实现
+                    for call in group:
+                        announced = self._announced_tool_calls.get(call["tool_call_id"])
+                        if announced is not None and not announced.partial:
+                            continue
+                        yield ToolEvent(
+                            tool_call_id=call["tool_call_id"],
+                            tool_name=call["tool"].name,
+                            function_name=call["function_name"],
+                            function_args=call["function_args"],
+                            status=ToolEventStatus.CALLING
+                        )
+
+                    # 调用工具并按完成的先后顺序返回工具调用结果 其中tool_content需要在业务中实现
+                    # tool_dispatch为整组工具从分发到全部完成的耗时 和各个工具的执行耗时对比可以看出并发收益和分发开销
+                    results: Dict[int, Dict[str, Any]] = {}  # 已经完成但前面还有工具未完成的工具消息 组内索引 -> 工具消息
+                    written = 0  # 组内已经写入记忆的工具消息数
+                    async for idx, result in self._profiler.iterate("tool_dispatch", self._invoke_tools(group)):
+                        call = group[idx]
+                        yield ToolEvent(
+                            tool_call_id=call["tool_call_id"],
+                            function_name=call["function_name"],
+                            function_args=call["function_args"],
+                            function_result=result,
+                            status=ToolEventStatus.CALLED
+                        )
+
+                        # 工具结果序列化为json字符串(超过阈值时卸载到外部存储)
+                        results[idx] = {
+                            "role": "tool",
+                            "tool_call_id": call["tool_call_id"],
+                            "function_name": call["function_name"],
+                            "content": await self._format_tool_result(call, result),
+                        }
+
+                        # 按照LLM给出的原始顺序写入组内前面连续已完成的工具消息 每写入一条就写入检查点
+                        # 进程在后续的工具调用或者LLM调用期间崩溃时，恢复后只需要执行尚未写入记忆的工具
+                        while written in results:
+                            await self._add_to_memory([results.pop(written)])
+                            written += 1
+                            await self.save_checkpoint()
+
+                # 所有工具都执行完成之后 基于记忆中的工具结果调用LLM获取汇总消息二次提问
+                completed = set()
+                self._profiler.begin_iteration()
+                async for item in self._invoke_llm_stream([]):
+                    if isinstance(item, (MessageEvent, ToolEvent)):
+                        yield item
+                    else:
+                        message = item
+                await self.save_checkpoint()
+
+            else:
+                # 超过最大迭代次数 则抛出错误
+                yield ErrorEvent(error=f"Agent迭代达到最大次数：{self._agent_config.max_iterations}")
+
+            # 在指定的步骤内完成了迭代 则返回消息事件
+            yield MessageEvent(message=message["content"])
+        finally:
+            # 运行结束(包括等待用户输入/被取消)时应用已经完成的摘要 并取消尚未完成的后台摘要任务，避免任务在Agent丢弃后继续运行
+            if self._summarizer:
+                self._summarizer.apply(self._memory)
+                self._summarizer.cancel()
+
+    def detach_checkpointer(self) -> None:
+        """不再为该Agent写入检查点 检查点按照Agent名称区分，同名的临时Agent(例如并行步骤的Agent)必须调用该方法"""
+        self._checkpointer = None
+
+    async def save_checkpoint(self, plan: Optional[Plan] = None) -> None:
+        """写入Agent记忆(以及计划)的增量检查点 未配置检查点或者写入失败时不影响Agent执行"""
+        if self._checkpointer is None:
+            return
+        try:
+            await self._checkpointer.save(self.name, self._memory, plan)
+        except Exception as e:
+            logger.error(f"{self.name}写入检查点失败：{str(e)}")
 
     async def compact_memory(self) -> None:
         """压缩Agent记忆"""
         self._memory.compact()
+        if self._summarizer:
+            self._summarizer.step(self._memory)
 
     async def roll_back(self, message: Message) -> None:
         """Agent状态回滚，该函数用来确保Agent的消息列表状态是正确的，用来发送新的消息，暂停/停止任务，通知用户"""
-        # 1 取出记忆中的最后一条消息 检查是否是工具调用消息
-        last_message = self._memory.get_last_message()
-        if (
-                not last_message or
-                not last_message.get("tool_calls") or
-                len(last_message.get("tool_calls")) == 0
-        ):
+        # 1 找出记忆末尾未执行完成的一轮工具调用 工具结果是逐个写入记忆的，这一轮可能已经有部分工具结果
+        incomplete = self._get_incomplete_tool_round()
+        if incomplete is None:
             return
+        idx, tool_call_message, completed = incomplete
 
-        # 取出消息中的工具调用参数
-        tool_call = last_message.get("tool_calls")[0]
+        # 取出尚未有结果的工具调用
+        pending = [
+            tool_call for tool_call in tool_call_message["tool_calls"] if tool_call.get("id") not in completed
+        ]
 
-        # 提取出工具名称还有ID
-        function_name = tool_call.get("function", {}).get("name")
-        tool_call_id = tool_call["id"]
-
-        # 判断当前工具下是不是通知用户的消息
-        if function_name == "message_ask_user":
-            self._memory.add_message({
-                "role": "tool",
-                "tool_call_id": tool_call_id,
-                "function_name": function_name,
-                "content": message.model_dump_json()
-            })
+        # 判断未完成的工具是不是通知用户的消息 是则将用户的回复作为工具结果
+        if all(tool_call.get("function", {}).get("name") == "message_ask_user" for tool_call in pending):
+            for tool_call in pending:
+                self._memory.add_message({
+                    "role": "tool",
+                    "tool_call_id": tool_call["id"],
+                    "function_name": tool_call["function"]["name"],
+                    "content": message.model_dump_json()
+                })
         else:
-            # 否则直接删除最后一条消息
-            self._memory.roll_back()
+            # 否则删除这一轮工具调用(assistant消息以及已经写入的工具结果)
+            self._memory.truncate(idx)
 
     @property
     def memory(self) -> Memory:
         """只读属性 返回记忆"""
         return self._memory
+
+    @property
+    def agent_config(self) -> AgentConfig:
+        """只读属性 返回Agent配置"""
+        return self._agent_config
+
+    @property
+    def speculation_stats(self) -> Optional[Dict[str, Any]]:
+        """只读属性 返回推测执行的命中统计 未开启推测执行时返回None"""
+        return self._speculator.stats if self._speculator else None
+
+    @property
+    def profiler(self) -> RunProfiler:
+        """只读属性 返回Agent的运行剖析器"""
+        return self._profiler
+
+    @property
+    def prompt_cache_metrics(self) -> PromptCacheMetrics:
+        """只读属性 返回提示词前缀缓存命中统计"""
+        return self._prompt_cache_metrics
+
+    @property
+    def tools_version(self) -> int:
+        """只读属性 返回工具声明缓存的版本号"""
+        self._refresh_tools()
+        return self._tools_version
+
+    @property
+    def tools_json(self) -> bytes:
+        """只读属性 返回合并后的工具声明序列化结果(utf-8编码的json)"""
+        self._refresh_tools()
+        return self._tools_json
@@ -0,0 +1,87 @@
+"""
+Agent检查点的设计思路：
+1. 记录每个Agent上一次检查点时的记忆序号，每次检查点只写入该序号之后的记忆增量(Memory.export_delta)，而不是整个记忆
+   - 正常迭代只追加消息，增量就是新追加的消息；压缩/回滚/摘要修改了较早的消息时，增量会从被修改的位置开始
+   - 写入成功后丢弃记忆中该序号之前的变更记录(Memory.prune_changes)，变更日志不会随会话时长无限增长
+2. 恢复时按照序号依次回放检查点：先将消息列表截断到message_offset，再追加增量消息，计划以最新的检查点为准
+3. Agent每得到一个工具结果就写入一次检查点，进程崩溃时最后一轮工具调用可能只执行了一部分，恢复时保留已经完成的工具结果，
+   由Agent在resume时只执行尚未完成的工具(传递新的消息时则丢弃这一轮)，已经完成的工具不会重复执行
+4. 崩溃时处于执行中的步骤保持执行中状态，由计划执行器决定继续执行该步骤还是重新调度
+"""
+import logging
+from typing import Optional, List, Dict, Any, Tuple
+
+from app.domain.models.checkpoint import Checkpoint
+from app.domain.models.memory import Memory
+from app.domain.models.plan import Plan
+from app.domain.repositories.checkpoint_repository import CheckpointRepository
+
+logger = logging.getLogger(__name__)
+
+
+class AgentCheckpointer:
+    """会话级别的Agent检查点管理器 负责增量写入和恢复Agent的记忆与计划"""
+
+    def __init__(self, repository: CheckpointRepository, session_id: str) -> None:
+        self._repository = repository
+        self._session_id = session_id
+        self._seqs: Dict[str, int] = {}  # Agent名称 -> 最新的检查点序号
+        self._memory_seqs: Dict[str, int] = {}  # Agent名称 -> 上一次检查点时的记忆序号
+        self._plan_json: Optional[str] = None  # 最近一次写入的计划 计划未变化时不重复写入
+
+    @property
+    def session_id(self) -> str:
+        """只读属性 返回会话ID"""
+        return self._session_id
+
+    async def save(self, agent_name: str, memory: Memory, plan: Optional[Plan] = None) -> Optional[Checkpoint]:
+        """写入一次增量检查点 记忆和计划都没有变化时跳过，返回写入的检查点"""
+        delta = memory.export_delta(self._memory_seqs.get(agent_name, 0))
+        plan_json = plan.model_dump_json() if plan else None
+        plan_changed = plan_json is not None and plan_json != self._plan_json
+        if delta.seq == self._memory_seqs.get(agent_name, 0) and not plan_changed:
+            return None
+
+        seq = self._seqs.get(agent_name, 0) + 1
+        checkpoint = Checkpoint(
+            session_id=self._session_id,
+            agent_name=agent_name,
+            seq=seq,
+            message_offset=delta.offset,
+            messages=delta.messages,
+            plan=plan if plan_changed else None,
+        )
+        await self._repository.save(checkpoint)
+
+        # 写入成功之后再更新本地状态 写入失败时下一次会重新写入同样的增量
+        self._seqs[agent_name] = seq
+        if plan_changed:
+            self._plan_json = plan_json
+        self._memory_seqs[agent_name] = delta.seq
+        memory.prune_changes(delta.seq)
+        logger.debug(f"会话{self._session_id}的{agent_name}写入检查点{seq}，增量消息{len(delta.messages)}条")
+        return checkpoint
+
+    async def restore(self, agent_name: str) -> Tuple[Optional[Memory], Optional[Plan]]:
+        """回放会话中某个Agent的所有检查点 返回恢复后的记忆和计划，没有检查点时返回(None, None)"""
+        checkpoints = await self._repository.list_by_session(self._session_id, agent_name)
+        if not checkpoints:
+            return None, None
+
+        messages: List[Dict[str, Any]] = []
+        plan: Optional[Plan] = None
+        for checkpoint in checkpoints:
+            messages = messages[:checkpoint.message_offset] + checkpoint.messages
+            if checkpoint.plan is not None:
+                plan = checkpoint.plan
+
+        # 未完成的工具调用交给Agent处理 执行中的步骤交给计划执行器处理
+        memory = Memory(messages=messages)
+        if plan is not None:
+            self._plan_json = plan.model_dump_json()
+
+        # 恢复后的状态已经持久化 后续只需要写入新的增量
+        self._memory_seqs[agent_name] = memory.seq
+        self._seqs[agent_name] = checkpoints[-1].seq
+        logger.info(f"会话{self._session_id}的{agent_name}从{len(checkpoints)}个检查点恢复，共{len(memory.messages)}条消息")
+        return memory, plan
@@ -0,0 +1,198 @@
+"""
+DAG计划执行器的设计思路：
+1. 计划中的步骤通过depends_on声明依赖，依赖全部完成的步骤即为就绪步骤，就绪步骤之间相互独立可以同时执行
+2. 只有一个就绪步骤时沿用主ReActAgent执行，保持和顺序执行完全一致的连续上下文
+3. 多个就绪步骤时为每个步骤创建独立的ReActAgent(独立的Memory)，各自只携带所依赖步骤的执行结果
+   - 多个Agent产生的事件通过asyncio.Queue合并为一个事件流，按照产生的先后顺序返回
+   - 某个步骤需要等待用户输入(WaitEvent)时取消其他步骤，被取消的步骤恢复为待执行状态，
+     等待中的步骤保持执行中状态，其Agent的记忆(含未完成的message_ask_user调用)交给主Agent，
+     用户回复后由主Agent回滚记忆并继续执行该步骤
+4. 并行步骤执行完成后将结果合并回主Agent的记忆，再一次性交给PlanAgent更新计划
+5. 开启推测执行时，在PlanAgent更新计划期间按照当前计划提前发起下一个步骤的第一次LLM请求，计划被修改则推测结果作废
+   - 下一个步骤的第一次请求包含当前步骤的最终回复，只能在步骤结束后发起，可以重叠的只有更新计划的LLM调用
+   - 更新计划走快速路径(skip_unneeded_replan)时计划立即返回，没有可以重叠的等待时间，不发起推测请求
+   - 计划执行结束时记录推测请求的命中统计，开启剖析时ProfileEvent中同样携带该统计
+6. 步骤开始和计划更新时写入检查点，从检查点恢复时崩溃前正在主Agent上执行的步骤会基于已有的工具结果继续执行
+   - 检查点按照Agent名称区分，并行步骤的Agent和主Agent同名，不写入检查点(否则多个Agent的增量会写入同一个序列)，
+     崩溃时并行执行中的步骤恢复为待执行状态重新执行
+"""
+import asyncio
+import logging
+from typing import Callable, List, Dict, Any, AsyncGenerator, Optional, Tuple
+
+from app.domain.models.event import Event, WaitEvent, ErrorEvent, StepEvent, StepEventStatus, PlanEvent, \
+    PlanEventStatus
+from app.domain.models.message import Message
+from app.domain.models.plan import Plan, Step, ExecutionStatus
+from app.domain.services.agents.planner import PlanAgent
+from app.domain.services.agents.react import ReActAgent
+
+logger = logging.getLogger(__name__)
+
+
+class PlanExecutor:
+    """按照步骤依赖关系(DAG)执行计划 相互独立的步骤在多个ReActAgent上并行执行"""
+
+    def __init__(
+            self,
+            planner: PlanAgent,  # 规划Agent 负责在步骤执行后更新计划
+            react_agent: ReActAgent,  # 主执行Agent 顺序执行步骤以及最终汇总
+            agent_factory: Callable[[], ReActAgent],  # 创建独立执行Agent(独立Memory)的工厂函数
+    ) -> None:
+        self._planner = planner
+        self._react_agent = react_agent
+        self._agent_factory = agent_factory
+        self._max_parallel_steps = react_agent.agent_config.max_parallel_steps  # 最多同时执行的步骤数
+
+    @classmethod
+    def _get_step_messages(cls, step: Step) -> List[Dict[str, Any]]:
+        """将已完成步骤的执行结果转换为可以写入Agent记忆的上下文消息"""
+        return [
+            {"role": "user", "content": f"已完成的步骤：{step.description}"},
+            {"role": "assistant", "content": step.model_dump_json(include={"success", "result", "attachments"})},
+        ]
+
+    async def _run_step(
+            self, idx: int, plan: Plan, step: Step, agent: ReActAgent, message: Message, queue: asyncio.Queue,
+    ) -> None:
+        """在独立的ReActAgent上执行单个步骤 产生的事件以(步骤索引, 事件)的形式写入合并队列"""
+        try:
+            agent.detach_checkpointer()
+
+            # 独立Agent只携带所依赖步骤的执行结果
+            context = []
+            for dep in plan.get_dependencies(step):
+                if dep.done:
+                    context.extend(self._get_step_messages(dep))
+            if context:
+                await agent.add_messages(context)
+
+            async for event in agent.execute_step(plan, step, message):
+                await queue.put((idx, event))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"并行执行步骤{step.id}出错：{str(e)}")
+            step.status = ExecutionStatus.FAILED
+            step.error = str(e)
+            await queue.put((idx, StepEvent(step=step, status=StepEventStatus.FAILED)))
+        finally:
+            await queue.put(None)
+
+    async def _execute_parallel(self, plan: Plan, steps: List[Step], message: Message) -> AsyncGenerator[Event, None]:
+        """并行执行多个相互独立的步骤 并将事件合并为一个事件流"""
+        queue: asyncio.Queue[Optional[Tuple[int, Event]]] = asyncio.Queue()
+        agents = [self._agent_factory() for _ in steps]
+        tasks = [
+            asyncio.create_task(self._run_step(idx, plan, step, agents[idx], message, queue))
+            for idx, step in enumerate(steps)
+        ]
+
+        waiting: Optional[Tuple[int, Event]] = None  # 需要等待用户输入的步骤索引以及等待事件
+        try:
+            finished = 0
+            while finished < len(tasks):
+                item = await queue.get()
+                if item is None:
+                    finished += 1
+                    continue
+                if isinstance(item[1], WaitEvent):
+                    waiting = item
+                    break
+                yield item[1]
+        finally:
+            # 提前结束(等待用户输入/调用方关闭)时取消尚未完成的步骤 并恢复为待执行状态(等待用户输入的步骤除外)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for idx, step in enumerate(steps):
+                if step.status == ExecutionStatus.RUNNING and (waiting is None or idx != waiting[0]):
+                    step.status = ExecutionStatus.PENDING
+
+        # 步骤需要等待用户输入：已完成步骤的结果以及等待中步骤的记忆交给主Agent 用户回复后由主Agent继续执行该步骤
+        if waiting is not None:
+            idx, wait_event = waiting
+            await self._hand_over(steps, steps[idx], agents[idx])
+            await self._react_agent.save_checkpoint(plan)
+            yield wait_event
+
+    async def _hand_over(self, steps: List[Step], waiting_step: Step, agent: ReActAgent) -> None:
+        """将同一批中已完成步骤的结果以及等待用户输入的Agent记忆(不含系统提示词)追加到主Agent的记忆中"""
+        context = []
+        for step in steps:
+            if step is not waiting_step and step.done:
+                context.extend(self._get_step_messages(step))
+        context.extend(message for message in agent.memory.get_messages() if message.get("role") != "system")
+        await self._react_agent.add_messages(context)
+
+    def _get_resume_step(self, plan: Plan) -> Optional[Step]:
+        """从检查点恢复时找出可以继续执行的步骤 其余崩溃前执行中的步骤恢复为待执行状态"""
+        running = [step for step in plan.steps if step.status == ExecutionStatus.RUNNING]
+        last_message = self._react_agent.memory.get_last_message()
+
+        # 只有主Agent的记忆停留在工具调用/工具结果上时 才能基于已有的工具结果继续执行(未完成的工具由Agent继续执行)
+        resume_step = None
+        if len(running) == 1 and last_message and (last_message.get("role") == "tool" or last_message.get("tool_calls")):
+            resume_step = running[0]
+        for step in running:
+            if step is not resume_step:
+                step.status = ExecutionStatus.PENDING
+        return resume_step
+
+    async def execute(self, plan: Plan, message: Message) -> AsyncGenerator[Event, None]:
+        """按照依赖关系执行计划中的所有步骤 每批步骤执行完成后更新计划"""
+        plan.status = ExecutionStatus.RUNNING
+        resume_step = self._get_resume_step(plan)
+        while True:
+            # 1.获取就绪步骤 没有就绪步骤说明计划执行结束(或者存在无法满足的依赖)
+            steps = [resume_step] if resume_step else plan.get_ready_steps()[:self._max_parallel_steps]
+            if not steps:
+                break
+
+            # 2.单个步骤沿用主Agent执行 多个步骤在独立Agent上并行执行
+            if len(steps) == 1:
+                events = self._react_agent.execute_step(plan, steps[0], message, resume=resume_step is not None)
+            else:
+                logger.info(f"并行执行{len(steps)}个步骤：{[step.id for step in steps]}")
+                events = self._execute_parallel(plan, steps, message)
+            resume_step = None
+
+            async for event in events:
+                yield event
+                if isinstance(event, WaitEvent):
+                    await events.aclose()
+                    return
+                # 步骤开始执行时记录计划中的步骤状态
+                if isinstance(event, StepEvent) and event.status == StepEventStatus.STARTED:
+                    await self._react_agent.save_checkpoint(plan)
+
+            # 3.并行步骤的执行结果合并回主Agent的记忆
+            if len(steps) > 1:
+                context = []
+                for step in steps:
+                    context.extend(self._get_step_messages(step))
+                await self._react_agent.add_messages(context)
+
+            # 4.根据本批步骤的执行结果更新计划 需要LLM重新规划时在更新期间推测下一个步骤的第一次LLM请求
+            batch = steps[0] if len(steps) == 1 else steps
+            next_steps = plan.get_ready_steps()
+            if len(next_steps) == 1 and self._planner.should_replan(plan, batch):
+                self._react_agent.prefetch_step(plan, next_steps[0], message)
+            async for event in self._planner.update_plan(plan, batch):
+                yield event
+            await self._planner.save_checkpoint()
+            await self._react_agent.save_checkpoint(plan)
+
+        # 5.仍然存在未执行的步骤说明依赖无法满足
+        if plan.get_next_step() is not None:
+            plan.status = ExecutionStatus.FAILED
+            plan.error = "计划中存在无法满足的步骤依赖"
+            yield ErrorEvent(error=plan.error)
+            return
+
+        plan.status = ExecutionStatus.COMPLETED
+        if self._react_agent.speculation_stats:
+            logger.info(f"计划执行结束，推测执行统计：{self._react_agent.speculation_stats}")
+        await self._react_agent.save_checkpoint(plan)
+        yield PlanEvent(plan=plan, status=PlanEventStatus.COMPLETED)
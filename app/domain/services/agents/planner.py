@@ -1,14 +1,19 @@
+import json
 import logging
-from typing import Optional, AsyncGenerator
+import re
+from typing import Optional, AsyncGenerator, Union, List
 
 from app.domain.models.event import Event, MessageEvent, PlanEvent, PlanEventStatus, BaseEvent
 from app.domain.models.message import Message
-from app.domain.models.plan import Plan, Step
+from app.domain.models.plan import Plan, Step, ExecutionStatus
 from app.domain.services.agents.base import BaseAgent
 from app.domain.services.prompts import PLANNER_SYSTEM_PROMPT, SYSTEM_PROMPT, CREATE_PLAN_PROMPT, UPDATE_PLAN_PROMPT
 
 logger = logging.getLogger(__name__)
 
+# 步骤描述中提到的文件名/路径 用于判断后续步骤期望的产物是否已经产生
+ARTIFACT_PATTERN = re.compile(r"[\w\-/]+\.[A-Za-z][A-Za-z0-9]{0,7}\b", re.ASCII)
+
 """
 多Agent系统 = PlannerAgent + ReActAgent
 
@@ -47,8 +52,8 @@ class PlanAgent(BaseAgent):
 
         # 调用invoke函数返回迭代事件
         async for event in self.invoke(query):
-            # 规划智能体因为使用json_object，正常情况不会返回MessageEvent
-            if isinstance(event, MessageEvent):
+            # 规划智能体因为使用json_object，正常情况只会返回最终的MessageEvent(流式增量片段直接透传)
+            if isinstance(event, MessageEvent) and not event.partial:
                 # 记录日志并使用json解析器解析得到对应的数据
                 logger.info(f"规划智能体生成消息：{event.message}")
                 parsed_obj = await self._json_parser.invoke(event.message)
@@ -61,18 +66,60 @@ class PlanAgent(BaseAgent):
             else:
                 yield event
 
-    async def update_plan(self, plan: Plan, step: Step) -> AsyncGenerator[BaseEvent, None]:
-        """根据传递的原始规划+子步骤更新事件"""
+    @classmethod
+    def _get_artifacts(cls, text: str) -> set:
+        """提取文本中提到的文件名(不含目录)"""
+        return {path.rsplit("/", 1)[-1] for path in ARTIFACT_PATTERN.findall(text)}
+
+    @classmethod
+    def _needs_replan(cls, plan: Plan, steps: List[Step]) -> bool:
+        """判断步骤执行后是否需要LLM重新规划，步骤偏离预期(失败/报错/没有结果)或者后续步骤期望的产物缺失时才需要"""
+        for step in steps:
+            # 1.步骤本身偏离预期
+            if step.status == ExecutionStatus.FAILED or not step.success or step.error or not step.result:
+                return True
+
+            # 2.步骤描述中承诺的产物(文件名/路径)同时被依赖该步骤的后续步骤引用，但没有出现在结果和附件中
+            expected = cls._get_artifacts(step.description)
+            if not expected:
+                continue
+            produced = " ".join([step.result, *step.attachments])
+            for later in plan.steps:
+                if later.done or all(dep is not step for dep in plan.get_dependencies(later)):
+                    continue
+                missing = [name for name in expected & cls._get_artifacts(later.description) if name not in produced]
+                if missing:
+                    logger.info(f"步骤{later.id}依赖的产物{missing}没有出现在步骤{step.id}的结果中，需要重新规划")
+                    return True
+
+        # 步骤全部成功并且后续步骤依赖的产物都已经产生时 后续步骤按原计划执行即可
+        return False
+
+    def should_replan(self, plan: Plan, step: Union[Step, List[Step]]) -> bool:
+        """判断更新计划时是否需要调用LLM重新规划 未开启快速路径时总是需要"""
+        steps = [step] if isinstance(step, Step) else step
+        return not self._agent_config.skip_unneeded_replan or self._needs_replan(plan, steps)
+
+    async def update_plan(self, plan: Plan, step: Union[Step, List[Step]]) -> AsyncGenerator[BaseEvent, None]:
+        """根据传递的原始规划+子步骤更新事件 并行执行的多个子步骤可以以列表的形式一次性传递"""
+        # 0.开启快速路径时 步骤顺利完成则直接沿用原计划 省去一次完整的LLM调用
+        if not self.should_replan(plan, step):
+            logger.info("步骤顺利完成，跳过重新规划")
+            yield PlanEvent(plan=plan, status=PlanEventStatus.UPDATED)
+            return
+
         # 1.使用plan+step创建更新Plan提示词
         query = UPDATE_PLAN_PROMPT.format(
             plan=plan.model_dump_json(),
-            step=step.model_dump_json(),
+            step=step.model_dump_json() if isinstance(step, Step) else json.dumps(
+                [item.model_dump(mode="json") for item in step], ensure_ascii=False,
+            ),
         )
 
         # 2.调用invoke获取对应的事件
         async for event in self.invoke(query):
             # 3.判断规划Agent生成的事件是不是消息事件
-            if isinstance(event, MessageEvent):
+            if isinstance(event, MessageEvent) and not event.partial:
                 # 4.记录日志并解析json
                 logger.info(f"PlannerAgent生成消息: {event.message}")
                 parsed_obj = await self._json_parser.invoke(event.message)
@@ -92,9 +139,11 @@ class PlanAgent(BaseAgent):
 
                 # 8.判断是否有未完成的步骤，如果有则执行更新
                 if first_pending_index is not None:
-                    # 9.获取历史已完成的子步骤并更新
-                    updated_steps = plan.steps[:first_pending_index]
-                    updated_steps.extend(new_steps)
+                    # 9.获取历史已完成的子步骤并更新 并行执行时已完成的步骤不一定都在第一个未完成步骤之前
+                    done_steps = [step for step in plan.steps if step.done]
+                    done_ids = {step.id for step in done_steps}
+                    updated_steps = done_steps
+                    updated_steps.extend(step for step in new_steps if step.id not in done_ids)
 
                     # 10.更新plan规划
                     plan.steps = updated_steps
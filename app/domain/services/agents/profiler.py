@@ -0,0 +1,173 @@
+"""
+Agent运行剖析器的设计思路：
+1. 一次Agent运行(invoke/resume)由多次迭代组成，每次迭代包含一次LLM调用以及随后的json解析、工具分发和各个工具的执行
+2. 每个阶段以span的形式计时，span结束时立即累加到所在迭代的耗时分解中，不保留span对象，长会话中内存占用不会增长
+   - 流式解析工具参数这类高频的细粒度操作不创建span，直接累加耗时(add)
+   - 流式调用LLM时只统计等待下一个片段的耗时(iterate)，调用方处理片段的耗时不计入LLM调用
+3. 安装了opentelemetry时同步创建OpenTelemetry span(运行 -> 迭代 -> 阶段)，导出目标由应用配置的TracerProvider决定，
+   未配置时为no-op实现，开销可以忽略
+4. 运行结束时汇总为每次迭代的耗时分解和token数，由ReActAgent以ProfileEvent的形式返回
+"""
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Iterator, AsyncGenerator
+
+try:
+    from opentelemetry import trace
+except ImportError:  # pragma: no cover - opentelemetry为可选依赖
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+TOOL_SPAN = "tool"  # 单个工具执行的span名称 按照工具名分别汇总
+
+
+class RunProfiler:
+    """Agent运行剖析器 记录每次迭代中LLM调用、json解析、工具分发和工具执行的耗时以及token数"""
+
+    def __init__(self, tracer_name: str = "app.agent") -> None:
+        self._tracer = trace.get_tracer(tracer_name) if trace is not None else None
+        self._name = ""
+        self._trace_id = ""
+        self._started = 0.0
+        self._iterations: List[Dict[str, Any]] = []
+        self._root_span = None  # OpenTelemetry的运行span
+        self._iteration_span = None  # OpenTelemetry的迭代span
+
+    @property
+    def trace_id(self) -> str:
+        """只读属性 返回当前运行的追踪ID"""
+        return self._trace_id
+
+    def _start_otel_span(self, name: str, parent: Any, attributes: Optional[Dict[str, Any]] = None) -> Any:
+        """创建OpenTelemetry span 未安装opentelemetry时返回None"""
+        if self._tracer is None:
+            return None
+        context = trace.set_span_in_context(parent) if parent is not None else None
+        return self._tracer.start_span(name, context=context, attributes=attributes)
+
+    @classmethod
+    def _end_otel_span(cls, span: Any) -> None:
+        """结束OpenTelemetry span"""
+        if span is not None:
+            span.end()
+
+    def start(self, name: str) -> None:
+        """开始一次新的运行 上一次未结束的运行会被直接丢弃"""
+        self._end_otel_span(self._iteration_span)
+        self._end_otel_span(self._root_span)
+        self._name = name
+        self._trace_id = uuid.uuid4().hex
+        self._started = time.perf_counter()
+        self._iterations = []
+        self._iteration_span = None
+        self._root_span = self._start_otel_span(f"agent.{name}", None, {"agent.name": name})
+        if self._root_span is not None and self._root_span.get_span_context().is_valid:
+            # 配置了TracerProvider时使用OpenTelemetry的追踪ID 便于和导出的trace关联
+            self._trace_id = format(self._root_span.get_span_context().trace_id, "032x")
+
+    def begin_iteration(self) -> None:
+        """开始一次新的迭代 后续的耗时和token数都记录到该迭代中"""
+        self._end_otel_span(self._iteration_span)
+        self._iterations.append({
+            "index": len(self._iterations) + 1,
+            "llm": 0.0,
+            "json_parse": 0.0,
+            "tool_dispatch": 0.0,
+            "tools": {},
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        })
+        self._iteration_span = self._start_otel_span(
+            "agent.iteration", self._root_span, {"agent.iteration": len(self._iterations)},
+        )
+
+    def _current_iteration(self) -> Dict[str, Any]:
+        """获取当前的迭代 没有调用begin_iteration时自动开始一次迭代"""
+        if not self._iterations:
+            self.begin_iteration()
+        return self._iterations[-1]
+
+    def add(self, name: str, seconds: float, tool_name: Optional[str] = None) -> None:
+        """将一段耗时(秒)累加到当前迭代 工具执行的耗时按照工具名分别累加"""
+        iteration = self._current_iteration()
+        ms = seconds * 1000
+        if name == TOOL_SPAN:
+            iteration["tools"][tool_name] = iteration["tools"].get(tool_name, 0.0) + ms
+        else:
+            iteration[name] = iteration.get(name, 0.0) + ms
+
+    @contextmanager
+    def span(self, name: str, tool_name: Optional[str] = None, **attributes: Any) -> Iterator[None]:
+        """记录一个阶段的耗时 name为llm/json_parse/tool_dispatch/tool，工具执行需要传递tool_name"""
+        self._current_iteration()
+        if tool_name is not None:
+            attributes["tool.name"] = tool_name
+        otel_span = self._start_otel_span(f"agent.{name}", self._iteration_span, attributes)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, tool_name)
+            self._end_otel_span(otel_span)
+
+    async def iterate(self, name: str, stream: AsyncGenerator[Any, None]) -> AsyncGenerator[Any, None]:
+        """迭代异步生成器 只统计等待生成器产生下一项的耗时，不包含调用方处理每一项的耗时(例如流式输出)"""
+        self._current_iteration()
+        otel_span = self._start_otel_span(f"agent.{name}", self._iteration_span, {"agent.stream": True})
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = await anext(stream)
+                except StopAsyncIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self.add(name, elapsed)
+            self._end_otel_span(otel_span)
+
+    def record_usage(self, usage: Optional[Dict[str, Any]]) -> None:
+        """记录一次LLM调用的token数"""
+        if not usage:
+            return
+        iteration = self._current_iteration()
+        iteration["prompt_tokens"] += usage.get("prompt_tokens") or 0
+        iteration["completion_tokens"] += usage.get("completion_tokens") or 0
+
+    def finish(self) -> Dict[str, Any]:
+        """结束当前运行 返回每次迭代的耗时分解(毫秒)以及汇总结果"""
+        totals: Dict[str, float] = {"llm": 0.0, "json_parse": 0.0, "tool_dispatch": 0.0, "tools": 0.0}
+        for iteration in self._iterations:
+            for key in ("llm", "json_parse", "tool_dispatch"):
+                iteration[key] = round(iteration[key], 3)
+                totals[key] += iteration[key]
+            iteration["tools"] = {name: round(ms, 3) for name, ms in iteration["tools"].items()}
+            totals["tools"] += sum(iteration["tools"].values())
+
+        profile = {
+            "name": self._name,
+            "trace_id": self._trace_id,
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 3) if self._started else 0.0,
+            "prompt_tokens": sum(iteration["prompt_tokens"] for iteration in self._iterations),
+            "completion_tokens": sum(iteration["completion_tokens"] for iteration in self._iterations),
+            "totals": {key: round(value, 3) for key, value in totals.items()},
+            "iterations": self._iterations,
+        }
+
+        # 结束OpenTelemetry span 汇总结果同时写入运行span的属性
+        if self._root_span is not None:
+            self._root_span.set_attribute("agent.duration_ms", profile["duration_ms"])
+            self._root_span.set_attribute("agent.prompt_tokens", profile["prompt_tokens"])
+            self._root_span.set_attribute("agent.completion_tokens", profile["completion_tokens"])
+        self._end_otel_span(self._iteration_span)
+        self._end_otel_span(self._root_span)
+        self._iteration_span, self._root_span = None, None
+        self._iterations = []
+        logger.debug(f"{self._name}运行剖析：{profile['totals']}")
+        return profile
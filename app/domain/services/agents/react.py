@@ -1,9 +1,10 @@
 import logging
+from typing import Optional
 
 from typing_extensions import AsyncGenerator
 
 from app.domain.models.event import Event, StepEventStatus, StepEvent, ToolEvent, ToolEventStatus, MessageEvent, \
-    WaitEvent, ErrorEvent
+    WaitEvent, ErrorEvent, ProfileEvent
 from app.domain.models.file import File
 from app.domain.models.message import Message
 from app.domain.models.plan import Plan, Step, ExecutionStatus
@@ -19,28 +20,46 @@ class ReActAgent(BaseAgent):
     _system_prompt: str = SYSTEM_PROMPT
     _format = "json_object"
 
-    async def execute_step(self, plan: Plan, step: Step, message: Message) -> AsyncGenerator[Event, None]:
-        """根据传递的消息+规划+子步骤执行相应的子步骤"""
-        # 1. 根据传递的内容生成消息
-        query = EXECUTION_PROMPT.format(
+    @classmethod
+    def _build_step_query(cls, plan: Plan, step: Step, message: Message) -> str:
+        """根据传递的消息+规划+子步骤生成执行子步骤的提示词"""
+        return EXECUTION_PROMPT.format(
             message=message.message,
             attachments=message.attachments,
             language=plan.language,
             step=step.description
         )
 
+    def _get_profile_event(self, step: Step) -> Optional[ProfileEvent]:
+        """结束本次运行剖析 开启剖析时返回步骤对应的剖析事件"""
+        profile = self._profiler.finish()
+        if not self._agent_config.profile:
+            return None
+        return ProfileEvent(step_id=step.id, speculation=self.speculation_stats, **profile)
+
+    def prefetch_step(self, plan: Plan, step: Step, message: Message) -> None:
+        """推测执行 提前发起执行子步骤时的第一次LLM请求"""
+        self.prefetch([{"role": "user", "content": self._build_step_query(plan, step, message)}])
+
+    async def execute_step(
+            self, plan: Plan, step: Step, message: Message, resume: bool = False,
+    ) -> AsyncGenerator[Event, None]:
+        """根据传递的消息+规划+子步骤执行相应的子步骤 resume为True时基于检查点恢复的记忆继续执行该步骤"""
+        # 1. 根据传递的内容生成消息
+        query = self._build_step_query(plan, step, message)
+
         # 2.更新步骤的执行状态并返回Step事件
         step.status = ExecutionStatus.RUNNING
         yield StepEvent(step=step, status=StepEventStatus.STARTED)
 
-        # 调用invoke获取Agent返回的事件内容
-        async for event in self.invoke(query):
+        # 调用invoke获取Agent返回的事件内容 恢复执行时不再重复发送步骤提示词
+        async for event in (self.resume() if resume else self.invoke(query)):
             # 判断事件类型执行不同操作
             if isinstance(event, ToolEvent):
                 # 工具事件需要判断工具的名称是否等于message_ask_user
                 if event.function_name == "message_ask_user":
                     # 工具如果在调用中 我们需要返回一条消息告知用户需要用户处理什么
-                    if event.status == ToolEventStatus.CALLING:
+                    if event.status == ToolEventStatus.CALLING and not event.partial:
                         # todo 用户message_ask_user工具还没有实现 所以参数未定 暂时定位next
                         yield MessageEvent(
                             role="assistant",
@@ -48,10 +67,13 @@ class ReActAgent(BaseAgent):
                         )
                     elif event.status == ToolEventStatus.CALLED:
                         # 如果工具事件为已调用 则需要返回等待事件并中断程序
+                        profile_event = self._get_profile_event(step)
+                        if profile_event:
+                            yield profile_event
                         yield WaitEvent()
                         return
                     continue
-            elif isinstance(event, MessageEvent):
+            elif isinstance(event, MessageEvent) and not event.partial:
                 # 返回事件消息 意味着content有内容 content有内容说明Agent已经执行完毕
                 step.status = ExecutionStatus.COMPLETED
 
@@ -85,6 +107,11 @@ class ReActAgent(BaseAgent):
         # 循环迭代之后说明子步骤已经完成 需要更新状态
         step.status = ExecutionStatus.COMPLETED
 
+        # 开启剖析时返回本次步骤执行的耗时分解
+        profile_event = self._get_profile_event(step)
+        if profile_event:
+            yield profile_event
+
     async def summarize(self) -> AsyncGenerator[Event, None]:
         """调用Agent汇总历史的消息并生成最终的恢复+附件"""
         # 构建请求query
@@ -93,7 +120,7 @@ class ReActAgent(BaseAgent):
         # 调用invoke方法获取Agent生成的事件
         async for event in self.invoke(query):
             # 判断事件类型是否为消息事件 如果是则表示Agent结构化生成汇总的内容
-            if isinstance(event, MessageEvent):
+            if isinstance(event, MessageEvent) and not event.partial:
                 # 记录日志并解析
                 logger.info(f"执行Agent生成汇总内容：{event.message}")
                 parsed_obj = await self._json_parser.invoke(event.message)
@@ -0,0 +1,117 @@
+"""
+Agent重试策略的设计思路：
+1. 根据错误类型判断是否值得重试：请求参数错误(400等)、工具不存在/参数不匹配这类错误重试也不会成功，直接放弃
+2. 重试间隔使用去相关抖动(decorrelated jitter)：delay = min(max_delay, random(base_delay, 上一次delay * 3))
+   - 间隔随失败次数指数增长，同时随机化避免大量会话在服务抖动后同一时刻集中重试(惊群)
+3. 服务端返回了Retry-After时，等待时间不少于服务端建议的时间
+4. 同一个会话的所有Agent共享一个重试预算，预算耗尽后不再重试，避免服务故障期间单个会话无限放大请求量
+"""
+import asyncio
+import logging
+import random
+from typing import Optional
+
+from app.domain.external.llm import LLMError
+
+logger = logging.getLogger(__name__)
+
+# 重试也不会成功的异常类型 通常是调用方传递的参数有误
+NON_RETRYABLE_EXCEPTIONS = (ValueError, TypeError, KeyError)
+
+
+class RetryBudget:
+    """会话级别的重试预算 同一会话内的多个Agent共享"""
+
+    def __init__(self, max_retries: int) -> None:
+        self._remaining = max_retries
+
+    @property
+    def remaining(self) -> int:
+        """只读属性 返回剩余的重试次数"""
+        return self._remaining
+
+    def acquire(self) -> bool:
+        """消耗一次重试机会 预算耗尽时返回False"""
+        if self._remaining <= 0:
+            return False
+        self._remaining -= 1
+        return True
+
+
+class RetryPolicy:
+    """重试策略 负责错误分类和退避时间的计算"""
+
+    def __init__(
+            self,
+            max_attempts: int,
+            base_delay: float = 0.5,
+            max_delay: float = 20.0,
+            budget: Optional[RetryBudget] = None,
+    ) -> None:
+        """构造函数 传递最大尝试次数+基础间隔+最大间隔+会话级重试预算"""
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._budget = budget
+
+    @property
+    def max_attempts(self) -> int:
+        """只读属性 返回最大尝试次数"""
+        return self._max_attempts
+
+    @property
+    def budget(self) -> Optional[RetryBudget]:
+        """只读属性 返回会话级重试预算"""
+        return self._budget
+
+    @classmethod
+    def is_retryable(cls, error: BaseException) -> bool:
+        """判断错误是否值得重试"""
+        if isinstance(error, LLMError):
+            return error.retryable
+        return not isinstance(error, NON_RETRYABLE_EXCEPTIONS)
+
+    def next_delay(self, error: BaseException, prev_delay: Optional[float] = None) -> float:
+        """使用去相关抖动计算下一次重试的等待时间 并保证不少于服务端建议的Retry-After"""
+        prev_delay = prev_delay or self._base_delay
+        delay = min(self._max_delay, random.uniform(self._base_delay, prev_delay * 3))
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def start(self) -> "RetryState":
+        """开始一次新的重试流程"""
+        return RetryState(self)
+
+
+class RetryState:
+    """单次调用的重试状态 记录已经尝试的次数和上一次的等待时间"""
+
+    def __init__(self, policy: RetryPolicy) -> None:
+        self._policy = policy
+        self._attempts = 0
+        self._delay: Optional[float] = None
+
+    @property
+    def attempts(self) -> int:
+        """只读属性 返回已经失败的次数"""
+        return self._attempts
+
+    async def backoff(self, error: BaseException) -> bool:
+        """记录一次失败 如果允许重试则等待退避时间后返回True，否则立即返回False"""
+        self._attempts += 1
+
+        if not self._policy.is_retryable(error):
+            logger.warning(f"错误不可重试，放弃重试：{type(error).__name__}: {error}")
+            return False
+        if self._attempts >= self._policy.max_attempts:
+            return False
+        if self._policy.budget is not None and not self._policy.budget.acquire():
+            logger.warning("会话重试预算已经耗尽，放弃重试")
+            return False
+
+        self._delay = self._policy.next_delay(error, self._delay)
+        logger.info(f"第{self._attempts}次失败，{self._delay:.2f}秒后重试")
+        await asyncio.sleep(self._delay)
+        return True
@@ -0,0 +1,107 @@
+"""
+推测执行的设计思路：
+1. Agent在等待其他耗时操作(例如规划Agent更新计划)时，LLM处于空闲状态，可以根据当前状态提前发起“最可能的下一次LLM请求”
+2. 推测请求以完整的请求内容(消息列表、工具声明、响应格式、工具选择)计算指纹，真正发起请求时如果指纹完全一致则直接复用推测结果
+3. 状态发生偏离(计划被修改、记忆被压缩等)时指纹不一致，推测结果被丢弃并取消尚未完成的推测请求
+4. 推测请求会额外消耗LLM调用，因此只在开启配置后生效，并统计命中率用于评估收益
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+from typing import List, Dict, Any, Optional
+
+from app.domain.external.llm import LLM
+
+logger = logging.getLogger(__name__)
+
+
+class Speculator:
+    """推测执行器 提前发起可能的下一次LLM请求 并在真正发起请求时按指纹匹配复用"""
+
+    def __init__(self, llm: LLM) -> None:
+        self._llm = llm
+        self._pending: Dict[str, asyncio.Task] = {}  # 请求指纹 -> 推测请求任务
+        self._issued = 0  # 发起的推测请求数
+        self._hits = 0  # 被复用的推测请求数
+        self._discarded = 0  # 状态偏离被丢弃的推测请求数
+
+    @classmethod
+    def fingerprint(cls,
+                    message: List[Dict[str, Any]],
+                    tools: List[Dict[str, Any]] = None,
+                    response_format: Dict[str, Any] = None,
+                    tool_choice: str = None,
+                    ) -> str:
+        """计算请求指纹 请求内容完全一致时指纹才一致"""
+        data = json.dumps(
+            [message, tools or [], response_format, tool_choice],
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """只读属性 返回推测执行的命中统计"""
+        return {
+            "issued": self._issued,
+            "hits": self._hits,
+            "discarded": self._discarded,
+            "pending": len(self._pending),
+            "hit_rate": self._hits / self._issued if self._issued else 0.0,
+        }
+
+    def prefetch(self,
+                 message: List[Dict[str, Any]],
+                 tools: List[Dict[str, Any]] = None,
+                 response_format: Dict[str, Any] = None,
+                 tool_choice: str = None,
+                 parallel_tool_calls: bool = False,
+                 ) -> None:
+        """在后台提前发起一次LLM请求 消息会被深拷贝避免后续记忆修改影响推测请求"""
+        message = copy.deepcopy(message)
+        key = self.fingerprint(message, tools, response_format, tool_choice)
+        if key in self._pending:
+            return
+
+        task = asyncio.create_task(self._llm.invoke(
+            message=message,
+            tools=tools,
+            response_format=response_format,
+            tool_choice=tool_choice,
+            parallel_tool_calls=parallel_tool_calls,
+        ))
+        # 被丢弃的推测请求可能以异常结束 提前取出异常避免事件循环打印未处理异常的警告
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._pending[key] = task
+        self._issued += 1
+        logger.debug(f"发起推测请求：{key}")
+
+    def take(self,
+             message: List[Dict[str, Any]],
+             tools: List[Dict[str, Any]] = None,
+             response_format: Dict[str, Any] = None,
+             tool_choice: str = None,
+             ) -> Optional[asyncio.Task]:
+        """取出与本次请求指纹一致的推测请求 其余推测请求说明状态已经偏离，全部丢弃"""
+        if not self._pending:
+            return None
+
+        key = self.fingerprint(message, tools, response_format, tool_choice)
+        task = self._pending.pop(key, None)
+        if task is not None:
+            self._hits += 1
+            logger.info(f"推测请求命中：{key}")
+        self.discard()
+        return task
+
+    def discard(self) -> None:
+        """丢弃并取消所有尚未被复用的推测请求"""
+        for task in self._pending.values():
+            if not task.done():
+                task.cancel()
+            self._discarded += 1
+        self._pending.clear()
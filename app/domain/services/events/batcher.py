@@ -0,0 +1,108 @@
+"""
+事件批量发布器的设计思路：
+1. Agent产生的事件中，流式输出的增量消息和工具的CALLING/CALLED事件频率最高，逐个序列化并写入输出流时，
+   每个事件都需要一次Redis往返，大量会话同时输出时CPU和网络开销主要消耗在这里
+2. 高频事件先写入缓冲区，缓冲区达到批大小或者等待超过最大延迟时统一刷新，一批事件只产生一次pipeline往返(put_batch)
+   - 相邻的增量消息片段合并为一个片段，减少写入输出流的条目数
+3. 计划/步骤/等待/错误/结束等低频事件会改变任务状态，写入时立即刷新缓冲区，保证这些事件不会被延迟并且顺序不变
+4. 事件使用按照type区分的TypeAdapter紧凑序列化(dumps_event)，不输出值为None的字段
+"""
+import asyncio
+import logging
+from typing import List, Optional, AsyncGenerator, Dict
+
+from app.domain.external.message_queue import MessageQueue
+from app.domain.models.event import Event, MessageEvent, ToolEvent, dumps_event
+
+logger = logging.getLogger(__name__)
+
+
+class EventBatcher:
+    """将Agent事件合并为批次后写入任务输出流"""
+
+    def __init__(
+            self,
+            queue: MessageQueue,  # 任务的输出流
+            max_batch_size: int = 64,  # 单批最多的事件数 达到后立即刷新
+            max_delay: float = 0.05,  # 高频事件在缓冲区中最多等待的秒数
+    ) -> None:
+        self._queue = queue
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._buffer: List[Event] = []
+        self._lock = asyncio.Lock()  # 保证多次刷新按照顺序写入
+        self._flush_task: Optional[asyncio.Task] = None  # 延迟刷新任务
+        self._published = 0  # 收到的事件数
+        self._coalesced = 0  # 被合并掉的增量消息数
+        self._batches = 0  # 写入输出流的批次数
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """只读属性 返回批量发布的统计信息"""
+        return {
+            "published": self._published,
+            "coalesced": self._coalesced,
+            "batches": self._batches,
+        }
+
+    @classmethod
+    def _is_high_frequency(cls, event: Event) -> bool:
+        """判断事件是否为可以延迟批量写入的高频事件"""
+        return isinstance(event, ToolEvent) or (isinstance(event, MessageEvent) and event.partial)
+
+    def _coalesce(self, event: Event) -> bool:
+        """尝试将增量消息合并到缓冲区的最后一个增量消息中 合并成功返回True"""
+        if not (isinstance(event, MessageEvent) and event.partial and self._buffer):
+            return False
+        last = self._buffer[-1]
+        if not (isinstance(last, MessageEvent) and last.partial and last.role == event.role):
+            return False
+        self._buffer[-1] = last.model_copy(update={"message": last.message + event.message})
+        self._coalesced += 1
+        return True
+
+    async def publish(self, event: Event) -> None:
+        """发布一个事件 高频事件进入缓冲区，低频事件连同缓冲区一起立即写入"""
+        self._published += 1
+        if not self._coalesce(event):
+            self._buffer.append(event)
+
+        # 低频事件或者缓冲区已满时立即刷新 否则等待延迟刷新
+        if not self._is_high_frequency(event) or len(self._buffer) >= self._max_batch_size:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def publish_stream(self, events: AsyncGenerator[Event, None]) -> AsyncGenerator[Event, None]:
+        """发布事件流中的所有事件 并将事件原样返回给调用方，事件流结束时刷新缓冲区"""
+        try:
+            async for event in events:
+                await self.publish(event)
+                yield event
+        finally:
+            await self.close()
+
+    async def _flush_later(self) -> None:
+        """等待最大延迟后刷新缓冲区"""
+        await asyncio.sleep(self._max_delay)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """将缓冲区中的事件序列化后通过一次pipeline写入输出流"""
+        # 取消等待中的延迟刷新 当前刷新会带上缓冲区中的所有事件
+        if self._flush_task is not None and self._flush_task is not asyncio.current_task():
+            self._flush_task.cancel()
+        self._flush_task = None
+
+        async with self._lock:
+            if not self._buffer:
+                return
+            events, self._buffer = self._buffer, []
+            await self._queue.put_batch([dumps_event(event) for event in events])
+            self._batches += 1
+            logger.debug(f"批量写入{len(events)}个事件到输出流")
+
+    async def close(self) -> None:
+        """刷新缓冲区中剩余的事件"""
+        await self.flush()
@@ -0,0 +1,154 @@
+"""
+上下文窗口管理器的设计思路：
+1. Memory在添加消息的时候就会估算每条消息的token数，管理器只需要读取累计值，不需要每次重新计算整个历史
+2. 每个模型的上下文窗口大小不同，预算 = 上下文窗口 - 预留的输出token - 工具声明占用的token
+3. 超出预算时按照代价从低到高依次处理：
+    - 先省略较早的可压缩工具结果(browser_view/search_web等)，保留最近几次的结果
+    - 再截断较早的超长工具结果
+    - 最后按轮次删除最早的对话(保留系统提示词和首条用户消息)
+4. 工具消息必须和携带tool_calls的assistant消息成对出现，所以只替换工具消息的内容，删除时按轮次整体删除
+5. 每次压缩都会改写历史，导致LLM服务端的前缀缓存失效，可以通过low_watermark让压缩带有滞后性：
+   超出预算后一次性压缩到预算*low_watermark以下，之后的若干轮迭代都不会再触发压缩，保持前缀字节稳定
+"""
+import json
+import logging
+from typing import Optional, Dict, List, Any
+
+from app.domain.models.memory import Memory, COMPACTABLE_FUNCTIONS
+
+logger = logging.getLogger(__name__)
+
+# 常见模型的上下文窗口大小(token)，按照模型名前缀匹配
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "deepseek-chat": 128000,
+    "deepseek-reasoner": 128000,
+    "gpt-4.1": 1000000,
+    "gpt-4o": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5": 16385,
+    "qwen": 128000,
+    "moonshot": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 64000  # 未知模型的默认上下文窗口
+
+ELIDED_CONTENT = "(removed)"  # 被省略的工具结果内容
+
+
+def get_context_window(model_name: str) -> int:
+    """根据模型名字获取上下文窗口大小 优先匹配更长的前缀"""
+    for prefix in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model_name and model_name.startswith(prefix):
+            return MODEL_CONTEXT_WINDOWS[prefix]
+    return DEFAULT_CONTEXT_WINDOW
+
+
+class ContextManager:
+    """上下文窗口管理器 在每次调用LLM之前将记忆控制在模型的token预算内"""
+
+    def __init__(
+            self,
+            model_name: str,
+            max_context_tokens: Optional[int] = None,
+            reserved_tokens: int = 0,
+            keep_recent_tool_results: int = 3,
+            truncate_chars: int = 2000,
+            low_watermark: float = 1.0,
+    ) -> None:
+        """构造函数 传递模型名字+手动指定的上下文预算+预留输出token+保留最近工具结果数+截断长度+触发压缩后的目标水位"""
+        context_window = max_context_tokens or get_context_window(model_name)
+        self._budget = max(context_window - reserved_tokens, 0)
+        self._low_watermark = low_watermark
+        self._keep_recent_tool_results = keep_recent_tool_results
+        self._truncate_chars = truncate_chars
+
+    @property
+    def budget(self) -> int:
+        """只读属性 返回记忆可使用的token预算"""
+        return self._budget
+
+    def fit(self, memory: Memory, extra_tokens: int = 0) -> int:
+        """将记忆压缩到预算以内，extra_tokens为工具声明等不在记忆中的额外开销，返回本次释放的token数"""
+        budget = self._budget - extra_tokens
+        before = memory.token_count
+        if before <= budget:
+            return 0
+
+        # 触发压缩后压缩到低水位以下 减少后续迭代再次改写历史的次数
+        budget = int(budget * self._low_watermark)
+
+        # 1. 省略较早的可压缩工具结果
+        self._elide_tool_results(memory, budget, compactable_only=True)
+
+        # 2. 截断较早的超长工具结果
+        if memory.token_count > budget:
+            self._elide_tool_results(memory, budget, compactable_only=False)
+
+        # 3. 按轮次删除最早的对话
+        if memory.token_count > budget:
+            self._drop_oldest_turns(memory, budget)
+
+        after = memory.token_count
+        logger.info(f"记忆超出上下文预算{budget}，压缩前{before}个token，压缩后{after}个token")
+        return before - after
+
+    def _elide_tool_results(self, memory: Memory, budget: int, compactable_only: bool) -> None:
+        """从最早的工具结果开始省略/截断 直到满足预算，最近的几次工具结果保持完整"""
+        messages = memory.get_messages()
+        tool_indexes = [idx for idx, message in enumerate(messages) if message.get("role") == "tool"]
+        if self._keep_recent_tool_results > 0:
+            tool_indexes = tool_indexes[:-self._keep_recent_tool_results]
+
+        for idx in tool_indexes:
+            if memory.token_count <= budget:
+                return
+
+            message = messages[idx]
+            content = message.get("content")
+            if content == ELIDED_CONTENT:
+                continue
+
+            if compactable_only:
+                # 可压缩的工具结果直接省略
+                if message.get("function_name") in COMPACTABLE_FUNCTIONS:
+                    memory.set_message_content(idx, ELIDED_CONTENT)
+            else:
+                # 其余工具结果保留开头部分 超出的内容截断
+                text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+                if len(text) > self._truncate_chars:
+                    memory.set_message_content(idx, f"{text[:self._truncate_chars]}...(truncated)")
+
+    @classmethod
+    def _split_turns(cls, messages: List[Dict[str, Any]], start: int) -> List[List[int]]:
+        """从start开始将消息划分为轮次，携带tool_calls的assistant消息与其后的工具消息属于同一轮"""
+        turns: List[List[int]] = []
+        for idx in range(start, len(messages)):
+            if messages[idx].get("role") == "tool" and turns:
+                turns[-1].append(idx)
+            else:
+                turns.append([idx])
+        return turns
+
+    def _drop_oldest_turns(self, memory: Memory, budget: int) -> None:
+        """保留系统提示词、首条用户消息以及最新一轮对话，从最早的轮次开始整体删除"""
+        messages = memory.get_messages()
+
+        # 计算需要保留的头部消息数量(系统提示词+首条用户消息)
+        head = 0
+        if head < len(messages) and messages[head].get("role") == "system":
+            head += 1
+        if head < len(messages) and messages[head].get("role") == "user":
+            head += 1
+
+        # 计算需要删除的轮次 最新一轮始终保留
+        turns = self._split_turns(messages, head)
+        overflow = memory.token_count - budget
+        drop_end = head
+        for turn in turns[:-1]:
+            if overflow <= 0:
+                break
+            overflow -= sum(memory.get_message_tokens(idx) for idx in turn)
+            drop_end = turn[-1] + 1
+
+        if drop_end > head:
+            memory.remove_messages(head, drop_end)
+            logger.warning(f"记忆超出上下文预算，删除了最早的{drop_end - head}条消息")
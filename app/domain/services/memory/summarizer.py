@@ -0,0 +1,177 @@
+"""
+记忆滚动摘要的设计思路：
+1. 当记忆的token数超过阈值时，将较早的对话(不含系统提示词、首条用户消息和最近几轮对话)交给更便宜的LLM压缩为一条摘要消息
+2. 摘要在后台任务中生成，不阻塞Agent的迭代，Agent在每轮迭代之间检查摘要是否完成并将其替换到记忆中
+3. 被摘要的消息在替换后会从记忆中移除，下一次摘要会把上一次的摘要消息和新的历史一起合并，因此同一段历史不会被重复摘要
+4. 摘要期间记忆可能被修改(回滚/压缩等)，替换之前需要按对象身份核对摘要区间，不一致则丢弃本次摘要
+5. 只在轮次边界切分，保证工具消息和携带tool_calls的assistant消息不会被拆开
+6. Agent每次运行结束(包括等待用户输入/被取消)时应用已完成的摘要并取消未完成的摘要任务，后台任务不会比Agent活得更久
+"""
+import asyncio
+import json
+import logging
+from typing import Optional, List, Dict, Any, Tuple
+
+from app.domain.external.llm import LLM
+from app.domain.models.memory import Memory
+from app.domain.services.prompts import MEMORY_SUMMARY_SYSTEM_PROMPT, MEMORY_SUMMARY_PROMPT, MEMORY_SUMMARY_PREFIX
+
+logger = logging.getLogger(__name__)
+
+
+class MemorySummarizer:
+    """记忆摘要器 在后台使用次级LLM将较早的历史压缩为摘要消息"""
+
+    def __init__(
+            self,
+            llm: LLM,
+            threshold_tokens: int,
+            keep_recent_turns: int = 4,
+            max_message_chars: int = 4000,
+    ) -> None:
+        """构造函数 传递次级LLM+触发摘要的token阈值+保留的最近轮次数+每条消息参与摘要的最大字符数"""
+        self._llm = llm
+        self._threshold_tokens = threshold_tokens
+        self._keep_recent_turns = keep_recent_turns
+        self._max_message_chars = max_message_chars
+        self._task: Optional[asyncio.Task] = None  # 正在执行的摘要任务
+        self._snapshot: List[Dict[str, Any]] = []  # 正在摘要的消息快照(对象引用)
+        self._summarized_ranges: List[Tuple[int, int]] = []  # 已摘要的区间(按累计消息序号记录)
+        self._summarized_count: int = 0  # 已经被摘要的原始消息数量
+
+    @property
+    def summarized_ranges(self) -> List[Tuple[int, int]]:
+        """只读属性 返回已摘要的原始消息区间[start, end)，序号按照被摘要的先后累计"""
+        return self._summarized_ranges
+
+    @property
+    def running(self) -> bool:
+        """只读属性 返回是否有正在执行的摘要任务"""
+        return self._task is not None and not self._task.done()
+
+    @classmethod
+    def _get_head(cls, messages: List[Dict[str, Any]]) -> int:
+        """计算不参与摘要的头部消息数量(系统提示词+首条用户消息)"""
+        head = 0
+        if head < len(messages) and messages[head].get("role") == "system":
+            head += 1
+        if head < len(messages) and messages[head].get("role") == "user":
+            head += 1
+        return head
+
+    @classmethod
+    def _is_summary(cls, message: Dict[str, Any]) -> bool:
+        """判断消息是否是之前生成的摘要消息"""
+        content = message.get("content")
+        return isinstance(content, str) and content.startswith(MEMORY_SUMMARY_PREFIX)
+
+    def _select_range(self, messages: List[Dict[str, Any]]) -> Optional[Tuple[int, int]]:
+        """选择需要摘要的区间[start, end)，end必须落在轮次边界上(非工具消息)，最近几轮对话保持原样"""
+        start = self._get_head(messages)
+
+        # 从后往前找到第keep_recent_turns个轮次的起点作为区间终点
+        end = len(messages)
+        turns = 0
+        for idx in range(len(messages) - 1, start - 1, -1):
+            if messages[idx].get("role") != "tool":
+                turns += 1
+                end = idx
+                if turns >= self._keep_recent_turns:
+                    break
+
+        # 除了上一次的摘要外至少需要两条新消息才值得摘要
+        if sum(1 for message in messages[start:end] if not self._is_summary(message)) < 2:
+            return None
+        return start, end
+
+    def _render_history(self, messages: List[Dict[str, Any]]) -> str:
+        """将消息列表渲染为摘要LLM可读的文本 超长的消息会被截断"""
+        lines = []
+        for message in messages:
+            role = message.get("role")
+            content = message.get("content") or ""
+            if not isinstance(content, str):
+                content = json.dumps(content, ensure_ascii=False)
+            if len(content) > self._max_message_chars:
+                content = f"{content[:self._max_message_chars]}...(truncated)"
+
+            if role == "tool":
+                lines.append(f"[工具结果 {message.get('function_name', '')}]: {content}")
+            else:
+                lines.append(f"[{role}]: {content}")
+                for tool_call in message.get("tool_calls") or []:
+                    function = tool_call.get("function") or {}
+                    lines.append(f"[{role} 调用工具 {function.get('name')}]: {function.get('arguments')}")
+        return "\n".join(lines)
+
+    async def _summarize(self, messages: List[Dict[str, Any]]) -> str:
+        """调用次级LLM生成摘要"""
+        response = await self._llm.invoke(message=[
+            {"role": "system", "content": MEMORY_SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": MEMORY_SUMMARY_PROMPT.format(history=self._render_history(messages))},
+        ])
+        return response.get("content") or ""
+
+    def schedule(self, memory: Memory) -> bool:
+        """当记忆超过阈值且没有正在执行的摘要时 在后台启动一次摘要，返回是否启动成功"""
+        if self._task is not None or memory.token_count <= self._threshold_tokens:
+            return False
+
+        messages = memory.get_messages()
+        selected = self._select_range(messages)
+        if selected is None:
+            return False
+
+        # 记录消息快照(对象引用)并在后台生成摘要
+        start, end = selected
+        self._snapshot = messages[start:end]
+        self._task = asyncio.create_task(self._summarize(self._snapshot))
+        logger.info(f"记忆token数{memory.token_count}超过阈值{self._threshold_tokens}，开始后台摘要{end - start}条消息")
+        return True
+
+    def apply(self, memory: Memory) -> bool:
+        """如果后台摘要已经完成 将摘要区间替换为一条摘要消息，返回是否替换成功"""
+        if self._task is None or not self._task.done():
+            return False
+
+        task, snapshot = self._task, self._snapshot
+        self._task, self._snapshot = None, []
+
+        # 摘要失败则放弃本次摘要 等待下一次调度
+        if task.cancelled() or task.exception() is not None:
+            logger.error(f"记忆摘要失败：{None if task.cancelled() else task.exception()}")
+            return False
+        summary = task.result()
+        if not summary:
+            return False
+
+        # 按对象身份核对摘要区间 记忆在摘要期间被修改则丢弃本次摘要
+        messages = memory.get_messages()
+        start = self._get_head(messages)
+        end = start + len(snapshot)
+        if end > len(messages) or any(a is not b for a, b in zip(messages[start:end], snapshot)):
+            logger.warning("记忆在摘要期间发生了变化，丢弃本次摘要")
+            return False
+
+        # 记录本次摘要的原始消息区间 上一次的摘要消息不计入原始消息
+        raw_count = sum(1 for message in snapshot if not self._is_summary(message))
+        self._summarized_ranges.append((self._summarized_count, self._summarized_count + raw_count))
+        self._summarized_count += raw_count
+
+        memory.replace_messages(start, end, [{
+            "role": "user",
+            "content": f"{MEMORY_SUMMARY_PREFIX}{summary}",
+        }])
+        logger.info(f"记忆摘要完成，{len(snapshot)}条消息被替换为摘要，当前token数：{memory.token_count}")
+        return True
+
+    def step(self, memory: Memory) -> None:
+        """在Agent迭代之间调用 先应用已完成的摘要 再按需调度新的摘要"""
+        self.apply(memory)
+        self.schedule(memory)
+
+    def cancel(self) -> None:
+        """取消正在执行的摘要任务"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task, self._snapshot = None, []
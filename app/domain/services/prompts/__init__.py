@@ -1,6 +1,8 @@
+from .memory import MEMORY_SUMMARY_SYSTEM_PROMPT, MEMORY_SUMMARY_PROMPT, MEMORY_SUMMARY_PREFIX
 from .planner import PLANNER_SYSTEM_PROMPT, CREATE_PLAN_PROMPT, UPDATE_PLAN_PROMPT
 from .prompts import SYSTEM_PROMPT
 from .react import EXECUTION_PROMPT, SUMMARIZE_PROMPT, REACT_SYSTEM_PROMPT
 
 __all__ = ["PLANNER_SYSTEM_PROMPT", "SYSTEM_PROMPT", "CREATE_PLAN_PROMPT", "UPDATE_PLAN_PROMPT",
-           "EXECUTION_PROMPT", "SUMMARIZE_PROMPT", "REACT_SYSTEM_PROMPT"]
+           "EXECUTION_PROMPT", "SUMMARIZE_PROMPT", "REACT_SYSTEM_PROMPT", "MEMORY_SUMMARY_SYSTEM_PROMPT",
+           "MEMORY_SUMMARY_PROMPT", "MEMORY_SUMMARY_PREFIX"]
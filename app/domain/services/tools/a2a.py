@@ -148,13 +148,15 @@ class A2ATool(BaseTool):
         # 初始化客户端管理器
         self.manager = A2AClientManager(a2a_config=a2a_config)
         await self.manager.initialize()
+        self._version += 1
         self._initialized = True
 
     @tool(
         name="get_remote_agent_cards",
         description="获取可远程调用的Agent卡片信息",
         parameters={},
-        required=[]
+        required=[],
+        parallel=True,
     )
     async def get_remote_agent_cards(self) -> ToolResult:
         """获取远程Agent卡片信息列表"""
@@ -187,6 +189,7 @@ class A2ATool(BaseTool):
             },
         },
         required=["id", "query"],
+        parallel=True,
     )
     async def call_remote_agent(self, id: str, query: str) -> ToolResult:
         """调用远程Agent并完成对应需求"""
@@ -4,9 +4,11 @@ MoocManus工具设计思路
 2. 定义一个装饰器，被该装饰器装饰的方法会填充tool_name、tool_description还有tool_schema的值
 3. 工具类可以通过调用get_tools快速获取基于缓存的schema参数，这样LLM就可以便捷调用
 4. LLM生成的内容可能会有幻觉，在调用工具之前需要筛选出LLM生成参数中符合工具的相关数据
+5. 只读/无副作用的工具(搜索、读文件等)可以在装饰器中声明parallel=True，Agent会将相邻的此类调用并发执行
+6. 工具类在定义时就会构建类级别的注册表(工具名->方法)，参数签名在装饰时缓存，查找和调用工具都不需要再做反射
 """
 import inspect
-from typing import Dict, Any, List, Callable
+from typing import Dict, Any, List, Callable, Optional
 
 from app.domain.models.tool_result import ToolResult
 
@@ -15,9 +17,10 @@ def tool(
         name: str,
         description: str,
         parameters: Dict[str, Dict[str, Any]],
-        required: List[str]
+        required: List[str],
+        parallel: bool = False,
 ) -> Callable:
-    """定义openai的工具装饰器 用来将一个函数/方法添加上对应的工具声明"""
+    """定义openai的工具装饰器 用来将一个函数/方法添加上对应的工具声明，parallel表示该工具是否可以和其他工具并发调用"""
 
     def decorator(func):
         """装饰器函数 用来将name/description/parameters/required转换成对应的属性"""
@@ -39,6 +42,10 @@ def tool(
         func._tool_name = name
         func._tool_schema = tool_schema
         func._tool_description = description
+        func._tool_parallel = parallel
+        func._tool_parameters = frozenset(
+            param for param in inspect.signature(func).parameters if param != "self"
+        )  # 缓存方法的参数名 避免每次调用都执行inspect.signature
 
         return func
 
@@ -52,23 +59,47 @@ def tool(
 class BaseTool:
     """基础工具类 用来定义一个工具类 管理统一的工具集"""
     name: str = ""  # 工具集的名称
+    _tool_registry: Dict[str, Callable] = {}  # 类级别的工具注册表 工具名 -> 被@tool装饰的函数
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """子类创建时扫描所有被@tool装饰的方法(包含继承的方法) 构建类级别的工具注册表"""
+        super().__init_subclass__(**kwargs)
+        registry = {}
+        for attr_name in dir(cls):
+            attr = getattr(cls, attr_name, None)
+            if callable(attr) and hasattr(attr, "_tool_name"):
+                registry[attr._tool_name] = attr
+        cls._tool_registry = registry
 
     def __init__(self) -> None:
         """构造函数 完成缓存的初始化"""
         self._tool_cache = None
+        self._tool_methods: Dict[str, Callable] = {}  # 实例级别的绑定方法缓存 工具名 -> 绑定方法
+        self._version: int = 0  # 工具列表版本号 工具列表发生变化时递增
+
+    @property
+    def version(self) -> int:
+        """只读属性 返回工具列表的版本号，动态加载工具的工具包(MCP/A2A)在工具列表变化后需要递增该版本号"""
+        return self._version
 
     @classmethod
     def _filter_parameters(cls, method: Callable, kwargs: Dict[str, Any]) -> Dict[str, Any]:
         """传递method+kwargs并过滤参数 使其符合method参数的要求 因为LLM输出的内容可能有幻觉"""
-        # 1. 定义变量存储过滤之后的字典信息
-        filtered_kwargs = {}
-        sign = inspect.signature(method)
-
-        for k, v in kwargs.items():
-            if k in sign.parameters:
-                filtered_kwargs[k] = v
-
-        return filtered_kwargs
+        # 1. 优先使用装饰器缓存的参数名 非工具方法才退化为反射获取签名
+        parameters = getattr(method, "_tool_parameters", None)
+        if parameters is None:
+            parameters = inspect.signature(method).parameters
+
+        # 2. 只保留method声明过的参数
+        return {k: v for k, v in kwargs.items() if k in parameters}
+
+    def _get_tool_method(self, tool_name: str) -> Optional[Callable]:
+        """根据工具名从注册表中获取对应的绑定方法 首次获取后缓存在实例上"""
+        method = self._tool_methods.get(tool_name)
+        if method is None and tool_name in self._tool_registry:
+            method = getattr(self, self._tool_registry[tool_name].__name__)
+            self._tool_methods[tool_name] = method
+        return method
 
     def get_tools(self) -> List[Dict[str, Any]]:
         """获取所有已注册的工具schema信息，用于LLM绑定工具"""
@@ -76,35 +107,28 @@ class BaseTool:
         if self._tool_cache is not None:
             return self._tool_cache
 
-        # 2. 定义工具列表用来存储对应的数据
-        tools = []
-
-        # 3. 循环遍历类下的所有方法
-        for _, method in inspect.getmembers(self, inspect.ismethod):
-            if hasattr(method, "_tool_name"):
-                tools.append(getattr(method, "_tool_schema"))  # 取出工具的参数信息
-
-        # 创建缓存之后返回
-        self._tool_cache = tools
-        return tools
+        # 2. 从类级别的注册表中取出工具的参数信息 创建缓存之后返回
+        self._tool_cache = [func._tool_schema for func in self._tool_registry.values()]
+        return self._tool_cache
 
     def has_tool(self, tool_name: str) -> bool:
         """传递工具名字，判断该工具集下是否存在该工具"""
-        for _, method in inspect.getmembers(self, inspect.ismethod):
-            if hasattr(method, "_tool_name") and method._tool_name == tool_name:
-                return True
-        return False
+        return tool_name in self._tool_registry
+
+    def is_parallel(self, tool_name: str) -> bool:
+        """传递工具名字，判断该工具是否声明了可以与其他工具并发调用"""
+        func = self._tool_registry.get(tool_name)
+        return func is not None and getattr(func, "_tool_parallel", False)
 
     async def invoke(self, tool_name: str, **kwargs) -> ToolResult:
         """根据传递的工具名+kwargs调用指定的工具并获取结果"""
-        # 1. 循环遍历工具集中的所有方法
-        for _, method in inspect.getmembers(self, inspect.ismethod):
-            # 2. 判断对应的方法是否存在_tool_name属性
-            if hasattr(method, "_tool_name") and getattr(method, "_tool_name") == tool_name:
-                # 3. 筛选传递的kwargs，保留method对应的参数，剔除多余的参数
-                filtered_kwargs = self._filter_parameters(method, kwargs)
-                # 4. 调用await获取工具调用的结果
-                return await method(**filtered_kwargs)
-
-        # 5. 如果循环结束之后还没有找到工具并调用则抛出错误
-        raise ValueError(f"工具{tool_name}未扎到")
+        # 1. 从注册表中取出工具对应的绑定方法
+        method = self._get_tool_method(tool_name)
+        if method is None:
+            raise ValueError(f"工具{tool_name}未找到")
+
+        # 2. 筛选传递的kwargs，保留method对应的参数，剔除多余的参数
+        filtered_kwargs = self._filter_parameters(method, kwargs)
+
+        # 3. 调用await获取工具调用的结果
+        return await method(**filtered_kwargs)
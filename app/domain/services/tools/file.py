@@ -40,6 +40,7 @@ class FileTool(BaseTool):
             }
         },
         required=["filepath"],
+        parallel=True,
     )
     async def read_file(
             self,
@@ -161,7 +162,8 @@ class FileTool(BaseTool):
                 "description": "(可选)是否使用 sudo 权限"
             }
         },
-        required=["filepath", "regex"]
+        required=["filepath", "regex"],
+        parallel=True,
     )
     async def search_in_file(
             self,
@@ -188,7 +190,8 @@ class FileTool(BaseTool):
                 "description": "使用 glob 语法通配符的文件名模式"
             }
         },
-        required=["dir_path", "glob_pattern"]
+        required=["dir_path", "glob_pattern"],
+        parallel=True,
     )
     async def find_files(
             self,
@@ -14,38 +14,102 @@ MCP客户端管理器的开发思路：
 7.config.yaml是直接暴露在项目中的，所以在使用config.yaml初始化的时候必须做二次校验
 8.同时缓存ClientSession+ToolSchema，一个是客户端会话，一个是工具参数声明
 9.MCP客户端管理在清除/停止使用的时候必须关闭异步上下文管理器、清除资源（ClientSession + ToolSchema）
+10.每个MCP服务在独立的后台任务中完成连接(传输协议+initialize+list_tools)，启动耗时取决于最慢的服务而不是所有服务之和
+    - 每个服务有独立的连接超时，初始化最多等待ready_timeout秒，超过后已连接的服务立即可用，较慢的服务继续在后台连接
+    - 后台连接成功的服务会通知监听者(MCPTool)刷新工具列表
+11.连接由进程级别的MCP会话池(mcp_pool.py)持有并按照连接配置共享，客户端管理器只负责引用和释放，
+    创建/销毁客户端管理器不会再启动子进程或者建立http会话
+12.工具声明按照服务名字+连接配置指纹持久化到工具声明缓存(Redis/本地文件)，启动时先使用缓存：
+    - 有缓存的服务不需要等待握手即可在UI列表和Agent工具绑定中使用，连接完成后用实时的工具列表重新校验
+    - 工具列表和缓存不一致(连接完成/收到list_changed通知/健康检查重新获取)时更新缓存并通知监听者
+    - 调用仍在连接中的服务的工具时，最多等待ready_timeout秒
+13.生成工具声明时同时构建路由表(暴露给LLM的工具名 -> 服务名字+原始工具名+连接)，调用工具时直接查表，
+    不再按照服务名前缀逐个匹配(服务名互为前缀时匹配结果有歧义)，暴露的工具名冲突时以先注册的工具为准并记录错误日志
+14.工具调用交给连接上的调用调度器(mcp_scheduler.py)执行，受服务配置的并发上限、超时时间约束，并在多个会话之间分配
 """
+import asyncio
 import logging
-import os
-from contextlib import AsyncExitStack
-from typing import Optional, Dict, List, Any, Awaitable
+from typing import Optional, Dict, List, Any, Callable, Awaitable, Tuple, Set
 
-from mcp import ClientSession, Tool, StdioServerParameters, stdio_client
-from mcp.client.sse import sse_client
-from mcp.client.streamable_http import streamable_http_client
+from mcp import Tool
 
-from app.domain.models.app_config import McpConfig, McpServerConfig, McpTransport
+from app.domain.external.mcp_tool_cache import McpToolCache
+from app.domain.models.app_config import McpConfig
 from app.domain.models.tool_result import ToolResult
 from app.domain.services.tools.base import BaseTool
+from app.domain.services.tools.mcp_pool import McpSessionPool, McpServerConnection, get_mcp_session_pool, dump_tools
 
 logger = logging.getLogger(__name__)
 
 
-class McpClientManager:
-    """MCP客户端管理器"""
+def get_input_schema(tool: Tool) -> Dict[str, Any]:
+    """获取MCP工具的参数声明 mcp 1.x为inputSchema，2.x改名为input_schema"""
+    schema = getattr(tool, "input_schema", None)
+    if schema is None:
+        schema = getattr(tool, "inputSchema", None)
+    return schema or {"type": "object", "properties": {}}
+
 
-    def __init__(self, mcp_config: Optional[McpConfig] = None) -> None:
+class McpClientManager:
+    """MCP客户端管理器 从进程级别的会话池中引用各个服务的连接"""
+
+    def __init__(
+            self,
+            mcp_config: Optional[McpConfig] = None,
+            pool: Optional[McpSessionPool] = None,  # MCP会话池 不传递则使用进程级别的会话池
+            ready_timeout: float = 10,  # 初始化时最多等待的秒数 超过后未完成连接的服务继续在后台连接
+            tool_cache: Optional[McpToolCache] = None,  # 工具声明缓存 不传递则使用会话池的工具声明缓存
+    ) -> None:
         """构造函数 完成MCP客户端管理器的初步初始化"""
         self._mcp_config: McpConfig = mcp_config  # MCP配置信息
-        self._exist_stack: AsyncExitStack = AsyncExitStack()  # 异步上下文管理器
-        self._clients: Dict[str, ClientSession] = {}  # 缓存的客户端上下文
-        self._tools: Dict[str, List[Tool]] = {}  # 缓存的MCP工具参数说明
+        self._pool = pool or get_mcp_session_pool()
+        self._ready_timeout = ready_timeout
+        self._tool_cache = tool_cache or self._pool.tool_cache
+        self._connections: Dict[str, McpServerConnection] = {}  # 服务名字 -> 引用的连接
+        self._cached_tools: Dict[str, List[Tool]] = {}  # 服务名字 -> 缓存中的工具声明
+        self._routes: Dict[str, Tuple[str, str, McpServerConnection]] = {}  # 工具名 -> (服务名字, 原始工具名, 连接)
+        self._conflicts: Set[str] = set()  # 已经记录过的冲突工具名 避免每次重建路由表都重复记录
+        self._listeners: List[Callable[[], Awaitable[None]]] = []  # 已连接的服务发生变化时的回调
         self._initialized: bool = False  # 是否初始化标识
 
     @property
     def tools(self) -> Dict[str, List[Tool]]:
         """只读属性 返回缓存的MCP工具参数声明 建就是服务的名字 值就是服务对应的工具声明"""
-        return self._tools
+        tools = {}
+        for name, conn in self._connections.items():
+            if conn.connected:
+                tools[name] = conn.tools
+            elif not conn.ready.is_set() and name in self._cached_tools:
+                # 仍在连接中的服务先使用缓存的工具声明
+                tools[name] = self._cached_tools[name]
+        return tools
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """只读属性 返回各个服务调用调度器的排队指标 键为服务的名字"""
+        return {name: conn.scheduler.stats for name, conn in self._connections.items()}
+
+    @property
+    def pending_servers(self) -> List[str]:
+        """只读属性 返回仍在后台连接中的服务名字"""
+        return [name for name, conn in self._connections.items() if not conn.ready.is_set()]
+
+    def add_listener(self, listener: Callable[[], Awaitable[None]]) -> None:
+        """注册回调 已连接的服务(以及工具列表)发生变化时调用"""
+        self._listeners.append(listener)
+
+    async def _on_connection_changed(self, connection: McpServerConnection) -> None:
+        """会话池中的连接状态发生变化 更新工具声明缓存并通知所有监听者"""
+        if connection.connected:
+            for server_name, conn in self._connections.items():
+                if conn is connection:
+                    await self._save_cached_tools(server_name, connection)
+
+        for listener in self._listeners:
+            try:
+                await listener()
+            except Exception as e:
+                logger.error(f"MCP服务变化回调执行失败：{str(e)}")
 
     async def initialize(self) -> None:
         """初始化函数 用来连接所有配置的MCP服务器"""
@@ -62,163 +126,110 @@ class McpClientManager:
             logger.error(f"MCP客户端管理器加载失败：{str(e)}")
             raise
 
-    async def _connect_mcp_servers(self) -> None:
-        """根据配置连接所有的MCP服务器"""
-        # 循环遍历传递进来的所有MCP服务器
-        for server_name, server_config in self._mcp_config.mcpServers.items():
-            try:
-                # 根据服务名称+服务配置连接到MCP服务器
-                await self._connect_mcp_server(server_name, server_config)
-            except Exception as e:
-                logger.error(f"连接MCP服务器{server_name}失败：{str(e)}")
-                continue
-
-    async def _connect_mcp_server(self, server_name: str, server_config: McpServerConfig) -> None:
-        """根据传递的服务名字+服务配置连接到单个MCP服务"""
-        try:
-            # 获取MCP服务的传输协议
-            transport = server_config.transport
-
-            # 根据不同的传输协议调用不同的方法连接到MCP服务器
-            if transport == McpTransport.STDIO:
-                await self._connect_stdio_server(server_name, server_config)
-            elif transport == McpTransport.SSE:
-                await self._connect_sse_server(server_name, server_config)
-            elif transport == McpTransport.STREAMABLE_HTTP:
-                await self._connect_streamable_http_server(server_name, server_config)
-            else:
-                raise ValueError(f"MCP服务{server_name}使用了不支持的传输协议：{transport}")
-        except Exception as e:
-            logger.error(f"连接MCP服务器{server_name}出错：{str(e)}")
-            raise e
-
-    async def _connect_stdio_server(self, server_name: str, server_config: McpServerConfig) -> None:
-        """根据服务的名称+配置连接stdio服务"""
-        # 从配置里提取相关的命令信息
-        command = server_config.command
-        args = server_config.args
-        env = server_config.env
-
-        # 检查command是否存在
-        if not command:
-            raise ValueError("连接stdio-mcp服务需要配置command指令")
-
-        # 构建stdio连接参数
-        server_params = StdioServerParameters(
-            command=command,
-            args=args,
-            env={**os.environ, **env},
-        )
-
-        try:
-            # 使用异步上下文管理器创建传输协议
-            stdio_transport = await self._exist_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            read_stream, write_stream = stdio_transport
-
-            # 根据读取和写入流构建会话
-            session: ClientSession = await self._exist_stack.enter_async_context(
-                ClientSession(read_stream=read_stream, write_stream=write_stream)
-            )
-
-            # 初始化MCP服务会话
-            assert session.initialize()
-
-            # 缓存对应的MCP服务客户端
-            self._clients[server_name] = session
-
-            # 缓存对应的MCP工具列表
-            await self._cache_mcp_server_tools(server_name, session)
-            logger.info(f"连接stdio-mcp服务器成功")
-        except Exception as e:
-            logger.error(f"连接stdio-mcp服务器失败：{str(e)}")
-            raise
-
-    async def _connect_sse_server(self, server_name: str, server_config: McpServerConfig) -> None:
-        """根据服务名字+配置连接sse服务"""
-        # 根据sse服务器的连接url并判断是否存在
-        url = server_config.url
-        if not url:
-            raise ValueError("连接sse-mcp服务器需要配置url")
-
+    async def _load_cached_tools(self, server_name: str, connection: McpServerConnection) -> None:
+        """从工具声明缓存中读取服务的工具声明 读取失败不影响连接"""
         try:
-            sse_transport = await self._exist_stack.enter_async_context(
-                sse_client(url=url, header=server_config.headers),
-            )
-            read_stream, write_stream = sse_transport
-
-            # 创建客户端上下文
-            session: ClientSession = await self._exist_stack.enter_async_context(
-                ClientSession(read_stream=read_stream, write_stream=write_stream)
-            )
-            await session.initialize()
-
-            # 初始化对应的缓存工具
-            self._clients[server_name] = session
-
-            # 缓存对应的MCP工具列表
-            await self._cache_mcp_server_tools(server_name, session)
-            logger.info(f"连接sse-mcp服务器成功")
+            tools = await self._tool_cache.get(server_name, connection.key)
+            if tools is not None:
+                # 校验缓存的工具声明 格式不正确的缓存直接丢弃
+                self._cached_tools[server_name] = [Tool.model_validate(tool) for tool in tools]
         except Exception as e:
-            logger.error(f"连接sse-mcp服务失败：{str(e)}")
-            raise
-
-    async def _connect_streamable_http_server(self, server_name: str, server_config: McpServerConfig) -> None:
-        """根据配置名字+配置连接streamable-http服务"""
-        # 提取streamable-http服务器的连接url并判断是否存在
-        url = server_config.url
-        if not url:
-            raise ValueError("连接sse-mcp服务器需要配置的url")
+            logger.warning(f"读取MCP服务器{server_name}的工具声明缓存失败：{str(e)}")
 
+    async def _save_cached_tools(self, server_name: str, connection: McpServerConnection) -> None:
+        """实时的工具列表和缓存不一致时写入工具声明缓存"""
+        if self._tool_cache is None:
+            return
+        tools = dump_tools(connection.tools)
+        if server_name in self._cached_tools and dump_tools(self._cached_tools[server_name]) == tools:
+            return
         try:
-            # 连接streamable-http服务器
-            streamable_http_transport = await self._exist_stack.enter_async_context(
-                streamable_http_client(url=url),
-            )
-            read_stream, write_stream, _ = streamable_http_transport
-
-            # 创建客户端上下文
-            session: ClientSession = await self._exist_stack.enter_async_context(
-                ClientSession(read_stream=read_stream, write_stream=write_stream)
-            )
-            await session.initialize()
-
-            # 初始化对应的缓存工具
-            self._clients[server_name] = session
-
-            # 缓存对应的MCP工具列表
-            await self._cache_mcp_server_tools(server_name, session)
-            logger.info(f"连接streamable-http-mcp服务器成功")
+            await self._tool_cache.set(server_name, connection.key, tools)
+            self._cached_tools[server_name] = list(connection.tools)
+            logger.info(f"更新MCP服务器{server_name}的工具声明缓存，共{len(tools)}个工具")
         except Exception as e:
-            logger.error(f"连接streamable-http-mcp服务失败：{str(e)}")
-            raise e
+            logger.warning(f"写入MCP服务器{server_name}的工具声明缓存失败：{str(e)}")
 
-    async def _cache_mcp_server_tools(self, server_name: str, session: ClientSession) -> None:
-        """根据传递的服务名称+会话缓存MCP服务工具列表"""
+    async def _connect_mcp_servers(self) -> None:
+        """从会话池中引用所有服务的连接 有工具声明缓存的服务不等待，其余最多等待ready_timeout秒"""
+        # 1.已经存在的连接直接复用 不存在的连接由会话池在后台并发建立
+        for server_name, server_config in self._mcp_config.mcpServers.items():
+            connection = self._pool.acquire(server_config)
+            connection.listeners.append(self._on_connection_changed)
+            self._connections[server_name] = connection
+
+        # 2.读取工具声明缓存 已经连接的服务如果工具列表和缓存不一致则更新缓存
+        if self._tool_cache is not None:
+            await asyncio.gather(*[
+                self._load_cached_tools(server_name, connection)
+                for server_name, connection in self._connections.items()
+            ])
+            for server_name, connection in self._connections.items():
+                if connection.connected:
+                    await self._save_cached_tools(server_name, connection)
+
+        # 3.等待没有缓存的服务完成连接或者超过等待时间 连接失败的服务不影响其他服务
+        uncached = [name for name in self._connections.keys() if name not in self._cached_tools]
+        await self.wait_ready(self._ready_timeout, uncached)
+        slow_servers = [name for name in self.pending_servers if name in uncached]
+        if slow_servers:
+            logger.warning(f"MCP服务器{slow_servers}在{self._ready_timeout}秒内未完成连接，继续在后台连接")
+        cached_servers = [name for name in self.pending_servers if name not in uncached]
+        if cached_servers:
+            logger.info(f"MCP服务器{cached_servers}使用缓存的工具声明，在后台完成连接后重新校验")
+        for server_name, connection in self._connections.items():
+            if connection.error:
+                logger.error(f"连接MCP服务器{server_name}失败：{connection.error}")
+
+    async def wait_ready(self, timeout: Optional[float] = None, server_names: Optional[List[str]] = None) -> bool:
+        """等待所有服务(或者指定的服务)完成连接(成功或失败) 超时返回False"""
+        connections = [
+            conn for name, conn in self._connections.items() if server_names is None or name in server_names
+        ]
+        waiters = [conn.ready.wait() for conn in connections if not conn.ready.is_set()]
+        if not waiters:
+            return True
         try:
-            tool_response = await session.list_tools()
-            tools = tool_response.tools if tool_response else []
-            self._tools[server_name] = tools
-            logger.info(f"MCP服务器{server_name}提供了{len(tools)}个工具")
-        except Exception as e:
-            logger.error(f"获取MCP服务器{server_name}的工具列表失败：{str(e)}")
-            self._tools[server_name] = []
+            async with asyncio.timeout(timeout):
+                await asyncio.gather(*waiters)
+            return True
+        except TimeoutError:
+            return False
+
+    @classmethod
+    def _get_tool_name(cls, server_name: str, tool_name: str) -> str:
+        """生成暴露给LLM的工具名字 加上MCP前缀+服务名字"""
+        if server_name.startswith("mcp_"):
+            return f"{server_name}_{tool_name}"
+        return f"mcp_{server_name}_{tool_name}"
 
     async def get_all_tools(self) -> List[Dict[str, Any]]:
-        """获取所有的MCP工具列表，返回LLM可以使用的工具参数声明列表并处理MCP的名字"""
-        # 定义一个变量存储所有的结果
+        """获取所有的MCP工具列表，返回LLM可以使用的工具参数声明列表并处理MCP的名字 同时重建工具路由表"""
+        # 定义变量存储所有的结果以及新的路由表
         all_tools = []
+        routes = {}
+        conflicts = set()
 
         # 循环遍历所有缓存的工具
-        for server_name, tools in self._tools.items():
+        for server_name, tools in self.tools.items():
+            connection = self._connections[server_name]
             # 循环取出每个MCP的工具列表
             for tool in tools:
                 # 修改工具的名字加上MCP前缀+服务名字
-                if server_name.startswith("mcp_"):
-                    tool_name = f"{server_name}_{tool.name}"
-                else:
-                    tool_name = f"mcp_{server_name}_{tool.name}"
+                tool_name = self._get_tool_name(server_name, tool.name)
+
+                # 暴露的工具名冲突(例如服务a的工具b_c和服务a_b的工具c) 以先注册的工具为准
+                if tool_name in routes:
+                    conflicts.add(tool_name)
+                    if tool_name in self._conflicts:
+                        continue
+                    other_server_name, other_tool_name, _ = routes[tool_name]
+                    logger.error(
+                        f"MCP工具名冲突：{server_name}的工具{tool.name}与{other_server_name}的工具{other_tool_name}"
+                        f"都暴露为{tool_name}，已忽略{server_name}的工具{tool.name}"
+                    )
+                    continue
+                routes[tool_name] = (server_name, tool.name, connection)
 
                 # 生成OpenAI工具描述
                 tool_schema = {
@@ -226,42 +237,35 @@ class McpClientManager:
                     "function": {
                         "name": tool_name,
                         "description": f"[{server_name} {tool.description or tool.name}]",
-                        "parameters": tool.inputSchema,
+                        "parameters": get_input_schema(tool),
                     }
                 }
                 all_tools.append(tool_schema)
 
+        self._routes = routes
+        self._conflicts = conflicts
         return all_tools
 
     async def invoke(self, tool_name: str, arguments: Dict[str, Any,]) -> ToolResult:
         """根据传递的工具名字+参数调用MCP工具"""
         try:
-            # 定义变量存储原始的服务名字+工具
-            original_server_name = None
-            original_tool_name = None
-
-            # 循环遍历当前的所有MCP服务
-            for server_name in self._mcp_config.mcpServers.keys():
-                # 为server_name组装前缀
-                excepted_prefix = server_name if server_name.startswith("mcp_") else f"mcp_{server_name}"
-
-                # 判断工具名字是否以改服务为开头
-                if tool_name.startswith(f"{excepted_prefix}_"):
-                    original_server_name = server_name
-                    original_tool_name = tool_name[len(f"{excepted_prefix}_"):]
-                    break
-
-            # 判断服务+工具是否都存在
-            if not original_server_name or not original_tool_name:
+            # 从路由表中查找工具所属的服务+原始工具名 未命中时重建一次路由表(工具列表可能刚刚发生变化)
+            route = self._routes.get(tool_name)
+            if route is None:
+                await self.get_all_tools()
+                route = self._routes.get(tool_name)
+            if route is None:
                 raise RuntimeError(f"服务器解析MCP工具不存在：{tool_name}")
+            original_server_name, original_tool_name, connection = route
 
-            # 获取该工具所属的会话
-            session = self._clients[original_server_name]
-            if not session:
+            # 判断该工具所属的服务是否可用 使用缓存声明的服务可能仍在连接中
+            if not connection.ready.is_set():
+                await self.wait_ready(self._ready_timeout, [original_server_name])
+            if not connection.available:
                 return ToolResult(success=False, message=f"MCP服务器{original_server_name}未连接")
 
-            # 使用会话调用工具
-            result = await session.call_tool(original_tool_name, arguments)
+            # 交给调度器在并发上限和超时时间内选择会话调用工具
+            result = await connection.scheduler.call(connection.members, original_tool_name, arguments)
 
             # 判断结果是否存在进行几个不同的操作
             if result:
@@ -287,11 +291,16 @@ class McpClientManager:
             )
 
     async def cleanup(self) -> None:
-        """当退出MCP服务器的时候 清除对应的资源"""
+        """当退出MCP服务器的时候 释放引用的连接 连接本身由会话池管理"""
         try:
-            await self._exist_stack.aclose()
-            self._clients.clear()
-            self._tools.clear()
+            for connection in self._connections.values():
+                if self._on_connection_changed in connection.listeners:
+                    connection.listeners.remove(self._on_connection_changed)
+                await self._pool.release(connection)
+            self._connections.clear()
+            self._cached_tools.clear()
+            self._routes.clear()
+            self._conflicts.clear()
             self._initialized = False
             logger.info(f"清理MCP客户端管理器成功")
         except Exception as e:
@@ -307,38 +316,44 @@ class MCPTool(BaseTool):
         super().__init__()
         self._initialized: bool = False
         self._tools = []
-        self._manager = McpClientManager = None
+        self._tool_names: Set[str] = set()  # 工具名集合 用于O(1)判断工具是否存在
+        self._manager: Optional[McpClientManager] = None
 
     async def initialize(self, mcp_config: Optional[McpConfig] = None) -> None:
         """初始化MCP工具包"""
         # 判断是否初始化
         if not self._initialized:
             # 初始化MCP客户端管理器
+            # 后台完成连接的服务同样会刷新工具列表
             self._manager = McpClientManager(mcp_config=mcp_config)
+            self._manager.add_listener(self._refresh_tools)
             await self._manager.initialize()
-
-            # 获取MCPServers工具列表
-            self._tools = await self._manager.get_all_tools()
+            await self._refresh_tools()
             self._initialized = True
 
+    async def _refresh_tools(self) -> None:
+        """获取MCPServers工具列表 工具列表发生变化需要递增版本号"""
+        self._tools = await self._manager.get_all_tools()
+        self._tool_names = {tool["function"]["name"] for tool in self._tools}
+        self._version += 1
+
     def get_tools(self) -> List[Dict[str, Any]]:
         """同步获取工具包下的所有工具列表"""
         return self._tools
 
     def has_tool(self, tool_name: str) -> bool:
         """传递工具名字，判断工具是否存在"""
-        # 循环遍历所有的工具
-        for tool in self._tools:
-            # 判断工具的名字是否存在 如果是就返回True 如果不是就返回false
-            if tool["function"]["name"] == tool_name:
-                return True
-        return False
+        return tool_name in self._tool_names
+
+    def is_parallel(self, tool_name: str) -> bool:
+        """MCP工具均为远程调用 相互之间没有共享状态 可以并发执行"""
+        return self.has_tool(tool_name)
 
     async def invoke(self, tool_name: str, **kwargs) -> ToolResult:
         """传递工具名字+工具参数 调用MCP工具并获取调用的结果"""
-        return await self._manager.invoke(tool_name, **kwargs)
+        return await self._manager.invoke(tool_name, kwargs)
 
     async def cleanup(self) -> None:
         """清除MCP工具的资源"""
         if self._manager:
-            self._manager.cleanup()
+            await self._manager.cleanup()
@@ -0,0 +1,441 @@
+"""
+MCP会话池的设计思路：
+1.建立MCP连接的成本很高(stdio需要启动子进程，http需要建立会话并完成握手)，按照请求/工具包创建再销毁会重复付出这部分成本
+    因此在进程内维护一个长期存在的会话池，按照服务的连接配置哈希共享会话，配置不变的服务只会连接一次
+2.每个连接在独立的后台任务中完成连接(传输协议+initialize+list_tools)并持有上下文直到关闭
+    - 传输协议基于anyio的任务组实现，进入和退出上下文必须在同一个任务中
+    - 每个连接有独立的超时时间，连接成功/断开/重连时通知监听者(McpClientManager)
+3.使用方通过acquire/release引用连接，后台定期健康检查：
+    - 已连接的会话发送ping，失败则重新连接；连接失败且仍被引用的会话按照间隔重试
+    - 没有被引用且空闲超过idle_ttl的连接会被关闭
+4.MCP配置新增/修改/删除时调用sync热更新：新配置提前在后台连接，不再存在的配置在没有引用后关闭
+5.工具列表的变化检测：
+    - 支持notifications/tools/list_changed的服务，收到通知后在后台重新获取工具列表
+    - 不支持的服务在健康检查时重新获取工具列表代替ping，同时完成存活检测和重新校验，
+      获取工具列表使用服务的连接超时而不是ping超时，避免工具列表较慢但健康的服务被反复重连
+    - 工具列表发生变化时通知监听者，由McpClientManager写入持久化的工具声明缓存(tool_cache)
+6.每个连接持有一个调用调度器(mcp_scheduler.py)，共享该连接的所有Agent共用同一份并发上限和排队
+    - 服务配置了pool_size时额外建立pool_size-1个副本会话，副本跟随主连接创建/关闭/健康检查，调度器在会话之间分配调用
+    - 并发上限/超时/会话数不属于连接配置，修改后通过acquire/sync直接生效，不需要重新连接
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import AsyncExitStack
+from functools import lru_cache
+from typing import Optional, Dict, List, Callable, Awaitable, Any
+
+from mcp import ClientSession, Tool, StdioServerParameters, stdio_client
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamable_http_client
+from mcp.types import ToolListChangedNotification
+
+from app.domain.external.mcp_tool_cache import McpToolCache
+from app.domain.models.app_config import McpConfig, McpServerConfig, McpTransport
+from app.domain.services.tools.mcp_scheduler import McpCallScheduler
+
+logger = logging.getLogger(__name__)
+
+# 决定连接本身的配置字段 其余字段(启用状态/描述等)变化时不需要重新连接
+CONNECTION_FIELDS = {"transport", "command", "args", "env", "url", "headers"}
+
+
+def hash_server_config(server_config: McpServerConfig) -> str:
+    """根据服务的连接配置计算哈希 作为会话池的键"""
+    data = server_config.model_dump(mode="json", include=CONNECTION_FIELDS)
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def get_root_error(error: BaseException) -> BaseException:
+    """取出异常组中的第一个原始异常 非异常组直接返回"""
+    while isinstance(error, BaseExceptionGroup) and error.exceptions:
+        error = error.exceptions[0]
+    return error
+
+
+def dump_tools(tools: List[Tool]) -> List[Dict[str, Any]]:
+    """将工具声明列表序列化为可以持久化和比较的字典列表"""
+    return [tool.model_dump(mode="json", exclude_none=True) for tool in tools]
+
+
+class McpServerConnection:
+    """会话池中的单个MCP连接 由后台任务持有该连接的上下文"""
+
+    def __init__(self, key: str, server_config: McpServerConfig, scheduler: Optional[McpCallScheduler] = None) -> None:
+        self.key = key  # 连接配置哈希
+        self.server_config = server_config
+        self.task: Optional[asyncio.Task] = None  # 持有连接上下文的后台任务
+        self.ready = asyncio.Event()  # 连接完成(无论成功还是失败)时设置
+        self.stop = asyncio.Event()  # 通知后台任务关闭连接
+        self.session: Optional[ClientSession] = None  # 已完成初始化的会话
+        self.tools: List[Tool] = []  # 缓存的工具列表
+        self.list_changed = False  # 服务是否会发送工具列表变化的通知
+        self.tools_stale = False  # 收到了工具列表变化的通知 需要重新获取
+        self.refresh_task: Optional[asyncio.Task] = None  # 后台重新获取工具列表的任务
+        self.error: Optional[str] = None  # 连接失败的原因
+        self.refs = 0  # 引用计数
+        self.retired = False  # 配置已经被删除/修改 没有引用后关闭
+        self.last_used = time.monotonic()  # 最后一次被释放的时间
+        self.failed_at = 0.0  # 最后一次连接失败的时间
+        self.listeners: List[Callable[["McpServerConnection"], Awaitable[None]]] = []  # 连接状态变化时的回调
+        self.scheduler = scheduler or McpCallScheduler()  # 调用调度器 副本和主连接共用
+        self.replicas: List["McpServerConnection"] = []  # 副本会话 配置了pool_size时创建
+        self.in_flight = 0  # 该会话上执行中的调用数
+
+    @property
+    def connected(self) -> bool:
+        """只读属性 返回连接是否可用"""
+        return self.session is not None
+
+    @property
+    def members(self) -> List["McpServerConnection"]:
+        """只读属性 返回主连接以及所有副本 调度器在这些会话之间分配调用"""
+        return [self, *self.replicas]
+
+    @property
+    def available(self) -> bool:
+        """只读属性 返回主连接或者任意副本是否可用"""
+        return any(member.connected for member in self.members)
+
+    async def notify(self) -> None:
+        """通知所有监听者连接状态发生了变化"""
+        for listener in list(self.listeners):
+            try:
+                await listener(self)
+            except Exception as e:
+                logger.error(f"MCP连接状态变化回调执行失败：{str(e)}")
+
+
+class McpSessionPool:
+    """进程级别的MCP会话池 按照连接配置哈希共享会话"""
+
+    def __init__(
+            self,
+            connect_timeout: float = 30,  # 单个连接的默认超时秒数 服务配置了connect_timeout时以服务配置为准
+            health_interval: float = 30,  # 健康检查的间隔秒数
+            ping_timeout: float = 5,  # 健康检查ping的超时秒数
+            idle_ttl: float = 600,  # 没有引用的连接最多保留的秒数
+            tool_cache: Optional[McpToolCache] = None,  # 持久化的工具声明缓存 一般在应用启动时设置
+    ) -> None:
+        self._connect_timeout = connect_timeout
+        self._health_interval = health_interval
+        self._ping_timeout = ping_timeout
+        self._idle_ttl = idle_ttl
+        self._tool_cache = tool_cache
+        self._connections: Dict[str, McpServerConnection] = {}  # 连接配置哈希 -> 连接
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def connections(self) -> Dict[str, McpServerConnection]:
+        """只读属性 返回会话池中的所有连接"""
+        return self._connections
+
+    @property
+    def tool_cache(self) -> Optional[McpToolCache]:
+        """只读属性 返回持久化的工具声明缓存"""
+        return self._tool_cache
+
+    def set_tool_cache(self, tool_cache: Optional[McpToolCache]) -> None:
+        """设置持久化的工具声明缓存 会话池由领域层创建，具体的缓存实现由应用启动时注入"""
+        self._tool_cache = tool_cache
+
+    def acquire(self, server_config: McpServerConfig) -> McpServerConnection:
+        """引用指定配置的连接 连接不存在时在后台开始连接，调用方通过ready等待连接完成"""
+        key = hash_server_config(server_config)
+        connection = self._connections.get(key)
+        if connection is None or connection.retired:
+            connection = self._start(key, server_config)
+        else:
+            self._configure(connection, server_config)
+        connection.refs += 1
+        self._ensure_health_task()
+        return connection
+
+    async def release(self, connection: McpServerConnection) -> None:
+        """释放连接的引用 已经失效的连接没有引用后立即关闭"""
+        connection.refs = max(connection.refs - 1, 0)
+        connection.last_used = time.monotonic()
+        if connection.refs == 0 and connection.retired:
+            await self._close(connection)
+
+    async def sync(self, mcp_config: McpConfig) -> None:
+        """MCP配置发生变化后热更新会话池 新的配置提前连接，不再存在的配置在没有引用后关闭"""
+        keys = {}
+        for server_config in mcp_config.mcpServers.values():
+            if server_config.enabled:
+                keys[hash_server_config(server_config)] = server_config
+
+        # 1.不再存在的配置标记为失效 没有引用的立即关闭
+        for key, connection in list(self._connections.items()):
+            if key not in keys:
+                connection.retired = True
+                if connection.refs == 0:
+                    await self._close(connection)
+
+        # 2.新增的配置提前在后台连接 已经存在的连接更新调度配置(被禁用后仍有引用又重新启用的连接恢复可用)
+        for key, server_config in keys.items():
+            if key not in self._connections:
+                self._start(key, server_config)
+            else:
+                connection = self._connections[key]
+                connection.retired = False
+                self._configure(connection, server_config)
+        self._ensure_health_task()
+
+    def _start(self, key: str, server_config: McpServerConfig) -> McpServerConnection:
+        """创建连接并启动持有该连接上下文的后台任务"""
+        connection = McpServerConnection(key, server_config)
+        connection.task = asyncio.create_task(self._run(connection))
+        self._connections[key] = connection
+        self._configure(connection, server_config)
+        return connection
+
+    def _configure(self, connection: McpServerConnection, server_config: McpServerConfig) -> None:
+        """更新连接的调度配置 并按照pool_size增加/减少副本会话"""
+        connection.server_config = server_config
+        connection.scheduler.configure(
+            max_concurrency=server_config.max_concurrency,
+            call_timeout=server_config.call_timeout,
+            tool_timeouts=server_config.tool_timeouts,
+        )
+
+        # 1.副本不足时在后台建立新的副本 副本和主连接共用调度器
+        while len(connection.replicas) < server_config.pool_size - 1:
+            replica = McpServerConnection(f"{connection.key}#{len(connection.replicas) + 1}", server_config,
+                                          connection.scheduler)
+            replica.task = asyncio.create_task(self._run(replica))
+            connection.replicas.append(replica)
+
+        # 2.多余的副本通知后台任务关闭 已经分配给该副本的调用在会话关闭时结束
+        while len(connection.replicas) > server_config.pool_size - 1:
+            replica = connection.replicas.pop()
+            replica.stop.set()
+            if replica.task and not replica.ready.is_set():
+                replica.task.cancel()
+
+    def _get_connect_timeout(self, connection: McpServerConnection) -> float:
+        """获取连接的超时秒数 服务配置了connect_timeout时以服务配置为准"""
+        return connection.server_config.connect_timeout or self._connect_timeout
+
+    async def _run(self, connection: McpServerConnection) -> None:
+        """在后台任务中建立连接并持有上下文 直到收到关闭通知"""
+        timeout = self._get_connect_timeout(connection)
+        try:
+            async with AsyncExitStack() as exit_stack:
+                # 1.在超时时间内完成连接、握手并获取工具列表
+                async with asyncio.timeout(timeout):
+                    session = await self._connect(connection, exit_stack)
+                    connection.tools = await self._list_tools(session)
+
+                # 2.连接可用 通知监听者
+                connection.session = session
+                connection.error = None
+                connection.ready.set()
+                await connection.notify()
+
+                # 3.持有连接上下文直到关闭 上下文必须在进入时的同一个任务中退出
+                await connection.stop.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 传输协议基于任务组实现 超时等错误可能被包装为异常组
+            error = get_root_error(e)
+            connection.error = f"连接超时({timeout}秒)" if isinstance(error, TimeoutError) else str(error)
+            connection.failed_at = time.monotonic()
+            logger.error(f"连接MCP服务器{connection.key}失败：{connection.error}")
+        finally:
+            # 连接失败或者已经关闭 会话不再可用 监听者可能在使用缓存的工具声明，连接失败时同样需要通知
+            was_connected = connection.session is not None
+            connection.session = None
+            if connection.refresh_task and not connection.refresh_task.done():
+                connection.refresh_task.cancel()
+            connection.ready.set()
+            if (was_connected or connection.error) and not connection.stop.is_set():
+                await connection.notify()
+
+    @classmethod
+    async def _list_tools(cls, session: ClientSession) -> List[Tool]:
+        """获取MCP服务的工具列表"""
+        tool_response = await session.list_tools()
+        return tool_response.tools if tool_response else []
+
+    async def _connect(self, connection: McpServerConnection, exit_stack: AsyncExitStack) -> ClientSession:
+        """根据服务配置建立连接 返回完成初始化的会话"""
+        # 根据不同的传输协议创建读写流
+        server_config = connection.server_config
+        transport = server_config.transport
+        if transport == McpTransport.STDIO:
+            if not server_config.command:
+                raise ValueError("连接stdio-mcp服务需要配置command指令")
+            server_params = StdioServerParameters(
+                command=server_config.command,
+                args=server_config.args or [],
+                env={**os.environ, **(server_config.env or {})},
+            )
+            read_stream, write_stream = await exit_stack.enter_async_context(stdio_client(server_params))
+        elif transport == McpTransport.SSE:
+            if not server_config.url:
+                raise ValueError("连接sse-mcp服务器需要配置url")
+            read_stream, write_stream = await exit_stack.enter_async_context(
+                sse_client(url=server_config.url, headers=server_config.headers),
+            )
+        elif transport == McpTransport.STREAMABLE_HTTP:
+            if not server_config.url:
+                raise ValueError("连接streamable-http-mcp服务器需要配置url")
+            # 不同版本的传输协议可能额外返回获取会话ID的函数
+            read_stream, write_stream, *_ = await exit_stack.enter_async_context(
+                streamable_http_client(url=server_config.url),
+            )
+        else:
+            raise ValueError(f"不支持的MCP传输协议：{transport}")
+
+        # 创建会话并完成初始化 服务发送的通知交给_handle_message处理
+        async def message_handler(message: Any) -> None:
+            await self._handle_message(connection, message)
+
+        session: ClientSession = await exit_stack.enter_async_context(
+            ClientSession(read_stream=read_stream, write_stream=write_stream, message_handler=message_handler)
+        )
+        result = await session.initialize()
+
+        # 记录服务是否支持工具列表变化的通知 mcp 1.x为listChanged，2.x改名为list_changed
+        tools_capability = result.capabilities.tools if result and result.capabilities else None
+        connection.list_changed = bool(
+            getattr(tools_capability, "list_changed", None) or getattr(tools_capability, "listChanged", None)
+        )
+        return session
+
+    async def _handle_message(self, connection: McpServerConnection, message: Any) -> None:
+        """处理服务发送的消息 工具列表变化时在后台重新获取工具列表"""
+        # mcp 1.x的通知包装在ServerNotification.root中
+        notification = getattr(message, "root", message)
+        if not isinstance(notification, ToolListChangedNotification):
+            return
+
+        # 不能在通知的处理过程中等待请求的响应 否则会阻塞会话的读取循环
+        connection.tools_stale = True
+        if connection.refresh_task is None or connection.refresh_task.done():
+            connection.refresh_task = asyncio.create_task(self._refresh_stale_tools(connection))
+
+    async def _refresh_stale_tools(self, connection: McpServerConnection) -> None:
+        """在后台重新获取工具列表 处理期间再次收到通知时继续获取"""
+        while connection.tools_stale and connection.connected:
+            connection.tools_stale = False
+            await self.refresh_tools(connection)
+
+    async def refresh_tools(self, connection: McpServerConnection) -> bool:
+        """重新获取连接的工具列表 发生变化时通知监听者，获取失败返回False"""
+        session = connection.session
+        if session is None:
+            return False
+        try:
+            async with asyncio.timeout(self._get_connect_timeout(connection)):
+                tools = await self._list_tools(session)
+        except Exception as e:
+            logger.warning(f"重新获取MCP服务{connection.key}的工具列表失败：{str(get_root_error(e))}")
+            return False
+
+        if dump_tools(tools) != dump_tools(connection.tools):
+            connection.tools = tools
+            logger.info(f"MCP服务{connection.key}的工具列表发生变化，共{len(tools)}个工具")
+            await connection.notify()
+        return True
+
+    async def _close(self, connection: McpServerConnection) -> None:
+        """关闭连接以及所有副本并从会话池中移除"""
+        if self._connections.get(connection.key) is connection:
+            del self._connections[connection.key]
+        for member in connection.members:
+            member.stop.set()
+            if member.task and not member.ready.is_set():
+                member.task.cancel()
+        await asyncio.gather(*[member.task for member in connection.members if member.task], return_exceptions=True)
+        logger.info(f"关闭MCP连接{connection.key}")
+
+    async def _reconnect(self, connection: McpServerConnection) -> None:
+        """关闭旧的上下文并重新建立连接 连接对象保持不变，引用方无需重新acquire"""
+        connection.stop.set()
+        if connection.task:
+            await asyncio.gather(connection.task, return_exceptions=True)
+        connection.ready.clear()
+        connection.stop.clear()
+        connection.error = None
+        connection.task = asyncio.create_task(self._run(connection))
+        logger.info(f"重新连接MCP服务器{connection.key}")
+
+    async def _ping(self, connection: McpServerConnection) -> bool:
+        """向会话发送ping 判断连接是否健康"""
+        try:
+            async with asyncio.timeout(self._ping_timeout):
+                await connection.session.send_ping()
+            return True
+        except Exception as e:
+            logger.warning(f"MCP连接{connection.key}健康检查失败：{str(get_root_error(e))}")
+            return False
+
+    async def _check(self, connection: McpServerConnection, refs: int, now: float) -> None:
+        """检查单个会话 已连接的会话ping失败，或者连接失败一段时间后仍被引用时重新连接"""
+        # 连接仍在进行中的跳过
+        if not connection.ready.is_set():
+            return
+
+        # 不支持工具列表变化通知的服务使用重新获取工具列表代替ping
+        if connection.connected:
+            if connection.list_changed:
+                healthy = await self._ping(connection)
+            else:
+                healthy = await self.refresh_tools(connection)
+            if not healthy:
+                await self._reconnect(connection)
+        elif refs > 0 and now - connection.failed_at >= self._health_interval:
+            await self._reconnect(connection)
+
+    async def health_check(self) -> None:
+        """检查所有连接 断开的连接重新连接，空闲过久的连接关闭"""
+        now = time.monotonic()
+        for connection in list(self._connections.values()):
+            # 1.连接仍在进行中的跳过
+            if not connection.ready.is_set():
+                continue
+
+            # 2.没有引用且空闲过久的连接关闭
+            if connection.refs == 0 and now - connection.last_used > self._idle_ttl:
+                await self._close(connection)
+                continue
+
+            # 3.检查主连接以及所有副本 副本的引用数跟随主连接
+            for member in connection.members:
+                await self._check(member, connection.refs, now)
+
+    def _ensure_health_task(self) -> None:
+        """启动后台健康检查任务"""
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self) -> None:
+        """定期执行健康检查"""
+        while True:
+            await asyncio.sleep(self._health_interval)
+            try:
+                await self.health_check()
+            except Exception as e:
+                logger.error(f"MCP会话池健康检查出错：{str(e)}")
+
+    async def close(self) -> None:
+        """关闭会话池中的所有连接 在应用关闭时调用"""
+        if self._health_task:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        for connection in list(self._connections.values()):
+            await self._close(connection)
+        logger.info("MCP会话池已关闭")
+
+
+@lru_cache
+def get_mcp_session_pool() -> McpSessionPool:
+    """使用lru_cache实现单例模式 获取进程级别的MCP会话池"""
+    return McpSessionPool()
@@ -0,0 +1,157 @@
+"""
+MCP调用调度器的设计思路：
+1.同一个MCP服务的会话被会话池中的所有Agent共享，没有并发控制时，大量调用同时涌入会拖慢整个服务，
+    某个慢调用也没有超时，会一直占用服务的处理能力(队头阻塞)
+2.每个服务一个调度器(挂在会话池的连接上，所有客户端管理器共享)：
+    - 同时执行的调用数超过max_concurrency时按照先进先出排队，形成背压而不是继续压给服务
+    - 单次调用(含排队)的超时时间为tool_timeouts中该工具的配置，没有配置时使用call_timeout
+    - 超时或者调用方被取消时取消等待中的请求，mcp客户端会向服务发送notifications/cancelled
+3.服务配置了pool_size时会话池为该服务建立多个会话，调度器将调用分配给执行中调用数最少的会话，
+    适用于stdio/http等单个会话不能很好地并发处理请求的服务
+4.统计排队数、执行数、等待时间、超时/失败/取消次数等指标，便于观察哪个服务出现了拥塞
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List, Deque, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.domain.services.tools.mcp_pool import McpServerConnection
+
+logger = logging.getLogger(__name__)
+
+
+class McpCallScheduler:
+    """单个MCP服务的调用调度器 限制同时执行的调用数，按照超时时间调用工具并在多个会话之间分配调用"""
+
+    def __init__(
+            self,
+            max_concurrency: Optional[int] = None,  # 同时执行的调用数上限 None表示不限制
+            call_timeout: Optional[float] = None,  # 单次调用(含排队)的默认超时秒数 None表示不限制
+            tool_timeouts: Optional[Dict[str, float]] = None,  # 按照工具名单独配置的超时秒数
+    ) -> None:
+        self._max_concurrency = max_concurrency
+        self._call_timeout = call_timeout
+        self._tool_timeouts: Dict[str, float] = tool_timeouts or {}
+        self._waiters: Deque[asyncio.Future] = deque()  # 排队中的调用
+        self._in_flight = 0  # 执行中的调用数
+        self._max_waiting = 0  # 历史最大排队数
+        self._calls = 0  # 调用总数
+        self._failed = 0  # 失败次数(不含超时和取消)
+        self._timeouts = 0  # 超时次数
+        self._cancelled = 0  # 被调用方取消的次数
+        self._total_wait = 0.0  # 累计排队秒数
+        self._max_wait = 0.0  # 最长的一次排队秒数
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """只读属性 返回调度器的排队指标"""
+        return {
+            "max_concurrency": self._max_concurrency,
+            "in_flight": self._in_flight,
+            "waiting": len(self._waiters),
+            "max_waiting": self._max_waiting,
+            "calls": self._calls,
+            "failed": self._failed,
+            "timeouts": self._timeouts,
+            "cancelled": self._cancelled,
+            "avg_wait_ms": round(self._total_wait / self._calls * 1000, 3) if self._calls else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 3),
+        }
+
+    def configure(
+            self,
+            max_concurrency: Optional[int] = None,
+            call_timeout: Optional[float] = None,
+            tool_timeouts: Optional[Dict[str, float]] = None,
+    ) -> None:
+        """更新调度配置 调大并发上限时立即唤醒排队中的调用"""
+        self._max_concurrency = max_concurrency
+        self._call_timeout = call_timeout
+        self._tool_timeouts = tool_timeouts or {}
+        self._wake()
+
+    def get_timeout(self, tool_name: str) -> Optional[float]:
+        """获取工具的超时秒数 优先使用按照工具名单独配置的超时"""
+        return self._tool_timeouts.get(tool_name, self._call_timeout)
+
+    def _has_capacity(self) -> bool:
+        """判断是否还可以执行新的调用"""
+        return self._max_concurrency is None or self._in_flight < self._max_concurrency
+
+    def _wake(self) -> None:
+        """按照先进先出的顺序唤醒排队中的调用 直到达到并发上限"""
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    async def _acquire(self) -> None:
+        """获取一个执行名额 达到并发上限时排队等待"""
+        if self._has_capacity() and not self._waiters:
+            self._in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._max_waiting = max(self._max_waiting, len(self._waiters))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # 名额已经分配给当前调用但调用被取消 归还名额
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def _release(self) -> None:
+        """归还执行名额并唤醒排队中的调用"""
+        self._in_flight -= 1
+        self._wake()
+
+    @classmethod
+    def _select(cls, connections: List["McpServerConnection"]) -> "McpServerConnection":
+        """选择执行中调用数最少的已连接会话"""
+        candidates = [connection for connection in connections if connection.connected]
+        if not candidates:
+            raise RuntimeError("没有可用的MCP会话")
+        return min(candidates, key=lambda connection: connection.in_flight)
+
+    async def call(self, connections: List["McpServerConnection"], tool_name: str, arguments: Dict[str, Any]) -> Any:
+        """在并发上限和超时时间内调用工具 返回MCP工具的调用结果"""
+        timeout = self.get_timeout(tool_name)
+        start = time.perf_counter()
+        acquired = False
+        self._calls += 1
+        try:
+            async with asyncio.timeout(timeout):
+                # 1.排队获取执行名额
+                await self._acquire()
+                acquired = True
+                wait = time.perf_counter() - start
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+
+                # 2.选择负载最低的会话执行调用 超时/取消时mcp客户端会通知服务取消该请求
+                connection = self._select(connections)
+                connection.in_flight += 1
+                try:
+                    return await connection.session.call_tool(tool_name, arguments)
+                finally:
+                    connection.in_flight -= 1
+        except TimeoutError:
+            self._timeouts += 1
+            stage = "执行" if acquired else "排队"
+            raise TimeoutError(f"调用工具{tool_name}超时({timeout}秒)，超时发生在{stage}阶段")
+        except asyncio.CancelledError:
+            self._cancelled += 1
+            raise
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            if acquired:
+                self._release()
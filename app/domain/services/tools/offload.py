@@ -0,0 +1,133 @@
+"""
+工具结果卸载的设计思路：
+1. browser_view、read_file、MCP等工具的结果动辄数万字符，原样写入记忆后每次调用LLM都会重复发送，也会长期占用进程内存
+2. 序列化后超过阈值的工具结果写入大对象存储(沙箱文件系统/Cos)，记忆中只保留摘要：
+   执行状态、内容长度、内容哈希、开头部分的预览以及可以检索完整内容的句柄
+3. Agent需要完整内容时调用read_tool_result工具按照偏移量分段读取，不需要的内容不会再进入上下文
+4. 写入存储失败时退化为原样写入记忆，卸载失败不会影响Agent执行
+"""
+import hashlib
+import json
+import logging
+from typing import Dict, Any
+
+from app.domain.external.blob_store import BlobStore
+from app.domain.models.tool_result import ToolResult
+from app.domain.services.tools.base import BaseTool, tool
+
+logger = logging.getLogger(__name__)
+
+READ_TOOL_RESULT = "read_tool_result"  # 读取已卸载工具结果的工具名
+
+
+class OffloadTool(BaseTool):
+    """已卸载工具结果的读取工具箱"""
+    name: str = "offload"
+
+    def __init__(self, store: BlobStore) -> None:
+        """构造函数 传递存放工具结果的大对象存储"""
+        super().__init__()
+        self._store = store
+
+    @tool(
+        name=READ_TOOL_RESULT,
+        description="分段读取被卸载到外部存储的完整工具结果。当工具结果中包含offloaded字段且预览内容不足以完成任务时使用。",
+        parameters={
+            "handle": {
+                "type": "string",
+                "description": "工具结果offloaded字段中的handle",
+            },
+            "offset": {
+                "type": "integer",
+                "description": "(可选)读取的起始字符位置, 默认为0",
+            },
+            "length": {
+                "type": "integer",
+                "description": "(可选)读取的最大字符数, 默认为8000",
+            },
+        },
+        required=["handle"],
+        parallel=True,
+    )
+    async def read_tool_result(self, handle: str, offset: int = 0, length: int = 8000) -> ToolResult:
+        """根据句柄读取完整的工具结果 并返回指定范围的内容"""
+        try:
+            content = await self._store.get(handle)
+        except Exception as e:
+            return ToolResult(success=False, message=f"读取工具结果失败：{str(e)}")
+
+        offset = max(offset, 0)
+        end = min(offset + max(length, 1), len(content))
+        return ToolResult(data={
+            "content": content[offset:end],
+            "offset": offset,
+            "next_offset": end if end < len(content) else None,
+            "size": len(content),
+        })
+
+
+class ToolResultOffloader:
+    """将体积超过阈值的工具结果写入大对象存储 记忆中只保留摘要和句柄"""
+
+    def __init__(
+            self,
+            store: BlobStore,  # 大对象存储
+            namespace: str = "",  # 存储键的命名空间 一般为会话ID
+            threshold: int = 4000,  # 序列化后超过该字符数的工具结果会被卸载
+            preview_chars: int = 800,  # 摘要中保留的预览字符数
+    ) -> None:
+        self._store = store
+        self._namespace = namespace
+        self._threshold = threshold
+        self._preview_chars = preview_chars
+        self._tool = OffloadTool(store)
+        self._offloaded = 0  # 被卸载的工具结果数
+        self._saved_chars = 0  # 卸载后记忆中减少的字符数
+
+    @property
+    def tool(self) -> OffloadTool:
+        """只读属性 返回读取已卸载工具结果的工具箱"""
+        return self._tool
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """只读属性 返回卸载的统计信息"""
+        return {"offloaded": self._offloaded, "saved_chars": self._saved_chars}
+
+    def _get_preview(self, data: Any) -> str:
+        """获取工具结果数据开头部分的预览"""
+        text = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False, default=str)
+        if len(text) <= self._preview_chars:
+            return text
+        return text[:self._preview_chars] + "..."
+
+    async def offload(self, tool_call_id: str, function_name: str, result: ToolResult) -> str:
+        """将工具结果序列化为写入记忆的文本 超过阈值时写入存储并返回摘要"""
+        content = result.model_dump_json(fallback=str)
+        # 分段读取的卸载结果不再卸载 否则Agent永远拿不到完整内容
+        if len(content) <= self._threshold or function_name == READ_TOOL_RESULT:
+            return content
+
+        # 1.写入大对象存储 失败时原样写入记忆
+        key = f"{self._namespace}/{tool_call_id}.json" if self._namespace else f"{tool_call_id}.json"
+        try:
+            handle = await self._store.put(key, content)
+        except Exception as e:
+            logger.error(f"卸载工具{function_name}的结果失败：{str(e)}")
+            return content
+
+        # 2.记忆中只保留执行状态、预览以及检索完整内容的句柄
+        digest = json.dumps({
+            "success": result.success,
+            "message": result.message,
+            "offloaded": {
+                "handle": handle,
+                "size": len(content),
+                "sha256": hashlib.sha256(content.encode("utf-8")).hexdigest()[:16],
+                "preview": self._get_preview(result.data),
+            },
+        }, ensure_ascii=False)
+        self._offloaded += 1
+        self._saved_chars += len(content) - len(digest)
+        logger.info(f"工具{function_name}的结果共{len(content)}个字符，已卸载到{handle}")
+        return digest
@@ -28,7 +28,8 @@ class SearchTool(BaseTool):
                 "description": "（可选）搜索结果的时间范围过滤，当用户询问特定的时效性的新闻或者事件时，必须指定此参数，默认为all"
             }
         },
-        required=["query"]
+        required=["query"],
+        parallel=True,
     )
     async def search_web(self, query: str, date_range: Optional[str] = None) -> ToolResult[SearchResults]:
         """调用搜索引擎获取搜索结果并返回"""
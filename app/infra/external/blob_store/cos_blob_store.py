@@ -0,0 +1,39 @@
+import asyncio
+import logging
+
+from app.domain.external.blob_store import BlobStore
+from app.infra.storage.cos import Cos
+from core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class CosBlobStore(BlobStore):
+    """基于腾讯云Cos的大对象存储 句柄为对象的键，沙箱销毁后内容仍然可以读取"""
+
+    def __init__(self, cos: Cos, prefix: str = "tool-results") -> None:
+        """构造函数 传递Cos客户端以及对象键的前缀"""
+        self._cos = cos
+        self._bucket = get_settings().cos_bucket
+        self._prefix = prefix.strip("/")
+
+    async def put(self, key: str, content: str) -> str:
+        """上传内容到Cos 返回对象的键 Cos的SDK为同步实现 在线程中执行"""
+        object_key = f"{self._prefix}/{key}"
+        await asyncio.to_thread(
+            self._cos.client.put_object,
+            Bucket=self._bucket,
+            Body=content.encode("utf-8"),
+            Key=object_key,
+            ContentType="application/json; charset=utf-8",
+        )
+        return object_key
+
+    async def get(self, handle: str) -> str:
+        """从Cos下载对象内容"""
+
+        def _download() -> bytes:
+            response = self._cos.client.get_object(Bucket=self._bucket, Key=handle)
+            return response["Body"].get_raw_stream().read()
+
+        return (await asyncio.to_thread(_download)).decode("utf-8")
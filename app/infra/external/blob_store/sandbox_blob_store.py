@@ -0,0 +1,34 @@
+import logging
+
+from app.domain.external.blob_store import BlobStore
+from app.domain.external.sandbox import Sandbox
+
+logger = logging.getLogger(__name__)
+
+
+class SandboxBlobStore(BlobStore):
+    """基于沙箱文件系统的大对象存储 句柄即沙箱中的文件路径，Agent也可以直接使用文件工具读取"""
+
+    def __init__(self, sandbox: Sandbox, base_dir: str = "/tmp/tool_results") -> None:
+        """构造函数 传递沙箱以及存放内容的目录"""
+        self._sandbox = sandbox
+        self._base_dir = base_dir.rstrip("/")
+
+    async def put(self, key: str, content: str) -> str:
+        """将内容写入沙箱中的文件 返回文件路径"""
+        filepath = f"{self._base_dir}/{key}"
+        result = await self._sandbox.write_file(filepath=filepath, content=content)
+        if not result.success:
+            raise RuntimeError(f"写入沙箱文件{filepath}失败：{result.message}")
+        return filepath
+
+    async def get(self, handle: str) -> str:
+        """读取沙箱中的文件内容"""
+        # 读取完整内容 不使用read_file默认的长度限制
+        result = await self._sandbox.read_file(filepath=handle, max_length=10 ** 8)
+        if not result.success:
+            raise RuntimeError(f"读取沙箱文件{handle}失败：{result.message}")
+
+        # 沙箱返回的数据为{"filepath": ..., "content": ...}
+        data = result.data
+        return data.get("content", "") if isinstance(data, dict) else str(data or "")
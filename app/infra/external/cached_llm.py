@@ -0,0 +1,217 @@
+"""
+LLM响应缓存的设计思路：
+1. 规划Agent在不同会话中经常收到几乎相同的输入(相同的用户消息、重放的计划)，对这类调用直接复用之前的响应
+2. 缓存键 = 归一化后的(模型名、温度、最大输出token、消息列表、工具声明、响应格式、工具选择)的sha256
+   - 消息中值为None的字段会被移除、文本两端空白会被去除，字典按键排序序列化，避免无意义的差异导致缓存未命中
+3. 两级缓存：进程内的LRU(带TTL和容量上限) + Redis二级缓存(多进程/多实例共享，TTL由Redis负责过期)
+4. 默认只缓存不包含工具调用的响应，工具调用带有副作用且tool_call_id需要唯一，缓存后重放意义不大
+5. Redis不可用时只记录日志并降级为纯本地缓存，缓存永远不能影响正常的LLM调用
+"""
+import copy
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, AsyncGenerator, Optional, Tuple
+
+from app.domain.external.llm import LLM
+from app.infra.storage.redis import RedisClient, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value: Any) -> Any:
+    """归一化参与缓存键计算的数据 移除值为None的字段并去除文本两端的空白"""
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def build_cache_key(
+        model_name: str,
+        temperature: float,
+        max_tokens: int,
+        message: List[Dict[str, Any]],
+        tools: List[Dict[str, Any]] = None,
+        response_format: Dict[str, Any] = None,
+        tool_choice: str = None,
+) -> str:
+    """根据模型设置和请求内容计算归一化的缓存键"""
+    payload = _normalize({
+        "model_name": model_name,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "message": message,
+        "tools": tools or None,
+        "response_format": response_format,
+        "tool_choice": tool_choice,
+    })
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class CachedLLM(LLM):
+    """带响应缓存的LLM包装类 缓存未命中时调用被包装的LLM并写入缓存"""
+
+    def __init__(
+            self,
+            llm: LLM,
+            max_size: int = 256,
+            ttl: int = 3600,
+            use_redis: bool = True,
+            key_prefix: str = "llm_cache:",
+            cache_tool_calls: bool = False,
+    ) -> None:
+        """构造函数 传递被包装的LLM+本地缓存容量+过期秒数+是否启用Redis二级缓存+Redis键前缀+是否缓存工具调用响应"""
+        self._llm = llm
+        self._max_size = max_size
+        self._ttl = ttl
+        self._redis_client: Optional[RedisClient] = get_redis() if use_redis else None
+        self._key_prefix = key_prefix
+        self._cache_tool_calls = cache_tool_calls
+        self._cache: OrderedDict[str, Tuple[float, Dict[str, Any]]] = OrderedDict()  # 缓存键 -> (过期时间, 响应消息)
+        self._hits = 0
+        self._redis_hits = 0
+        self._misses = 0
+
+    @property
+    def model_name(self) -> str:
+        """返回所使用的语言模型名称"""
+        return self._llm.model_name
+
+    @property
+    def temperature(self) -> float:
+        """返回当前语言模型的温度设置"""
+        return self._llm.temperature
+
+    @property
+    def max_tokens(self) -> int:
+        """返回当前语言模型的最大令牌数设置"""
+        return self._llm.max_tokens
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """只读属性 返回缓存的命中统计"""
+        return {
+            "hits": self._hits,
+            "redis_hits": self._redis_hits,
+            "misses": self._misses,
+            "size": len(self._cache),
+        }
+
+    def cache_key(self,
+                  message: List[Dict[str, Any]],
+                  tools: List[Dict[str, Any]] = None,
+                  response_format: Dict[str, Any] = None,
+                  tool_choice: str = None,
+                  ) -> str:
+        """计算本次请求的缓存键"""
+        return build_cache_key(
+            self.model_name, self.temperature, self.max_tokens, message, tools, response_format, tool_choice,
+        )
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        """从本地LRU缓存中读取响应 过期的缓存会被删除"""
+        item = self._cache.get(key)
+        if item is None:
+            return None
+
+        expire_at, message = item
+        if expire_at < time.monotonic():
+            del self._cache[key]
+            return None
+
+        self._cache.move_to_end(key)
+        return message
+
+    def _set_local(self, key: str, message: Dict[str, Any]) -> None:
+        """写入本地LRU缓存 超出容量时淘汰最久未使用的缓存"""
+        self._cache[key] = (time.monotonic() + self._ttl, message)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
+
+    async def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        """依次从本地缓存和Redis缓存中读取响应 Redis命中时回填本地缓存"""
+        message = self._get_local(key)
+        if message is not None:
+            self._hits += 1
+            return copy.deepcopy(message)
+
+        if self._redis_client is not None:
+            try:
+                data = await self._redis_client.client.get(f"{self._key_prefix}{key}")
+                if data:
+                    message = json.loads(data)
+                    self._set_local(key, message)
+                    self._hits += 1
+                    self._redis_hits += 1
+                    return copy.deepcopy(message)
+            except Exception as e:
+                logger.warning(f"读取Redis LLM响应缓存失败: {e}")
+
+        self._misses += 1
+        return None
+
+    async def _set(self, key: str, message: Dict[str, Any]) -> None:
+        """将响应写入本地缓存和Redis缓存 usage属于单次调用的统计信息不写入缓存"""
+        if message.get("tool_calls") and not self._cache_tool_calls:
+            return
+
+        message = {k: v for k, v in message.items() if k != "usage"}
+        self._set_local(key, copy.deepcopy(message))
+
+        if self._redis_client is not None:
+            try:
+                await self._redis_client.client.set(
+                    f"{self._key_prefix}{key}",
+                    json.dumps(message, ensure_ascii=False),
+                    ex=self._ttl,
+                )
+            except Exception as e:
+                logger.warning(f"写入Redis LLM响应缓存失败: {e}")
+
+    async def invoke(self,
+                     message: List[Dict[str, Any]],
+                     tools: List[Dict[str, Any]] = None,
+                     response_format: Dict[str, Any] = None,
+                     tool_choice: str = None,
+                     parallel_tool_calls: bool = False,
+                     ) -> Dict[str, Any]:
+        """优先从缓存中读取响应 未命中时调用被包装的LLM并写入缓存"""
+        key = self.cache_key(message, tools, response_format, tool_choice)
+        cached = await self._get(key)
+        if cached is not None:
+            logger.info(f"LLM响应缓存命中: {key}")
+            return cached
+
+        response = await self._llm.invoke(message, tools, response_format, tool_choice, parallel_tool_calls)
+        await self._set(key, response)
+        return response
+
+    async def invoke_stream(self,
+                            message: List[Dict[str, Any]],
+                            tools: List[Dict[str, Any]] = None,
+                            response_format: Dict[str, Any] = None,
+                            tool_choice: str = None,
+                            parallel_tool_calls: bool = False,
+                            ) -> AsyncGenerator[Dict[str, Any], None]:
+        """缓存命中时一次性重放完整响应 未命中时透传被包装LLM的流式响应并缓存最终消息"""
+        key = self.cache_key(message, tools, response_format, tool_choice)
+        cached = await self._get(key)
+        if cached is not None:
+            logger.info(f"LLM流式响应缓存命中: {key}")
+            if cached.get("content"):
+                yield {"type": "content", "content": cached["content"]}
+            yield {"type": "message", "message": cached}
+            return
+
+        async for chunk in self._llm.invoke_stream(message, tools, response_format, tool_choice, parallel_tool_calls):
+            if chunk["type"] == "message":
+                await self._set(key, chunk["message"])
+            yield chunk
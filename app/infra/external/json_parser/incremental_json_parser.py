@@ -0,0 +1,162 @@
+"""
+增量json解析器的设计思路：
+1. 流式生成的工具调用参数是一个json对象，按照片段逐个字符扫描，只维护当前位置的状态(嵌套深度/是否在字符串中/当前在解析键还是值)
+2. 每个顶层字段的值结束(遇到顶层的逗号或者右花括号)时，只解析该字段对应的那一段文本并立即返回，
+   整个参数文本只会被扫描一次，不需要在生成结束后重新解析整段多KB的文本
+   - 文本片段保存在列表中，只在需要时拼接当前字段的文本，避免每个片段都复制一次整段文本(长参数下为平方级开销)
+3. 文本不是合法的json对象(LLM生成了代码块包裹/单引号等)时放弃增量解析，生成结束后回退到整体解析(含修复)
+"""
+import json
+import logging
+from typing import Optional, Any, Union, Dict, List
+
+from app.domain.external.json_parser import IncrementalJsonParser, JsonParser
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingJsonObjectParser(IncrementalJsonParser):
+    """顶层为json对象的增量解析器"""
+
+    def __init__(self, fallback: JsonParser) -> None:
+        """构造函数 传递增量解析失败时用于整体解析的解析器"""
+        self._fallback = fallback
+        self._chunks: List[str] = []  # 已经接收的全部文本片段 只在回退到整体解析时拼接
+        self._depth = 0  # 当前的嵌套深度 顶层对象内部为1
+        self._in_string = False
+        self._escaped = False
+        self._expect = "start"  # 顶层期望的下一个元素：start/key/colon/value/comma/end
+        self._token_start: Optional[int] = None  # 当前顶层键/值在当前片段中的起始位置 跨片段的键/值在新片段中从0开始
+        self._token_parts: List[str] = []  # 当前顶层键/值在之前片段中的文本
+        self._key: Optional[str] = None  # 当前正在解析值的字段名
+        self._fields: Dict[str, Any] = {}  # 已完成的字段
+        self._done = False
+        self._failed = False
+
+    @property
+    def done(self) -> bool:
+        """只读属性 返回顶层json对象是否已经完整结束"""
+        return self._done
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        """只读属性 返回已经完成解析的顶层字段"""
+        return self._fields
+
+    def _fail(self) -> None:
+        """放弃增量解析 生成结束后回退到整体解析"""
+        self._failed = True
+
+    def _take_token(self, delta: str, end: int) -> str:
+        """取出当前顶层键/值的完整文本(之前片段中的部分+当前片段中end之前的部分)"""
+        token = "".join([*self._token_parts, delta[self._token_start:end]])
+        self._token_start, self._token_parts = None, []
+        return token
+
+    def _finish_value(self, delta: str, end: int, completed: Dict[str, Any]) -> None:
+        """顶层字段的值结束 解析对应的文本片段"""
+        if self._token_start is None or self._key is None:
+            self._fail()
+            return
+        try:
+            value = json.loads(self._take_token(delta, end))
+        except ValueError:
+            self._fail()
+            return
+        self._fields[self._key] = value
+        completed[self._key] = value
+        self._key = None
+
+    def feed(self, delta: str) -> Dict[str, Any]:
+        """传递新生成的文本片段 返回本次新完成的顶层字段"""
+        completed: Dict[str, Any] = {}
+        self._chunks.append(delta)
+        if self._failed or self._done:
+            return completed
+
+        for pos, char in enumerate(delta):
+
+            # 1.字符串内部只需要关注转义和字符串结束
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == "key":
+                        # 顶层字段名结束
+                        try:
+                            self._key = json.loads(self._take_token(delta, pos + 1))
+                        except ValueError:
+                            self._fail()
+                            break
+                        self._expect = "colon"
+                continue
+
+            # 2.嵌套在顶层字段值内部的内容只需要维护深度
+            if self._depth > 1:
+                if char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                continue
+
+            if char.isspace() and self._token_start is None:
+                continue
+
+            # 3.顶层对象的结构字符
+            if self._expect == "start":
+                if char != "{":
+                    self._fail()
+                    break
+                self._depth = 1
+                self._expect = "key"
+            elif self._expect == "key":
+                if char == '"':
+                    self._in_string = True
+                    self._token_start = pos
+                elif char == "}" and not self._fields:
+                    self._depth = 0
+                    self._done = True
+                    break
+                else:
+                    self._fail()
+                    break
+            elif self._expect == "colon":
+                if char != ":":
+                    self._fail()
+                    break
+                self._expect = "value"
+            elif self._expect == "value":
+                if self._token_start is None:
+                    self._token_start = pos
+                if char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in ",}":
+                    self._finish_value(delta, pos, completed)
+                    if self._failed:
+                        break
+                    if char == "}":
+                        self._depth = 0
+                        self._done = True
+                        break
+                    self._expect = "key"
+
+        # 当前键/值跨越了片段 保存已经接收的部分
+        if self._token_start is not None and not (self._failed or self._done):
+            self._token_parts.append(delta[self._token_start:])
+            self._token_start = 0
+        return completed
+
+    async def close(self) -> Union[Dict, List, Any]:
+        """文本生成结束 增量解析成功时直接返回已解析的字段，否则回退到整体解析"""
+        if self._done and not self._failed:
+            return self._fields
+
+        logger.debug("增量json解析未能完成，回退到整体解析")
+        return await self._fallback.invoke("".join(self._chunks), default_value={})
@@ -1,23 +1,113 @@
+"""
+分层json解析器的设计思路：
+1. 绝大多数LLM输出和工具调用参数都是合法的json，优先使用严格解析(安装了orjson时使用orjson)，成本最低
+2. 严格解析失败时，单次扫描提取文本中的第一个json对象/数组(兼容```json代码块或者前后夹杂说明文字的输出)再严格解析
+3. 以上都失败时才使用json_repair修复解析，修复的成本是严格解析的数倍，并统计各个层级的命中次数便于观察
+"""
+import json
 import logging
 from typing import Optional, Any, Union, Dict, List
 
 import json_repair
 
-from app.domain.external.json_parser import JsonParser
+from app.domain.external.json_parser import JsonParser, IncrementalJsonParser
+from app.infra.external.json_parser.incremental_json_parser import StreamingJsonObjectParser
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson为可选依赖
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
 
+def _loads(text: str) -> Any:
+    """严格解析json文本"""
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def extract_json_text(text: str) -> Optional[str]:
+    """单次扫描提取文本中第一个完整的json对象/数组 跳过字符串内的括号，找不到时返回None"""
+    start = -1
+    depth = 0
+    in_string = False
+    escaped = False
+    for idx, char in enumerate(text):
+        if start < 0:
+            if char in "{[":
+                start = idx
+                depth = 1
+            continue
+
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:idx + 1]
+    return None
+
+
 class RepairJsonParser(JsonParser):
-    """基于修复逻辑的json解析器"""
+    """基于修复逻辑的json解析器 严格解析 -> 提取后解析 -> 修复解析 逐层降级"""
+
+    def __init__(self, extract: bool = True) -> None:
+        """构造函数 extract表示严格解析失败时是否尝试从代码块/说明文字中提取json"""
+        self._extract = extract
+        self._strict_hits = 0  # 严格解析成功次数
+        self._extract_hits = 0  # 提取后解析成功次数
+        self._repair_hits = 0  # 修复解析次数
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """只读属性 返回各个解析层级的命中次数"""
+        return {
+            "strict": self._strict_hits,
+            "extract": self._extract_hits,
+            "repair": self._repair_hits,
+        }
+
+    def incremental(self) -> IncrementalJsonParser:
+        """创建一个增量json解析器 增量解析失败时回退到当前解析器整体解析"""
+        return StreamingJsonObjectParser(fallback=self)
 
     async def invoke(self, text: str, default_value: Optional[Any] = None) -> Union[Dict, List, Any]:
-        """传递文本 并使用json修复库进行修复"""
+        """传递文本 依次尝试严格解析、提取解析和修复解析"""
         # 1. 记录日志并判断text是否传递
         if not text or not text.strip():
             if default_value is not None:
                 return default_value
             raise ValueError("json文本为空，且没有默认值")
 
-        # 2. 存在数值则使用json-repair库修复并解析
-        return json_repair.repair_json(text, ensure_ascii=False)
+        # 2. 严格解析 合法的json直接返回
+        try:
+            result = _loads(text)
+            self._strict_hits += 1
+            return result
+        except ValueError:
+            pass
+
+        # 3. 提取代码块/说明文字中的json再严格解析
+        if self._extract:
+            json_text = extract_json_text(text)
+            if json_text is not None:
+                try:
+                    result = _loads(json_text)
+                    self._extract_hits += 1
+                    return result
+                except ValueError:
+                    pass
+
+        # 4. 使用json-repair库修复并解析为对象
+        self._repair_hits += 1
+        logger.debug(f"json严格解析失败，使用修复解析，累计修复次数：{self._repair_hits}")
+        return json_repair.loads(text)
@@ -0,0 +1,353 @@
+"""
+LLM请求调度器的设计思路：
+1. 同一个模型在进程内共享一个调度器(按模型名区分)，所有会话的请求都需要经过调度器排队后才能真正发起
+2. 使用两个令牌桶分别限制每分钟请求数(RPM)和每分钟token数(TPM)，另外限制同时进行中的请求数
+   - 请求发起前按照消息估算的输入token数扣减TPM，请求结束后根据usage中的真实token数多退少补
+3. 请求分为两个优先级：交互(Agent执行步骤)优先于后台(记忆摘要等)，只有交互队列为空时才调度后台请求
+4. 同一优先级内按会话轮询(公平排队)，避免单个会话的突发请求占满整个模型的配额
+5. 令牌不足时不轮询，而是通过loop.call_later在令牌恢复的时间点再次调度，请求被取消时自动从队列中移除
+6. 调度器本身不关心LLM的具体实现，通过ScheduledLLM包装任意LLM并绑定会话ID和优先级
+7. 限额来自应用配置中的LLMConfig(get_llm_scheduler_by_config)，配置修改后再次获取调度器时限额立即生效
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import List, Dict, Any, AsyncGenerator, Optional, Deque
+
+from app.domain.external.llm import LLM
+from app.domain.models.app_config import LLMConfig
+from app.domain.models.memory import estimate_message_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class LLMPriority(IntEnum):
+    """LLM请求优先级 数值越小越优先"""
+    INTERACTIVE = 0  # 交互请求 例如规划/执行步骤
+    BACKGROUND = 1  # 后台请求 例如记忆摘要
+
+
+class TokenBucket:
+    """令牌桶 capacity为桶容量，按照每分钟capacity个令牌的速度匀速恢复"""
+
+    def __init__(self, capacity: int) -> None:
+        self._capacity = float(capacity)
+        self._rate = capacity / 60.0  # 每秒恢复的令牌数
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+
+    @property
+    def capacity(self) -> int:
+        """只读属性 返回桶容量(每分钟的令牌数)"""
+        return int(self._capacity)
+
+    def _refill(self) -> None:
+        """根据距离上次更新的时间恢复令牌"""
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """计算桶内令牌数达到amount需要等待的秒数 超过桶容量的请求按照桶容量计算避免永远等待"""
+        self._refill()
+        amount = min(amount, self._capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / self._rate
+
+    def consume(self, amount: float) -> None:
+        """扣减令牌 允许透支 透支的部分会推迟后续请求"""
+        self._refill()
+        self._tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        """归还多扣减的令牌"""
+        self._refill()
+        self._tokens = min(self._capacity, self._tokens + amount)
+
+
+class _Waiter:
+    """排队中的请求"""
+    __slots__ = ("session_id", "priority", "tokens", "future", "enqueued_at")
+
+    def __init__(self, session_id: str, priority: LLMPriority, tokens: int) -> None:
+        self.session_id = session_id
+        self.priority = priority
+        self.tokens = tokens
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class LLMSlot:
+    """调度器分配的请求槽位 调用方在请求结束后可以写入usage用于校正TPM"""
+
+    def __init__(self, tokens: int) -> None:
+        self.tokens = tokens  # 请求发起前预扣的token数
+        self.usage: Optional[Dict[str, Any]] = None  # 请求的真实用量
+
+
+class LLMScheduler:
+    """单个模型的LLM请求调度器 令牌桶限流+优先级+会话间公平排队"""
+
+    def __init__(
+            self,
+            model_name: str,
+            requests_per_minute: Optional[int] = None,
+            tokens_per_minute: Optional[int] = None,
+            max_concurrency: int = 8,
+    ) -> None:
+        """构造函数 传递模型名+每分钟请求数+每分钟token数+最大并发请求数，限额为空表示不限制"""
+        self._model_name = model_name
+        self._max_concurrency = max_concurrency
+        self._rpm: Optional[TokenBucket] = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tpm: Optional[TokenBucket] = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._queues: Dict[LLMPriority, OrderedDict[str, Deque[_Waiter]]] = {
+            priority: OrderedDict() for priority in LLMPriority
+        }  # 优先级 -> 会话ID -> 排队中的请求
+        self._in_flight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._dispatched = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @property
+    def model_name(self) -> str:
+        """只读属性 返回调度器对应的模型名"""
+        return self._model_name
+
+    def configure(
+            self,
+            requests_per_minute: Optional[int] = None,
+            tokens_per_minute: Optional[int] = None,
+            max_concurrency: int = 8,
+    ) -> None:
+        """更新调度器的限额 容量没有变化的令牌桶保持不变，调大限额时立即放行排队中的请求"""
+        if (self._rpm.capacity if self._rpm else None) != requests_per_minute:
+            self._rpm = TokenBucket(requests_per_minute) if requests_per_minute else None
+        if (self._tpm.capacity if self._tpm else None) != tokens_per_minute:
+            self._tpm = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._max_concurrency = max_concurrency
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._dispatch()
+
+    def queue_depth(self, priority: Optional[LLMPriority] = None) -> int:
+        """返回排队中的请求数 不传递优先级时返回所有优先级的总数"""
+        priorities = [priority] if priority is not None else list(LLMPriority)
+        return sum(
+            sum(1 for waiter in waiters if not waiter.future.done())
+            for p in priorities
+            for waiters in self._queues[p].values()
+        )
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """只读属性 返回调度器的队列指标"""
+        return {
+            "model_name": self._model_name,
+            "queue_depth": self.queue_depth(),
+            "queue_depth_by_priority": {p.name.lower(): self.queue_depth(p) for p in LLMPriority},
+            "queued_sessions": sum(len(queue) for queue in self._queues.values()),
+            "in_flight": self._in_flight,
+            "dispatched": self._dispatched,
+            "avg_wait": self._total_wait / self._dispatched if self._dispatched else 0.0,
+            "max_wait": self._max_wait,
+        }
+
+    def _peek(self) -> Optional[_Waiter]:
+        """按照优先级+会话轮询的顺序取出下一个需要调度的请求 已取消的请求会被清理"""
+        for priority in LLMPriority:
+            queue = self._queues[priority]
+            while queue:
+                session_id, waiters = next(iter(queue.items()))
+                while waiters and waiters[0].future.done():
+                    waiters.popleft()
+                if waiters:
+                    return waiters[0]
+                del queue[session_id]
+        return None
+
+    def _pop(self, waiter: _Waiter) -> None:
+        """将请求从队列中移除 并把该会话移动到队尾实现会话间轮询"""
+        queue = self._queues[waiter.priority]
+        waiters = queue[waiter.session_id]
+        waiters.popleft()
+        if waiters:
+            queue.move_to_end(waiter.session_id)
+        else:
+            del queue[waiter.session_id]
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """在并发和令牌允许的范围内依次放行排队中的请求"""
+        while self._in_flight < self._max_concurrency:
+            waiter = self._peek()
+            if waiter is None:
+                return
+
+            # 令牌不足时在令牌恢复的时间点重新调度 保证高优先级请求不会被低优先级请求插队
+            wait = max(
+                self._rpm.time_until(1) if self._rpm else 0.0,
+                self._tpm.time_until(waiter.tokens) if self._tpm else 0.0,
+            )
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                return
+
+            self._pop(waiter)
+            if self._rpm:
+                self._rpm.consume(1)
+            if self._tpm:
+                self._tpm.consume(waiter.tokens)
+            self._in_flight += 1
+
+            waited = time.monotonic() - waiter.enqueued_at
+            self._dispatched += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            waiter.future.set_result(None)
+
+    def _release(self, slot: LLMSlot) -> None:
+        """请求结束后释放并发名额 并根据真实用量校正TPM令牌桶"""
+        self._in_flight -= 1
+        if self._tpm and slot.usage:
+            actual = (slot.usage.get("prompt_tokens") or 0) + (slot.usage.get("completion_tokens") or 0)
+            if actual > slot.tokens:
+                self._tpm.consume(actual - slot.tokens)
+            elif actual:
+                self._tpm.refund(slot.tokens - actual)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+            self,
+            session_id: str = "",
+            priority: LLMPriority = LLMPriority.INTERACTIVE,
+            tokens: int = 0,
+    ) -> AsyncGenerator[LLMSlot, None]:
+        """排队获取一个请求槽位 在上下文内发起LLM请求，tokens为预估的token数"""
+        waiter = _Waiter(session_id, priority, tokens)
+        self._queues[priority].setdefault(session_id, deque()).append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            # 等待期间被取消 如果恰好已经被放行则需要归还名额
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(LLMSlot(tokens))
+            else:
+                waiter.future.cancel()
+                self._dispatch()
+            raise
+
+        slot = LLMSlot(tokens)
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+
+class ScheduledLLM(LLM):
+    """经过调度器排队的LLM包装类 绑定会话ID和请求优先级"""
+
+    def __init__(
+            self,
+            llm: LLM,
+            scheduler: LLMScheduler,
+            session_id: str = "",
+            priority: LLMPriority = LLMPriority.INTERACTIVE,
+    ) -> None:
+        """构造函数 传递被包装的LLM+调度器+会话ID+请求优先级"""
+        self._llm = llm
+        self._scheduler = scheduler
+        self._session_id = session_id
+        self._priority = priority
+
+    @property
+    def model_name(self) -> str:
+        """返回所使用的语言模型名称"""
+        return self._llm.model_name
+
+    @property
+    def temperature(self) -> float:
+        """返回当前语言模型的温度设置"""
+        return self._llm.temperature
+
+    @property
+    def max_tokens(self) -> int:
+        """返回当前语言模型的最大令牌数设置"""
+        return self._llm.max_tokens
+
+    @classmethod
+    def _estimate_tokens(cls, message: List[Dict[str, Any]], tools: List[Dict[str, Any]] = None) -> int:
+        """估算本次请求的输入token数"""
+        tokens = sum(estimate_message_tokens(item) for item in message)
+        if tools:
+            tokens += sum(estimate_message_tokens({"content": tool}) for tool in tools)
+        return tokens
+
+    async def invoke(self,
+                     message: List[Dict[str, Any]],
+                     tools: List[Dict[str, Any]] = None,
+                     response_format: Dict[str, Any] = None,
+                     tool_choice: str = None,
+                     parallel_tool_calls: bool = False,
+                     ) -> Dict[str, Any]:
+        """排队获取槽位后调用被包装的LLM"""
+        tokens = self._estimate_tokens(message, tools)
+        async with self._scheduler.slot(self._session_id, self._priority, tokens) as slot:
+            response = await self._llm.invoke(message, tools, response_format, tool_choice, parallel_tool_calls)
+            slot.usage = response.get("usage")
+            return response
+
+    async def invoke_stream(self,
+                            message: List[Dict[str, Any]],
+                            tools: List[Dict[str, Any]] = None,
+                            response_format: Dict[str, Any] = None,
+                            tool_choice: str = None,
+                            parallel_tool_calls: bool = False,
+                            ) -> AsyncGenerator[Dict[str, Any], None]:
+        """排队获取槽位后透传被包装LLM的流式响应 槽位在流结束后才释放"""
+        tokens = self._estimate_tokens(message, tools)
+        async with self._scheduler.slot(self._session_id, self._priority, tokens) as slot:
+            async for chunk in self._llm.invoke_stream(
+                    message, tools, response_format, tool_choice, parallel_tool_calls,
+            ):
+                if chunk["type"] == "message":
+                    slot.usage = chunk["message"].get("usage")
+                yield chunk
+
+
+_schedulers: Dict[str, LLMScheduler] = {}
+
+
+def get_llm_scheduler(
+        model_name: str,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_concurrency: int = 8,
+) -> LLMScheduler:
+    """获取进程内共享的模型调度器 同一个模型只会创建一个调度器，限额以第一次创建时的配置为准"""
+    if model_name not in _schedulers:
+        _schedulers[model_name] = LLMScheduler(model_name, requests_per_minute, tokens_per_minute, max_concurrency)
+    return _schedulers[model_name]
+
+
+def get_llm_scheduler_by_config(llm_config: LLMConfig) -> LLMScheduler:
+    """根据LLM配置获取进程内共享的模型调度器 并应用配置中的RPM/TPM/并发限额，配置修改后立即生效"""
+    scheduler = get_llm_scheduler(llm_config.model_name)
+    scheduler.configure(
+        requests_per_minute=llm_config.requests_per_minute,
+        tokens_per_minute=llm_config.tokens_per_minute,
+        max_concurrency=llm_config.max_concurrency,
+    )
+    return scheduler
@@ -0,0 +1,59 @@
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+
+from filelock import FileLock
+
+from app.domain.external.mcp_tool_cache import McpToolCache
+
+logger = logging.getLogger(__name__)
+
+
+class FileMcpToolCache(McpToolCache):
+    """基于本地json文件的MCP工具声明缓存 不依赖Redis，适合单机部署"""
+
+    def __init__(self, cache_path: str = "./config/mcp_tools_cache.json") -> None:
+        """构造函数 传递缓存文件的路径(相对于项目根目录)"""
+        self._cache_path = Path.cwd().joinpath(cache_path)
+        self._cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_file = self._cache_path.with_suffix(".lock")
+
+    def _load(self) -> Dict[str, Any]:
+        """读取缓存文件 文件不存在或者内容损坏时返回空字典"""
+        if not self._cache_path.exists():
+            return {}
+        try:
+            with open(self._cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取MCP工具缓存文件失败：{str(e)}")
+            return {}
+
+    def _get(self, server_name: str, fingerprint: str) -> Optional[List[Dict[str, Any]]]:
+        """加锁读取服务的工具声明"""
+        with FileLock(self._lock_file, timeout=5):
+            item = self._load().get(server_name)
+        if not item or item.get("fingerprint") != fingerprint:
+            return None
+        return item.get("tools")
+
+    def _set(self, server_name: str, fingerprint: str, tools: List[Dict[str, Any]]) -> None:
+        """加锁写入服务的工具声明 先写临时文件再替换，避免写入中断导致缓存文件损坏"""
+        with FileLock(self._lock_file, timeout=5):
+            data = self._load()
+            data[server_name] = {"fingerprint": fingerprint, "tools": tools}
+            tmp_path = self._cache_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self._cache_path)
+
+    async def get(self, server_name: str, fingerprint: str) -> Optional[List[Dict[str, Any]]]:
+        """读取服务的工具声明 文件读写在线程中执行"""
+        return await asyncio.to_thread(self._get, server_name, fingerprint)
+
+    async def set(self, server_name: str, fingerprint: str, tools: List[Dict[str, Any]]) -> None:
+        """写入服务的工具声明 同一个服务只保留最新指纹的缓存"""
+        await asyncio.to_thread(self._set, server_name, fingerprint, tools)
@@ -0,0 +1,55 @@
+import json
+import logging
+from typing import Optional, List, Dict, Any
+
+from app.domain.external.mcp_tool_cache import McpToolCache
+from app.infra.storage.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class RedisMcpToolCache(McpToolCache):
+    """基于Redis的MCP工具声明缓存 每个服务一个键，多个进程共享同一份缓存，Redis不可用时使用备用缓存"""
+
+    def __init__(
+            self,
+            key_prefix: str = "mcp_tools:",
+            ttl: int = 7 * 24 * 3600,
+            fallback: Optional[McpToolCache] = None,  # 备用缓存 同步写入，Redis不可用时从备用缓存读取
+    ) -> None:
+        """构造函数 传递Redis键前缀+过期秒数+备用缓存"""
+        self._redis_client = get_redis()
+        self._key_prefix = key_prefix
+        self._ttl = ttl
+        self._fallback = fallback
+
+    async def get(self, server_name: str, fingerprint: str) -> Optional[List[Dict[str, Any]]]:
+        """读取服务的工具声明 连接配置指纹不一致说明配置已经修改，缓存失效"""
+        try:
+            data = await self._redis_client.client.get(f"{self._key_prefix}{server_name}")
+        except Exception as e:
+            if self._fallback is None:
+                raise
+            logger.warning(f"从Redis读取MCP服务{server_name}的工具缓存失败，使用备用缓存：{str(e)}")
+            return await self._fallback.get(server_name, fingerprint)
+        if not data:
+            return None
+        item = json.loads(data)
+        if item.get("fingerprint") != fingerprint:
+            return None
+        return item.get("tools")
+
+    async def set(self, server_name: str, fingerprint: str, tools: List[Dict[str, Any]]) -> None:
+        """写入服务的工具声明 同一个服务只保留最新指纹的缓存，配置了备用缓存时同步写入"""
+        if self._fallback is not None:
+            await self._fallback.set(server_name, fingerprint, tools)
+        try:
+            await self._redis_client.client.set(
+                f"{self._key_prefix}{server_name}",
+                json.dumps({"fingerprint": fingerprint, "tools": tools}, ensure_ascii=False),
+                ex=self._ttl,
+            )
+        except Exception:
+            if self._fallback is None:
+                raise
+            logger.warning(f"向Redis写入MCP服务{server_name}的工具缓存失败，仅写入备用缓存")
@@ -2,7 +2,7 @@ import asyncio
 import json
 import logging
 import uuid
-from typing import Tuple, Any, Optional
+from typing import Tuple, Any, Optional, List
 
 from app.domain.external.message_queue import MessageQueue
 from app.infra.storage.redis import get_redis
@@ -24,6 +24,16 @@ class RedisStreamMessageQueue(MessageQueue):
         logger.info(f"Putting message: {message}")
         return await self._redis_client.client.xadd(self._stream_name, {"data": message})
 
+    async def put_batch(self, messages: List[Any]) -> List[str]:
+        """使用非事务的pipeline将一批消息按顺序放入队列 一次往返完成所有XADD"""
+        if not messages:
+            return []
+        logger.debug(f"Putting {len(messages)} messages to stream: {self._stream_name}")
+        async with self._redis_client.client.pipeline(transaction=False) as pipe:
+            for message in messages:
+                pipe.xadd(self._stream_name, {"data": message})
+            return await pipe.execute()
+
     async def pop(self) -> Tuple[str, Any]:
         """从队列中弹出一条消息并返回消息ID和消息内容"""
         logger.info(f"从消息队列弹出消息: {self._stream_name}")
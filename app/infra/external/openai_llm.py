@@ -1,12 +1,20 @@
 import asyncio
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncGenerator, Optional
 
-from openai import AsyncOpenAI
+import httpx
+from openai import AsyncOpenAI, APIStatusError, APITimeoutError, APIConnectionError
 from openai.types.chat import ChatCompletionMessage
 from pydantic import HttpUrl
 
-from app.domain.external.llm import LLM
+from app.domain.external.llm import (
+    LLM,
+    LLMError,
+    LLMRateLimitError,
+    LLMTimeoutError,
+    LLMServerError,
+    LLMInvalidRequestError,
+)
 from app.domain.models.app_config import LLMConfig
 
 logger = logging.getLogger(__name__)
@@ -17,10 +25,11 @@ class OpenAiLLM(LLM):
 
     def __init__(self, llm_config: LLMConfig) -> None:
         """构造函数，完成异步的openai客户端的创建和参数的初始化"""
-        # 1.初始化异步客户端
+        # 1.初始化异步客户端 关闭SDK内置的重试 由Agent的重试策略统一控制退避
         self._client = AsyncOpenAI(
             base_url=str(llm_config.base_url),
             api_key=llm_config.api_key,
+            max_retries=0,
         )
 
         # 2,完成其他参数的存储
@@ -45,43 +54,156 @@ class OpenAiLLM(LLM):
         ...
         return self._max_tokens
 
+    @classmethod
+    def _get_retry_after(cls, response: Optional[httpx.Response]) -> Optional[float]:
+        """从响应头中解析服务端建议的重试等待秒数 兼容retry-after-ms和retry-after(秒)"""
+        if response is None:
+            return None
+        try:
+            retry_after_ms = response.headers.get("retry-after-ms")
+            if retry_after_ms:
+                return float(retry_after_ms) / 1000
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                return float(retry_after)
+        except ValueError:
+            pass
+        return None
+
+    @classmethod
+    def _convert_error(cls, error: Exception) -> LLMError:
+        """将openai的异常转换为领域层的LLM错误类型"""
+        if isinstance(error, APITimeoutError):
+            return LLMTimeoutError(f"OpenAI语言模型调用超时: {error}")
+        if isinstance(error, APIConnectionError):
+            return LLMTimeoutError(f"OpenAI语言模型连接失败: {error}")
+        if isinstance(error, APIStatusError):
+            retry_after = cls._get_retry_after(error.response)
+            if error.status_code == 429:
+                return LLMRateLimitError(f"OpenAI语言模型触发限流: {error}", retry_after)
+            if error.status_code >= 500 or error.status_code in (408, 409):
+                return LLMServerError(f"OpenAI语言模型服务异常: {error}", retry_after)
+            return LLMInvalidRequestError(f"OpenAI语言模型请求有误: {error}")
+        return LLMError(f"OpenAI语言模型调用失败: {error}")
+
+    def _build_params(self,
+                      message: List[Dict[str, Any]],
+                      tools: List[Dict[str, Any]] = None,
+                      response_format: Dict[str, Any] = None,
+                      tool_choice: str = None,
+                      parallel_tool_calls: bool = False,
+                      ) -> Dict[str, Any]:
+        """根据传递的消息、工具等信息组装chat.completions.create的请求参数"""
+        params = {
+            "model": self._model_name,
+            "messages": message,
+            "temperature": self._temperature,
+            "max_tokens": self._max_tokens,
+            "response_format": response_format,
+            "timeout": self._timeout,
+        }
+
+        # 检测是否传递了工具列表 只有传递了工具才需要携带工具相关的参数
+        if tools:
+            params["tools"] = tools
+            params["tool_choice"] = tool_choice
+            params["parallel_tool_calls"] = parallel_tool_calls
+
+        return params
+
     async def invoke(self,
                      message: List[Dict[str, Any]],
                      tools: List[Dict[str, Any]] = None,
                      response_format: Dict[str, Any] = None,
-                     tool_choice: str = None
+                     tool_choice: str = None,
+                     parallel_tool_calls: bool = False,
                      ) -> Dict[str, Any]:
-        """使用异步openapi客户端发起块响应（该步骤可以改成流式响应）"""
+        """使用异步openapi客户端发起块响应"""
         try:
-            # 检测是否传递了工具列表
-            if tools:
-                response = await self._client.chat.completions.create(
-                    model=self._model_name,
-                    messages=message,
-                    temperature=self._temperature,
-                    response_format=response_format,
-                    tools=tools,
-                    tool_choice=tool_choice,
-                    parallel_tool_calls=False,
-                    max_tokens=self._max_tokens,
-                    timeout=self._timeout,
-                )
-            else:
-                response = await self._client.chat.completions.create(
-                    model=self._model_name,
-                    temperature=self._temperature,
-                    max_tokens=self._max_tokens,
-                    messages=message,
-                    response_format=response_format,
-                    timeout=self._timeout,
-                )
+            response = await self._client.chat.completions.create(
+                **self._build_params(message, tools, response_format, tool_choice, parallel_tool_calls)
+            )
 
             # 处理响应并返回结果
             logger.info(f"OpenAI语言模型调用成功: {response.model_dump(mode='json')}")
-            return response.choices[0].message.model_dump()
+            message = response.choices[0].message.model_dump()
+            if response.usage:
+                message["usage"] = response.usage.model_dump()
+            return message
         except Exception as e:
             logger.error(f"OpenAI语言模型调用失败: {e}")
-            raise RuntimeError("OpenAI语言模型调用失败")
+            raise self._convert_error(e) from e
+
+    async def invoke_stream(self,
+                            message: List[Dict[str, Any]],
+                            tools: List[Dict[str, Any]] = None,
+                            response_format: Dict[str, Any] = None,
+                            tool_choice: str = None,
+                            parallel_tool_calls: bool = False,
+                            ) -> AsyncGenerator[Dict[str, Any], None]:
+        """使用异步openapi客户端发起流式响应 边生成边返回文本/工具参数增量 并在结束时返回组装好的完整消息"""
+        try:
+            stream = await self._client.chat.completions.create(
+                **self._build_params(message, tools, response_format, tool_choice, parallel_tool_calls),
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+
+            # 定义变量存储增量的文本内容、按索引组装的工具调用以及最后一个片段携带的usage
+            content_parts: List[str] = []
+            tool_calls: Dict[int, Dict[str, Any]] = {}
+            usage = None
+
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage.model_dump()
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+
+                # 文本增量直接返回给调用方
+                if delta.content:
+                    content_parts.append(delta.content)
+                    yield {"type": "content", "content": delta.content}
+
+                # 工具调用的id/名字/参数会被拆分到多个片段中 需要按照index拼接
+                for tool_call_delta in delta.tool_calls or []:
+                    tool_call = tool_calls.setdefault(tool_call_delta.index, {
+                        "id": "",
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""},
+                    })
+                    if tool_call_delta.id:
+                        tool_call["id"] = tool_call_delta.id
+                    if tool_call_delta.function:
+                        tool_call["function"]["name"] += tool_call_delta.function.name or ""
+                        tool_call["function"]["arguments"] += tool_call_delta.function.arguments or ""
+
+                    # 参数增量同样实时返回 调用方可以边生成边解析工具参数
+                    arguments_delta = tool_call_delta.function.arguments if tool_call_delta.function else None
+                    if arguments_delta:
+                        yield {
+                            "type": "tool_call",
+                            "index": tool_call_delta.index,
+                            "id": tool_call["id"],
+                            "name": tool_call["function"]["name"],
+                            "arguments_delta": arguments_delta,
+                        }
+
+            # 组装完整的消息 结构和invoke的返回值保持一致
+            logger.info(f"OpenAI语言模型流式调用成功，共生成{len(tool_calls)}个工具调用")
+            yield {
+                "type": "message",
+                "message": {
+                    "role": "assistant",
+                    "content": "".join(content_parts) if content_parts else None,
+                    "tool_calls": [tool_calls[idx] for idx in sorted(tool_calls)] if tool_calls else None,
+                    "usage": usage,
+                },
+            }
+        except Exception as e:
+            logger.error(f"OpenAI语言模型流式调用失败: {e}")
+            raise self._convert_error(e) from e
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 from .base import Base
+from .checkpoint import AgentCheckpointModel
 from .demo import Demo
 
-__all__ = ["Base", "Demo"]
+__all__ = ["Base", "AgentCheckpointModel", "Demo"]
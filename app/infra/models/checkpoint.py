@@ -0,0 +1,31 @@
+import uuid
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import PrimaryKeyConstraint, UUID, String, Integer, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.expression import text
+
+from app.infra.models.base import Base
+
+
+class AgentCheckpointModel(Base):
+    """Agent检查点模型 每一行记录一个Agent的一次增量状态"""
+    __tablename__ = "agent_checkpoints"
+    __table_args__ = (
+        PrimaryKeyConstraint("id", name="pk_agent_checkpoints_id"),
+        Index("idx_agent_checkpoints_session_agent_seq", "session_id", "agent_name", "seq", unique=True),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID, nullable=False, primary_key=True,
+                                          server_default=text("uuid_generate_v4()"))
+    session_id: Mapped[str] = mapped_column(String(255), nullable=False)
+    agent_name: Mapped[str] = mapped_column(String(255), nullable=False)
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    message_offset: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    messages: Mapped[List[Dict[str, Any]]] = mapped_column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
+    plan: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)
+    created_at = mapped_column(
+        DateTime,
+        nullable=False,
+        server_default=text("CURRENT_TIMESTAMP(0)"))
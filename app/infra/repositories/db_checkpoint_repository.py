@@ -0,0 +1,64 @@
+import logging
+import uuid
+from typing import List
+
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from app.domain.models.checkpoint import Checkpoint
+from app.domain.models.plan import Plan
+from app.domain.repositories.checkpoint_repository import CheckpointRepository
+from app.infra.models.checkpoint import AgentCheckpointModel
+
+logger = logging.getLogger(__name__)
+
+
+class DBCheckpointRepository(CheckpointRepository):
+    """基于Postgres数据库存储的Agent检查点仓库"""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        """构造函数 传递数据库会话工厂 一般通过get_postgres().session_factory获取"""
+        self._session_factory = session_factory
+
+    async def save(self, checkpoint: Checkpoint) -> None:
+        """保存一个检查点"""
+        async with self._session_factory() as session:
+            session.add(AgentCheckpointModel(
+                id=uuid.UUID(checkpoint.id),
+                session_id=checkpoint.session_id,
+                agent_name=checkpoint.agent_name,
+                seq=checkpoint.seq,
+                message_offset=checkpoint.message_offset,
+                messages=checkpoint.messages,
+                plan=checkpoint.plan.model_dump(mode="json") if checkpoint.plan else None,
+                created_at=checkpoint.created_at,
+            ))
+            await session.commit()
+
+    async def list_by_session(self, session_id: str, agent_name: str) -> List[Checkpoint]:
+        """按照序号升序获取会话中某个Agent的所有检查点"""
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(AgentCheckpointModel)
+                .where(AgentCheckpointModel.session_id == session_id, AgentCheckpointModel.agent_name == agent_name)
+                .order_by(AgentCheckpointModel.seq)
+            )
+            return [
+                Checkpoint(
+                    id=str(record.id),
+                    session_id=record.session_id,
+                    agent_name=record.agent_name,
+                    seq=record.seq,
+                    message_offset=record.message_offset,
+                    messages=record.messages,
+                    plan=Plan.model_validate(record.plan) if record.plan else None,
+                    created_at=record.created_at,
+                )
+                for record in result.scalars().all()
+            ]
+
+    async def delete_by_session(self, session_id: str) -> None:
+        """删除会话的所有检查点"""
+        async with self._session_factory() as session:
+            await session.execute(delete(AgentCheckpointModel).where(AgentCheckpointModel.session_id == session_id))
+            await session.commit()
@@ -4,6 +4,9 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
+from app.domain.services.tools.mcp_pool import get_mcp_session_pool
+from app.infra.external.mcp_tool_cache.file_mcp_tool_cache import FileMcpToolCache
+from app.infra.external.mcp_tool_cache.redis_mcp_tool_cache import RedisMcpToolCache
 from app.infra.logging import setup_logging
 from app.infra.storage.cos import get_cos
 from app.infra.storage.postgres import get_postgres
@@ -37,6 +40,9 @@ async def lifespan(app: FastAPI):
     redis = get_redis()
     await redis.init()
 
+    # 使用redis持久化MCP工具声明 启动时无需等待所有MCP服务完成握手，redis不可用时使用本地文件缓存
+    get_mcp_session_pool().set_tool_cache(RedisMcpToolCache(fallback=FileMcpToolCache()))
+
     # 初始化postgres客户端
     postgres = get_postgres()
     await postgres.init()
@@ -49,6 +55,8 @@ async def lifespan(app: FastAPI):
         # lifespan节点/分界
         yield
     finally:
+        # 关闭MCP会话池中的所有连接
+        await get_mcp_session_pool().close()
         # 关闭redis缓存客户端
         await redis.shutdown()
         # 关闭postgres客户端